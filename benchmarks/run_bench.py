@@ -0,0 +1,332 @@
+############################################################
+# Exporter benchmarks
+#
+# - builds synthetic scenes at several scales (see scenes.py) and times
+#   the exporter's hot paths: mesh blocks, tangents, skin weights/clusters
+#   and the takes section
+# - runs on a plain python with the bpy/mathutils stand-in in ./standin, or
+#   inside blender (2.70 - 2.73):
+#     python benchmarks/run_bench.py --scale small,medium
+#     blender -b --factory-startup --python benchmarks/run_bench.py -- --scale small
+# - results are written to benchmarks/results/<label>.json, compare two runs:
+#     python benchmarks/run_bench.py --compare results/before.json results/after.json
+#
+
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import contextlib
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+
+try:
+	import bpy
+	backend = "blender %s" % bpy.app.version_string
+except ImportError:
+	sys.path.insert(0, os.path.join(HERE, "standin"))
+	import bpy
+	backend = "standin"
+
+# the exporter still calls time.clock (removed in python 3.8)
+if not hasattr(time, "clock"):
+	time.clock = time.perf_counter
+
+# import the addon from this checkout without registering it
+if "udk_fbx_tools" not in sys.modules:
+	package = types.ModuleType("udk_fbx_tools")
+	package.__path__ = [os.path.join(REPO, "udk_fbx_tools")]
+	sys.modules["udk_fbx_tools"] = package
+
+import numpy as np
+from mathutils import Matrix, Vector
+from bpy_extras.io_utils import axis_conversion
+
+sys.path.insert(0, HERE)
+import scenes
+
+export_fbx = importlib.import_module("udk_fbx_tools.export_fbx")
+cust_tangents = importlib.import_module("udk_fbx_tools.cust_tangents")
+export_profiler = importlib.import_module("udk_fbx_tools.export_profiler")
+export_mesh_data = importlib.import_module("udk_fbx_tools.export_mesh_data")
+
+
+# scene sizes per scale, mesh loops for the skin suite are kept lower so
+# the per vertex weight lists fit in memory at 1000 bones
+scales = {
+	"small": dict(loops=1024, skin_loops=1024, bones=10, frames=25, instances=100),
+	"medium": dict(loops=16384, skin_loops=16384, bones=100, frames=50, instances=1000),
+	"large": dict(loops=262144, skin_loops=65536, bones=500, frames=100, instances=5000),
+	"huge": dict(loops=1048576, skin_loops=262144, bones=1000, frames=250, instances=20000),
+}
+scale_order = ("small", "medium", "large", "huge")
+
+suite_order = ("mesh", "skin", "anim", "instances")
+
+results_dir = os.path.join(HERE, "results")
+
+
+class bench_operator(object):
+	'''	stands in for the export operator, collects reports '''
+
+	def __init__(self):
+		self.reports = []
+
+	def report(self, type, message):
+		self.reports.append((sorted(type), message))
+
+
+def best_time(func, repeat):
+	'''	fastest of repeat calls and the last result '''
+	best = None
+	result = None
+	for i in range(repeat):
+		t = time.perf_counter()
+		result = func()
+		t = time.perf_counter() - t
+		if best is None or t < best:
+			best = t
+	return best, result
+
+
+def export_timings(scene, options, repeat, outdir):
+	'''	exports the scene repeat times with the profiler on
+		- returns the fastest total and the fastest time of each phase
+	'''
+	filepath = os.path.join(outdir, "bench.fbx")
+	kwargs = dict(
+		global_matrix=axis_conversion(to_forward='-Z', to_up='Y').to_4x4() * Matrix.Scale(1.0, 4),
+		context_objects=list(scene.objects),
+		object_types={'ARMATURE', 'MESH'},
+		use_profile=True,
+	)
+	kwargs.update(options)
+
+	times = {}
+	counts = {}
+	for i in range(repeat):
+		with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+			export_fbx.save_single(bench_operator(), scene, filepath, **kwargs)
+		with open(export_profiler.profile_path(filepath)) as f:
+			report = json.load(f)
+		values = dict((phase["name"], phase["time"]) for phase in report["phases"])
+		values["export"] = report["total"]
+		for name, value in values.items():
+			times[name] = min(value, times.get(name, value))
+		counts = report["counts"]
+
+	times["file_size"] = os.path.getsize(filepath)
+	return times, counts
+
+
+def mesh_objects(scene):
+	return [ob for ob in scene.objects if ob.type == 'MESH']
+
+
+#########################################
+# suites
+
+def bench_mesh(scale, repeat, options, outdir):
+	'''	mesh blocks + normals, lengyel tangents '''
+	size = scales[scale]
+	scene = scenes.make_scene(loops=size["loops"], uv_layers=2, color_layers=1, materials=3,
+							  flat_ratio=5, name="mesh_" + scale)
+	ob = mesh_objects(scene)[0]
+	me = ob.data
+	me.update(calc_tessface=True)
+
+	opts = dict(export_tangentspace_base='LENGYEL', tangentspace_uvlnum=0)
+	opts.update(options)
+	times, counts = export_timings(scene, opts, repeat, outdir)
+
+	# tangents on their own, with the normals the exporter passes in
+	data = export_mesh_data.mesh_arrays(me)
+	normals = export_fbx.get_mesh_shading(bench_operator(), me, ob, data, False, 'BLEND', 'NONE', 0)[0]
+	normals = [Vector(n) for n in normals.tolist()]
+	uvlayer = [uvl for uvl in me.tessface_uv_textures[0].data]
+	times["build_initialtanlists"] = best_time(
+		lambda: cust_tangents.build_initialtanlists(me.tessfaces, me.vertices, uvlayer, normals), repeat)[0]
+
+	times["mesh_arrays"] = best_time(lambda: export_mesh_data.mesh_arrays(me), repeat)[0]
+
+	info = dict(loops=len(me.loops), vertices=len(me.vertices), tessfaces=len(me.tessfaces))
+	return times, info
+
+
+def bench_skin(scale, repeat, options, outdir):
+	'''	weight lists and skin clusters of one mesh '''
+	size = scales[scale]
+	scene = scenes.make_scene(loops=size["skin_loops"], bones=size["bones"], name="skin_" + scale)
+	ob = mesh_objects(scene)[0]
+	me = ob.data
+
+	times, counts = export_timings(scene, options, repeat, outdir)
+	times["BPyMesh_meshWeight2List"] = best_time(
+		lambda: export_fbx.BPyMesh_meshWeight2List(ob, me), repeat)[0]
+	times["meshNormalizedWeights"] = best_time(
+		lambda: export_fbx.meshNormalizedWeights(ob, me), repeat)[0]
+
+	info = dict(loops=len(me.loops), vertices=len(me.vertices), bones=counts.get("bones", 0))
+	return times, info
+
+
+def bench_anim(scale, repeat, options, outdir):
+	'''	takes section: every action sampled over its frame range '''
+	size = scales[scale]
+	scene = scenes.make_scene(loops=1024, bones=size["bones"], actions=2, frames=size["frames"],
+							  name="anim_" + scale)
+
+	opts = dict(use_anim=True, use_anim_action_all=True, use_anim_optimize=True)
+	opts.update(options)
+	times, counts = export_timings(scene, opts, repeat, outdir)
+
+	info = dict(bones=counts.get("bones", 0), frames=size["frames"], actions=2)
+	return times, info
+
+
+def bench_instances(scale, repeat, options, outdir):
+	'''	dupliverts scatter of one mesh, binary files share its Geometry '''
+	size = scales[scale]
+	scene = scenes.make_scene(loops=1024, uv_layers=1, instances=size["instances"],
+							  name="instances_" + scale)
+
+	opts = dict(fbx_format='BIN74')
+	opts.update(options)
+	times, counts = export_timings(scene, opts, repeat, outdir)
+
+	info = dict(instances=size["instances"], meshes=counts.get("meshes", 0))
+	return times, info
+
+
+suites = {
+	"mesh": bench_mesh,
+	"skin": bench_skin,
+	"anim": bench_anim,
+	"instances": bench_instances,
+}
+
+
+#########################################
+# results
+
+def git_revision():
+	try:
+		out = subprocess.check_output(["git", "describe", "--always", "--dirty"],
+									  cwd=REPO, stderr=subprocess.STDOUT)
+	except (OSError, subprocess.CalledProcessError):
+		return ""
+	return out.decode("utf8").strip()
+
+
+def run(args):
+	options = {}
+	if args.format:
+		options["fbx_format"] = args.format
+	if args.workers:
+		options["mesh_workers"] = args.workers
+
+	revision = git_revision()
+	result = {
+		"label": args.label or revision or "results",
+		"revision": revision,
+		"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+		"backend": backend,
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"machine": platform.platform(),
+		"repeat": args.repeat,
+		"options": options,
+		"cases": {},
+	}
+
+	outdir = tempfile.mkdtemp(prefix="udk_fbx_bench_")
+	try:
+		for scale in args.scale:
+			for suite in args.suite:
+				name = "%s/%s" % (suite, scale)
+				print("%-14s" % name, end="")
+				sys.stdout.flush()
+				t = time.perf_counter()
+				times, info = suites[suite](scale, args.repeat, options, outdir)
+				result["cases"][name] = {"info": info, "times": times}
+				print(" %8.2f sec.  export %.4f sec." % (time.perf_counter() - t, times["export"]))
+	finally:
+		shutil.rmtree(outdir, ignore_errors=True)
+
+	os.makedirs(results_dir, exist_ok=True)
+	filepath = args.output or os.path.join(results_dir, result["label"] + ".json")
+	with open(filepath, "w") as f:
+		json.dump(result, f, indent=1, sort_keys=True)
+	print("results written to %s" % filepath)
+	return result
+
+
+def compare(before_path, after_path):
+	'''	prints the timings of two result files side by side '''
+	with open(before_path) as f:
+		before = json.load(f)
+	with open(after_path) as f:
+		after = json.load(f)
+
+	print("%-40s %12s %12s %8s" % ("%s -> %s" % (before["label"], after["label"]), "before", "after", "speedup"))
+	for name in sorted(before["cases"]):
+		if name not in after["cases"]:
+			continue
+		print(name)
+		times_a = before["cases"][name]["times"]
+		times_b = after["cases"][name]["times"]
+		for key in sorted(times_a):
+			if key not in times_b or key == "file_size":
+				continue
+			a = times_a[key]
+			b = times_b[key]
+			ratio = (a / b) if b else 0.0
+			print("  %-38s %12.4f %12.4f %7.2fx" % (key, a, b, ratio))
+
+
+def parse_args(argv):
+	# blender passes its own arguments, ours follow "--"
+	if "--" in argv:
+		argv = argv[argv.index("--") + 1:]
+	else:
+		argv = argv[1:]
+
+	parser = argparse.ArgumentParser(description="udk_fbx_tools exporter benchmarks")
+	parser.add_argument("--scale", default="small,medium",
+						help="comma separated scales: %s" % ", ".join(scale_order))
+	parser.add_argument("--suite", default=",".join(suite_order),
+						help="comma separated suites: %s" % ", ".join(suite_order))
+	parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest is kept")
+	parser.add_argument("--format", choices=("ASCII61", "BIN74"), help="fbx_format export option")
+	parser.add_argument("--workers", type=int, help="mesh_workers export option")
+	parser.add_argument("--label", help="results name, defaults to the git revision")
+	parser.add_argument("--output", help="results file, defaults to results/<label>.json")
+	parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+						help="compare two results files instead of running")
+	args = parser.parse_args(argv)
+
+	args.scale = [s for s in args.scale.split(",") if s]
+	args.suite = [s for s in args.suite.split(",") if s]
+	for scale in args.scale:
+		if scale not in scales:
+			parser.error("unknown scale %r" % scale)
+	for suite in args.suite:
+		if suite not in suites:
+			parser.error("unknown suite %r" % suite)
+	return args
+
+
+if __name__ == "__main__":
+	args = parse_args(sys.argv)
+	if args.compare:
+		compare(*args.compare)
+	else:
+		run(args)
@@ -0,0 +1,275 @@
+############################################################
+# Synthetic scenes for the exporter benchmarks
+#
+# - grid meshes with uv/color layers, materials and shape keys
+# - bone chains with skin weights and baked quaternion actions
+# - only uses the bpy api, so scenes build the same way in the stand-in
+#   and in blender -b
+# - everything is deterministic, exported files can be compared byte for byte
+#
+
+import math
+
+import numpy as np
+
+import bpy
+from mathutils import Matrix
+
+
+def _grid(nx, ny, size=2.0, height=0.15):
+	verts = []
+	for j in range(ny + 1):
+		for i in range(nx + 1):
+			x = size * (i / nx - 0.5)
+			y = size * (j / ny - 0.5)
+			z = height * math.sin(x * 3.1) * math.cos(y * 2.3)
+			verts.append((x, y, z))
+	polys = []
+	for j in range(ny):
+		for i in range(nx):
+			a = j * (nx + 1) + i
+			polys.append((a, a + 1, a + nx + 2, a + nx + 1))
+	return verts, polys
+
+
+def _flat(values):
+	return [c for value in values for c in value]
+
+
+def clear_scene():
+	'''	unlinks everything from the current scene and removes unused datablocks '''
+	scene = bpy.context.scene
+	for ob in list(scene.objects):
+		scene.objects.unlink(ob)
+	for collection in (bpy.data.objects, bpy.data.meshes, bpy.data.armatures,
+					   bpy.data.actions, bpy.data.materials, bpy.data.images):
+		for item in list(collection):
+			if not item.users:
+				collection.remove(item)
+	return scene
+
+
+def make_mesh(name, loops=4096, uv_layers=1, color_layers=0, materials=1,
+			  tris=False, ngons=False, flat_ratio=0, images=0):
+	'''	grid mesh with roughly the requested loop count '''
+	nquads = max(1, loops // 4)
+	nx = max(1, int(math.sqrt(nquads)))
+	ny = max(1, nquads // nx)
+	verts, polys = _grid(nx, ny)
+
+	if tris:
+		split = []
+		for k, p in enumerate(polys):
+			if k % 2:
+				split.append((p[0], p[1], p[2]))
+				split.append((p[0], p[2], p[3]))
+			else:
+				split.append(p)
+		polys = split
+	if ngons:
+		# merge every 4th pair of quads in a row into a hexagon
+		merged = []
+		k = 0
+		while k < len(polys):
+			p = polys[k]
+			if k % 4 == 0 and k + 1 < len(polys) and len(p) == 4 and len(polys[k + 1]) == 4 and polys[k + 1][0] == p[1]:
+				q = polys[k + 1]
+				merged.append((p[0], q[0], q[1], q[2], p[2], p[3]))
+				k += 2
+			else:
+				merged.append(p)
+				k += 1
+		polys = merged
+
+	me = bpy.data.meshes.new(name)
+	me.from_pydata(verts, [], polys)
+	me.update(calc_edges=True)
+
+	for k in range(materials):
+		mat = bpy.data.materials.new("%s_mat%d" % (name, k))
+		mat.diffuse_color = (0.2 + 0.1 * k, 0.5, 0.8 - 0.1 * k)
+		me.materials.append(mat)
+	npolys = len(me.polygons)
+	if materials:
+		me.polygons.foreach_set("material_index", [p % materials for p in range(npolys)])
+	if flat_ratio:
+		me.polygons.foreach_set("use_smooth", [p % flat_ratio != 0 for p in range(npolys)])
+	else:
+		me.polygons.foreach_set("use_smooth", [True] * npolys)
+
+	image_list = []
+	for k in range(images):
+		image = bpy.data.images.new("%s_tex%d.png" % (name, k), 16, 16)
+		image.filepath = "//textures/%s_tex%d.png" % (name, k)
+		image_list.append(image)
+
+	loop_verts = [verts[v] for p in polys for v in p]
+	for layer in range(uv_layers):
+		layer_name = "UVMap" if layer == 0 else "UVMap.%03d" % layer
+		tex = me.uv_textures.new(layer_name)
+		me.uv_layers[layer_name].data.foreach_set("uv", _flat(
+			(co[0] * 0.5 + 0.5 + 0.01 * layer, co[1] * 0.5 + 0.5) for co in loop_verts))
+		if image_list:
+			for p, texpoly in enumerate(tex.data):
+				texpoly.image = image_list[p % len(image_list)]
+
+	for layer in range(color_layers):
+		col = me.vertex_colors.new("Col" if layer == 0 else "Col.%03d" % layer)
+		col.data.foreach_set("color", _flat(
+			(abs(co[0]) % 1.0, abs(co[1] + layer * 0.1) % 1.0, (l % 7) / 7.0)
+			for l, co in enumerate(loop_verts)))
+
+	me.update(calc_tessface=True)
+	return me
+
+
+def add_shape_keys(ob, count):
+	'''	morph targets moving every third vertex '''
+	me = ob.data
+	ob.shape_key_add("Basis", from_mix=False)
+	base = [v.co[:] for v in me.vertices]
+	for k in range(count):
+		coords = []
+		for i, co in enumerate(base):
+			if (i + k) % 3 == 0:
+				coords.append((co[0], co[1], co[2] + 0.05 * (k + 1) * math.cos(co[0] * 4.0)))
+			else:
+				coords.append(co)
+		kb = ob.shape_key_add("Key %d" % (k + 1), from_mix=False)
+		kb.data.foreach_set("co", _flat(coords))
+
+
+def make_armature(scene, name, bones=10, branches=1):
+	'''	armature object with bone chains along +Y, each branch starting at the root '''
+	arm = bpy.data.armatures.new(name)
+	arm_ob = bpy.data.objects.new(name, arm)
+	scene.objects.link(arm_ob)
+	scene.objects.active = arm_ob
+
+	bpy.ops.object.mode_set(mode='EDIT')
+	root = arm.edit_bones.new("root")
+	root.head = (0.0, -1.0, 0.0)
+	root.tail = (0.0, -0.9, 0.0)
+	per_branch = max(1, (bones - 1) // max(1, branches))
+	count = 1
+	for b in range(branches):
+		parent = root
+		x = (b - (branches - 1) * 0.5) * 0.2
+		for k in range(per_branch):
+			if count >= bones:
+				break
+			eb = arm.edit_bones.new("bone_%d_%d" % (b, k))
+			eb.head = (x, -1.0 + 2.0 * k / per_branch, 0.0)
+			eb.tail = (x, -1.0 + 2.0 * (k + 1) / per_branch, 0.0)
+			eb.roll = 0.05 * b
+			eb.parent = parent
+			parent = eb
+			count += 1
+	bpy.ops.object.mode_set(mode='OBJECT')
+	return arm_ob
+
+
+def make_action(arm_ob, name, frames=25, amplitude=0.35):
+	'''	quaternion curves keyed on every frame, every third bone stays still '''
+	act = bpy.data.actions.new(name)
+	frame_list = list(range(1, frames + 1))
+	for i, bone in enumerate(arm_ob.data.bones):
+		if i % 3 == 2:
+			quats = [(1.0, 0.0, 0.0, 0.0)] * 2
+			keyed = [frame_list[0], frame_list[-1]]
+		else:
+			quats = []
+			for frame in frame_list:
+				ang = amplitude * math.sin(frame * 0.2 + i * 0.7)
+				if i % 3 == 0:
+					mtx = Matrix.Rotation(ang, 3, 'X')
+				else:
+					mtx = Matrix.Rotation(ang, 3, 'Z') * Matrix.Rotation(ang * 0.5, 3, 'X')
+				quats.append(tuple(mtx.to_quaternion()))
+			keyed = frame_list
+		data_path = 'pose.bones["%s"].rotation_quaternion' % bone.name
+		for index in range(4):
+			fc = act.fcurves.new(data_path, index=index, action_group=bone.name)
+			fc.keyframe_points.add(len(keyed))
+			fc.keyframe_points.foreach_set("co", _flat(
+				(frame, q[index]) for frame, q in zip(keyed, quats)))
+			fc.update()
+	return act
+
+
+def skin_mesh(ob, arm_ob, influences=2):
+	'''	weights each vertex to its nearest bones by head distance '''
+	me = ob.data
+	bones = [b for b in arm_ob.data.bones if b.name != "root"] or list(arm_ob.data.bones)
+	groups = [ob.vertex_groups.new(bone.name) for bone in bones]
+	heads = np.array([b.head_local[:] for b in bones], dtype=np.float64)
+	cos = np.empty(len(me.vertices) * 3, dtype=np.float32)
+	me.vertices.foreach_get("co", cos)
+	cos = cos.reshape(-1, 3)
+
+	influences = min(influences, len(bones))
+	chunk = 1024
+	for start in range(0, len(cos), chunk):
+		dists = np.sqrt(((cos[start:start + chunk, None, :] - heads[None, :, :]) ** 2).sum(axis=2))
+		nearest = np.argsort(dists, axis=1, kind='mergesort')[:, :influences]
+		inv = 1.0 / (dists[np.arange(len(dists))[:, None], nearest] + 0.01)
+		weights = inv / inv.sum(axis=1)[:, None]
+		for row, (idx, wts) in enumerate(zip(nearest.tolist(), weights.tolist())):
+			for g, w in zip(idx, wts):
+				groups[g].add([start + row], w, 'REPLACE')
+
+	mod = ob.modifiers.new("Armature", 'ARMATURE')
+	mod.object = arm_ob
+	ob.parent = arm_ob
+
+
+def make_scene(loops=4096, meshes=1, bones=0, actions=0, frames=25,
+			   uv_layers=1, color_layers=0, materials=1, shape_keys=0, tris=False,
+			   ngons=False, flat_ratio=0, images=0, empties=0, shared_meshes=False,
+			   instances=0, name="bench"):
+	'''	clears the current scene and fills it with synthetic objects '''
+	scene = clear_scene()
+	scene.frame_start = 1
+	scene.frame_end = frames
+	scene.frame_set(1)
+
+	arm_ob = None
+	if bones:
+		arm_ob = make_armature(scene, name + "_rig", bones, branches=max(1, bones // 25))
+		for k in range(actions):
+			act = make_action(arm_ob, "%s_action%d" % (name, k), frames, 0.2 + 0.1 * k)
+			if k == 0:
+				arm_ob.animation_data_create().action = act
+
+	me = None
+	for m in range(meshes):
+		if me is None or not shared_meshes:
+			me = make_mesh("%s_mesh%d" % (name, m), loops, uv_layers, color_layers,
+						   materials, tris, ngons, flat_ratio, images)
+		ob = bpy.data.objects.new("%s_ob%d" % (name, m), me)
+		scene.objects.link(ob)
+		ob.matrix_world = Matrix.Translation((2.5 * m, 0.0, 0.0))
+		if shape_keys and not ob.data.shape_keys:
+			add_shape_keys(ob, shape_keys)
+		if arm_ob:
+			skin_mesh(ob, arm_ob)
+
+	if instances:
+		# dupliverts, the last mesh object is placed on every vertex of an emitter
+		nx = max(1, int(math.sqrt(instances)))
+		verts = [(3.0 * (k % nx), 3.0 * (k // nx), 0.0) for k in range(instances)]
+		emitter_me = bpy.data.meshes.new(name + "_emitter")
+		emitter_me.from_pydata(verts, [], [])
+		emitter_me.update(calc_edges=True)
+		emitter = bpy.data.objects.new(name + "_emitter", emitter_me)
+		scene.objects.link(emitter)
+		emitter.dupli_type = 'VERTS'
+		ob.parent = emitter
+
+	for e in range(empties):
+		ob = bpy.data.objects.new("%s_empty%d" % (name, e), None)
+		scene.objects.link(ob)
+		ob.matrix_world = Matrix.Translation((0.0, 0.0, 1.0 + e))
+
+	scene.frame_set(scene.frame_current)
+	return scene
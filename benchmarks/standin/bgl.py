@@ -0,0 +1,9 @@
+# bgl stand-in: drawing calls are ignored
+GL_LINES = GL_BLEND = 0
+
+
+def _noop(*args):
+	pass
+
+
+glBegin = glEnd = glVertex3f = glEnable = glDisable = glLineWidth = glColor3f = _noop
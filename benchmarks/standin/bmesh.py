@@ -0,0 +1,8 @@
+# bmesh stand-in (the exporter imports it, the benchmarks never use it)
+
+def new():
+	raise NotImplementedError("bmesh is not available in the stand-in")
+
+
+def from_edit_mesh(me):
+	raise NotImplementedError("bmesh is not available in the stand-in")
@@ -0,0 +1,1201 @@
+# Pure Python stand-in for the parts of Blender 2.7x's bpy module used by
+# the exporter and the normals editor.
+#
+# - only implements what the addon touches, attribute names follow the 2.7x
+#   RNA api (tessfaces, uv_textures, dupli_list, ...)
+# - collections support foreach_get/foreach_set on flat sequences and on
+#   numpy arrays, like the real bpy_prop_collection
+#
+
+import re
+import math
+import bisect
+
+from mathutils import Vector, Matrix, Color, Quaternion
+
+from . import types
+from . import props
+from . import path
+from . import app
+from . import utils
+
+
+class _collection(list):
+	'''	list with the bpy_prop_collection helpers the addon uses '''
+
+	def foreach_get(self, attr, seq):
+		flat = []
+		for item in self:
+			value = getattr(item, attr)
+			try:
+				flat.extend(value)
+			except TypeError:
+				flat.append(value)
+		if len(flat) != len(seq):
+			raise RuntimeError("internal error setting the array (%d != %d)" % (len(flat), len(seq)))
+		seq[:] = flat
+
+	def foreach_set(self, attr, seq):
+		if not len(self):
+			return
+		first = getattr(self[0], attr)
+		try:
+			size = len(first)
+		except TypeError:
+			size = 0
+		seq = list(seq)
+		if size:
+			if len(seq) != size * len(self):
+				raise RuntimeError("internal error setting the array")
+			# keep vector/color attributes typed
+			kind = type(first) if isinstance(first, Vector) else list
+			for i, item in enumerate(self):
+				setattr(item, attr, kind(seq[i * size:(i + 1) * size]))
+		else:
+			if len(seq) != len(self):
+				raise RuntimeError("internal error setting the array")
+			for item, value in zip(self, seq):
+				setattr(item, attr, value)
+
+	def __getitem__(self, key):
+		if isinstance(key, str):
+			for item in self:
+				if item.name == key:
+					return item
+			raise KeyError(key)
+		return list.__getitem__(self, key)
+
+	def __contains__(self, key):
+		if isinstance(key, str):
+			return any(getattr(item, "name", None) == key for item in self)
+		return list.__contains__(self, key)
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except (KeyError, IndexError):
+			return default
+
+	def keys(self):
+		return [item.name for item in self]
+
+	def values(self):
+		return list(self)
+
+	def find(self, key):
+		for i, item in enumerate(self):
+			if item.name == key:
+				return i
+		return -1
+
+	def tag(self, value):
+		for item in self:
+			item.tag = value
+
+	def remove(self, item):
+		if item in self:
+			list.remove(self, item)
+
+
+class _layer_collection(_collection):
+	active = None
+
+	def new(self, name=""):
+		raise NotImplementedError
+
+
+class _owned_collection(_collection):
+	'''	collection with a new() that needs its owner (mesh, object, ...) '''
+	active = None
+
+	def __init__(self, owner, items=()):
+		_collection.__init__(self, items)
+		self._owner = owner
+
+
+class _uv_texture_collection(_owned_collection):
+	def new(self, name="UVMap"):
+		return self._owner.add_uv_layer(name, [(0.0, 0.0)] * len(self._owner.loops))
+
+
+class _vertex_color_collection(_owned_collection):
+	def new(self, name="Col"):
+		return self._owner.add_color_layer(name, [(1.0, 1.0, 1.0)] * len(self._owner.loops))
+
+
+class _idprops(object):
+	'''	ID property access for datablocks: ob['prop'], 'prop' in ob '''
+
+	def __contains__(self, key):
+		return key in self._idprops
+
+	def __getitem__(self, key):
+		return self._idprops[key]
+
+	def __setitem__(self, key, value):
+		self._idprops[key] = value
+
+	def __delitem__(self, key):
+		del self._idprops[key]
+
+	def get(self, key, default=None):
+		return self._idprops.get(key, default)
+
+	def keys(self):
+		return self._idprops.keys()
+
+
+####################################
+# Mesh
+
+class MeshVertex(object):
+	__slots__ = ("index", "co", "normal", "groups", "select", "hide")
+
+	def __init__(self, index, co):
+		self.index = index
+		self.co = Vector(co)
+		self.normal = Vector((0.0, 0.0, 1.0))
+		self.groups = []
+		self.select = False
+		self.hide = False
+
+
+class VertexGroupElement(object):
+	__slots__ = ("group", "weight")
+
+	def __init__(self, group, weight):
+		self.group = group
+		self.weight = weight
+
+
+class MeshEdge(object):
+	__slots__ = ("index", "vertices", "is_loose", "use_edge_sharp", "use_seam", "select", "hide")
+
+	def __init__(self, index, vertices):
+		self.index = index
+		self.vertices = tuple(vertices)
+		self.is_loose = False
+		self.use_edge_sharp = False
+		self.use_seam = False
+		self.select = False
+		self.hide = False
+
+
+class MeshPolygon(object):
+	__slots__ = ("index", "vertices", "loop_start", "loop_total", "use_smooth",
+				 "material_index", "normal", "center", "area", "select", "hide")
+
+	def __init__(self, index, vertices, loop_start):
+		self.index = index
+		self.vertices = tuple(vertices)
+		self.loop_start = loop_start
+		self.loop_total = len(vertices)
+		self.use_smooth = True
+		self.material_index = 0
+		self.normal = Vector((0.0, 0.0, 1.0))
+		self.center = Vector((0.0, 0.0, 0.0))
+		self.area = 0.0
+		self.select = False
+		self.hide = False
+
+	@property
+	def loop_indices(self):
+		return range(self.loop_start, self.loop_start + self.loop_total)
+
+
+class MeshLoop(object):
+	__slots__ = ("index", "vertex_index", "edge_index", "normal", "tangent",
+				 "bitangent", "bitangent_sign")
+
+	def __init__(self, index, vertex_index):
+		self.index = index
+		self.vertex_index = vertex_index
+		self.edge_index = 0
+		self.normal = Vector((0.0, 0.0, 0.0))
+		self.tangent = Vector((0.0, 0.0, 0.0))
+		self.bitangent = Vector((0.0, 0.0, 0.0))
+		self.bitangent_sign = 1.0
+
+
+class MeshTessFace(object):
+	__slots__ = ("index", "vertices", "use_smooth", "material_index", "normal", "area")
+
+	def __init__(self, index, vertices):
+		self.index = index
+		self.vertices = tuple(vertices)
+		self.use_smooth = True
+		self.material_index = 0
+		self.normal = Vector((0.0, 0.0, 1.0))
+		self.area = 0.0
+
+	@property
+	def vertices_raw(self):
+		v = list(self.vertices)
+		if len(v) == 3:
+			v.append(0)
+		return v
+
+
+class MeshTextureFace(object):
+	__slots__ = ("uv1", "uv2", "uv3", "uv4", "image", "_nverts")
+
+	def __init__(self, uvs, image):
+		self._nverts = len(uvs)
+		self.uv1 = Vector(uvs[0])
+		self.uv2 = Vector(uvs[1])
+		self.uv3 = Vector(uvs[2])
+		self.uv4 = Vector(uvs[3]) if len(uvs) > 3 else Vector((0.0, 0.0))
+		self.image = image
+
+	@property
+	def uv(self):
+		uvs = (self.uv1, self.uv2, self.uv3, self.uv4)
+		return uvs[:self._nverts]
+
+	@property
+	def uv_raw(self):
+		return list(self.uv1) + list(self.uv2) + list(self.uv3) + list(self.uv4)
+
+
+class MeshColorFace(object):
+	__slots__ = ("color1", "color2", "color3", "color4")
+
+	def __init__(self, cols):
+		self.color1 = Color(cols[0])
+		self.color2 = Color(cols[1])
+		self.color3 = Color(cols[2])
+		self.color4 = Color(cols[3]) if len(cols) > 3 else Color((0.0, 0.0, 0.0))
+
+
+class MeshUVLoop(object):
+	__slots__ = ("uv", "select", "pin_uv")
+
+	def __init__(self, uv):
+		self.uv = Vector(uv)
+		self.select = False
+		self.pin_uv = False
+
+
+class MeshLoopColor(object):
+	__slots__ = ("color",)
+
+	def __init__(self, color):
+		self.color = Color(color)
+
+
+class MeshTexturePoly(object):
+	__slots__ = ("image",)
+
+	def __init__(self, image):
+		self.image = image
+
+
+class _named_layer(object):
+	__slots__ = ("name", "data", "active", "active_render")
+
+	def __init__(self, name, data):
+		self.name = name
+		self.data = _collection(data)
+		self.active = False
+		self.active_render = False
+
+
+class ShapeKeyPoint(object):
+	__slots__ = ("co",)
+
+	def __init__(self, co):
+		self.co = Vector(co)
+
+
+class ShapeKey(object):
+	__slots__ = ("name", "data", "value", "relative_key", "mute", "vertex_group",
+				 "slider_min", "slider_max", "interpolation")
+
+	def __init__(self, name, coords):
+		self.name = name
+		self.data = _collection(ShapeKeyPoint(co) for co in coords)
+		self.value = 0.0
+		self.relative_key = None
+		self.mute = False
+		self.vertex_group = ""
+		self.slider_min = 0.0
+		self.slider_max = 1.0
+		self.interpolation = 'KEY_LINEAR'
+
+
+class Key(object):
+	__slots__ = ("key_blocks", "use_relative", "reference_key")
+
+	def __init__(self):
+		self.key_blocks = _collection()
+		self.use_relative = True
+		self.reference_key = None
+
+
+class Image(object):
+	def __init__(self, name, filepath=""):
+		self.name = name
+		self.users = 0
+		self.filepath = filepath
+		self.library = None
+		self.use_clamp_x = False
+		self.use_clamp_y = False
+
+
+class Material(object):
+	def __init__(self, name):
+		self.name = name
+		self.users = 0
+		self.diffuse_color = Color((0.8, 0.8, 0.8))
+		self.specular_color = Color((1.0, 1.0, 1.0))
+		self.diffuse_intensity = 0.8
+		self.ambient = 1.0
+		self.specular_hardness = 50
+		self.specular_intensity = 0.5
+		self.alpha = 1.0
+		self.emit = 0.0
+		self.use_shadeless = False
+		self.diffuse_shader = 'LAMBERT'
+
+
+class Mesh(_idprops):
+	def __init__(self, name, verts=(), polys=()):
+		self._idprops = {}
+		self.name = name
+		self.users = 0
+		self.is_updated = False
+		self.use_auto_smooth = False
+		self.auto_smooth_angle = 0.5235987901687622
+		self.materials = _collection()
+		self.shape_keys = None
+		self.from_pydata(verts, [], polys)
+
+	# -- helpers used by the layer collections and copy()
+	def add_uv_layer(self, name, loop_uvs, images=None):
+		layer = _named_layer(name, (MeshUVLoop(uv) for uv in loop_uvs))
+		self.uv_layers.append(layer)
+		if images is None:
+			images = [None] * len(self.polygons)
+		tex = _named_layer(name, (MeshTexturePoly(im) for im in images))
+		self.uv_textures.append(tex)
+		if self.uv_layers.active is None:
+			self.uv_layers.active = layer
+			self.uv_textures.active = tex
+			layer.active = tex.active = True
+		return tex
+
+	def add_color_layer(self, name, loop_colors):
+		layer = _named_layer(name, (MeshLoopColor(c) for c in loop_colors))
+		self.vertex_colors.append(layer)
+		if self.vertex_colors.active is None:
+			self.vertex_colors.active = layer
+			layer.active = True
+		return layer
+
+	def add_shape_key(self, name, coords=None):
+		if self.shape_keys is None:
+			self.shape_keys = Key()
+		if coords is None:
+			coords = [v.co[:] for v in self.vertices]
+		kb = ShapeKey(name, coords)
+		if len(self.shape_keys.key_blocks):
+			kb.relative_key = self.shape_keys.key_blocks[0]
+		else:
+			self.shape_keys.reference_key = kb
+		self.shape_keys.key_blocks.append(kb)
+		return kb
+
+	# -- rna api
+	def from_pydata(self, vertices, edges, faces):
+		self.vertices = _collection(MeshVertex(i, co) for i, co in enumerate(vertices))
+
+		edge_map = {}
+		edge_list = []
+		self.polygons = _collection()
+		self.loops = _collection()
+		for pi, pverts in enumerate(faces):
+			pverts = tuple(pverts)
+			poly = MeshPolygon(pi, pverts, len(self.loops))
+			self.polygons.append(poly)
+			n = len(pverts)
+			for j, v in enumerate(pverts):
+				loop = MeshLoop(len(self.loops), v)
+				key = (min(v, pverts[(j + 1) % n]), max(v, pverts[(j + 1) % n]))
+				ei = edge_map.get(key)
+				if ei is None:
+					ei = edge_map[key] = len(edge_list)
+					edge_list.append(key)
+				loop.edge_index = ei
+				self.loops.append(loop)
+		loose = []
+		for e in edges:
+			key = (min(e), max(e))
+			if key not in edge_map:
+				edge_map[key] = len(edge_list)
+				edge_list.append(key)
+				loose.append(edge_map[key])
+		self.edges = _collection(MeshEdge(i, e) for i, e in enumerate(edge_list))
+		for i in loose:
+			self.edges[i].is_loose = True
+
+		self.uv_layers = _layer_collection()
+		self.uv_textures = _uv_texture_collection(self)
+		self.vertex_colors = _vertex_color_collection(self)
+		self.tessfaces = _collection()
+		self.tessface_uv_textures = _layer_collection()
+		self.tessface_vertex_colors = _layer_collection()
+		self._tess_loops = []
+		self.calc_normals()
+
+	def calc_normals(self):
+		vnormals = [[0.0, 0.0, 0.0] for v in self.vertices]
+		for poly in self.polygons:
+			cos = [self.vertices[v].co for v in poly.vertices]
+			n = [0.0, 0.0, 0.0]
+			c = [0.0, 0.0, 0.0]
+			# newell's method
+			for j in range(len(cos)):
+				a = cos[j]
+				b = cos[(j + 1) % len(cos)]
+				n[0] += (a[1] - b[1]) * (a[2] + b[2])
+				n[1] += (a[2] - b[2]) * (a[0] + b[0])
+				n[2] += (a[0] - b[0]) * (a[1] + b[1])
+				c[0] += a[0]
+				c[1] += a[1]
+				c[2] += a[2]
+			length = math.sqrt(n[0] ** 2 + n[1] ** 2 + n[2] ** 2)
+			poly.area = length * 0.5
+			poly.center = Vector([x / len(cos) for x in c])
+			if length > 0.0:
+				n = [x / length for x in n]
+			poly.normal = Vector(n)
+			for v in poly.vertices:
+				vn = vnormals[v]
+				vn[0] += n[0] * poly.area
+				vn[1] += n[1] * poly.area
+				vn[2] += n[2] * poly.area
+		for v, vn in zip(self.vertices, vnormals):
+			v.normal = Vector(vn).normalized()
+
+	def update(self, calc_edges=False, calc_tessface=False):
+		self.calc_normals()
+		if calc_tessface:
+			self.calc_tessface()
+
+	def calc_tessface(self, free_mpoly=False):
+		# tris and quads are kept, ngons are fan triangulated.
+		# the 4th (or 3rd) vertex is never 0, like blender's test_index_face
+		self.tessfaces = _collection()
+		self._tess_loops = []
+		for poly in self.polygons:
+			loops = list(poly.loop_indices)
+			if len(loops) <= 4:
+				chunks = [loops]
+			else:
+				chunks = [[loops[0], loops[j], loops[j + 1]] for j in range(1, len(loops) - 1)]
+			for chunk in chunks:
+				verts = [self.loops[l].vertex_index for l in chunk]
+				while verts[-1] == 0:
+					verts = verts[1:] + verts[:1]
+					chunk = chunk[1:] + chunk[:1]
+				tf = MeshTessFace(len(self.tessfaces), verts)
+				tf.use_smooth = poly.use_smooth
+				tf.material_index = poly.material_index
+				tf.normal = poly.normal.copy()
+				self.tessfaces.append(tf)
+				self._tess_loops.append(chunk)
+
+		self.tessface_uv_textures = _layer_collection()
+		for layer, tex in zip(self.uv_layers, self.uv_textures):
+			data = []
+			for tf, chunk in zip(self.tessfaces, self._tess_loops):
+				poly = self._loop_poly(chunk[0])
+				data.append(MeshTextureFace([layer.data[l].uv for l in chunk], tex.data[poly].image))
+			tl = _named_layer(layer.name, data)
+			self.tessface_uv_textures.append(tl)
+			if layer is self.uv_layers.active:
+				self.tessface_uv_textures.active = tl
+
+		self.tessface_vertex_colors = _layer_collection()
+		for layer in self.vertex_colors:
+			data = [MeshColorFace([layer.data[l].color for l in chunk]) for chunk in self._tess_loops]
+			tl = _named_layer(layer.name, data)
+			self.tessface_vertex_colors.append(tl)
+			if layer is self.vertex_colors.active:
+				self.tessface_vertex_colors.active = tl
+
+	def _loop_poly(self, loop_index):
+		if not hasattr(self, "_loop_poly_map") or len(self._loop_poly_map) != len(self.loops):
+			self._loop_poly_map = []
+			for poly in self.polygons:
+				self._loop_poly_map.extend([poly.index] * poly.loop_total)
+		return self._loop_poly_map[loop_index]
+
+	def calc_normals_split(self, split_angle=math.pi):
+		for poly in self.polygons:
+			for l in poly.loop_indices:
+				loop = self.loops[l]
+				if poly.use_smooth:
+					loop.normal = self.vertices[loop.vertex_index].normal.copy()
+				else:
+					loop.normal = poly.normal.copy()
+
+	def free_normals_split(self):
+		pass
+
+	def calc_tangents(self, uvmap=""):
+		self.calc_normals_split()
+		layer = self.uv_layers[uvmap] if uvmap else self.uv_layers.active
+		for poly in self.polygons:
+			loops = list(poly.loop_indices)
+			p0, p1, p2 = [self.vertices[self.loops[l].vertex_index].co for l in loops[:3]]
+			u0, u1, u2 = [layer.data[l].uv for l in loops[:3]]
+			e1 = p1 - p0
+			e2 = p2 - p0
+			d1 = u1 - u0
+			d2 = u2 - u0
+			r = d1[0] * d2[1] - d2[0] * d1[1]
+			if r != 0.0:
+				r = 1.0 / r
+			tan = (e1 * d2[1] - e2 * d1[1]) * r
+			for l in loops:
+				loop = self.loops[l]
+				n = loop.normal
+				t = (tan - n * n.dot(tan)).normalized()
+				loop.tangent = t
+				loop.bitangent = n.cross(t)
+				loop.bitangent_sign = 1.0
+
+	def free_tangents(self):
+		pass
+
+	def validate(self, verbose=False):
+		return False
+
+	def create_normals_split(self):
+		pass
+
+	def transform(self, matrix):
+		for v in self.vertices:
+			v.co = matrix * v.co
+
+	def copy(self):
+		me = Mesh(self.name + ".001", [v.co[:] for v in self.vertices], [p.vertices for p in self.polygons])
+		for src, dst in zip(self.polygons, me.polygons):
+			dst.use_smooth = src.use_smooth
+			dst.material_index = src.material_index
+		for mat in self.materials:
+			me.materials.append(mat)
+		for layer, tex in zip(self.uv_layers, self.uv_textures):
+			me.add_uv_layer(layer.name, [d.uv for d in layer.data], [d.image for d in tex.data])
+		for layer in self.vertex_colors:
+			me.add_color_layer(layer.name, [d.color for d in layer.data])
+		for src, dst in zip(self.vertices, me.vertices):
+			dst.groups = list(src.groups)
+		return me
+
+
+####################################
+# Armature
+
+def _vec_roll_to_mat3(vec, roll):
+	'''	rest rotation of a bone: y axis along vec, rolled around it '''
+	nor = Vector(vec).normalized()
+	y = Vector((0.0, 1.0, 0.0))
+	axis = y.cross(nor)
+	if axis.length > 1e-6:
+		mat = Matrix.Rotation(math.acos(max(-1.0, min(1.0, y.dot(nor)))), 3, axis)
+	elif nor[1] < 0.0:
+		mat = Matrix.Rotation(math.pi, 3, 'Z')
+	else:
+		mat = Matrix.Identity(3)
+	return mat * Matrix.Rotation(roll, 3, 'Y')
+
+
+class Bone(types.Bone):
+	def __init__(self, name, matrix_local, length=1.0, parent=None):
+		self.name = name
+		self.parent = parent
+		self.children = []
+		if parent:
+			parent.children.append(self)
+		self.matrix_local = matrix_local
+		self.head_local = matrix_local.to_translation()
+		self.tail_local = matrix_local * Vector((0.0, length, 0.0))
+		self.use_deform = True
+		self.tag = False
+		self._roll = 0.0
+
+	@property
+	def parent_recursive(self):
+		parents = []
+		bone = self.parent
+		while bone:
+			parents.append(bone)
+			bone = bone.parent
+		return parents
+
+	def __hash__(self):
+		return id(self)
+
+
+class EditBone(object):
+	def __init__(self, name):
+		self.name = name
+		self.head = Vector((0.0, 0.0, 0.0))
+		self.tail = Vector((0.0, 1.0, 0.0))
+		self.roll = 0.0
+		self.parent = None
+		self.use_connect = False
+		self.use_deform = True
+
+
+class _edit_bone_collection(_owned_collection):
+	def new(self, name):
+		eb = EditBone(name)
+		self.append(eb)
+		return eb
+
+
+class Armature(_idprops):
+	def __init__(self, name):
+		self._idprops = {}
+		self.name = name
+		self.bones = _collection()
+		self.edit_bones = _edit_bone_collection(self)
+		self.pose_position = 'POSE'
+		self.users = 0
+
+	def _edit_begin(self):
+		self.edit_bones = _edit_bone_collection(self)
+		edit = {}
+		for bone in self.bones:
+			eb = edit[bone.name] = self.edit_bones.new(bone.name)
+			eb.head = bone.head_local.copy()
+			eb.tail = bone.tail_local.copy()
+			eb.roll = bone._roll
+			eb.use_deform = bone.use_deform
+			if bone.parent:
+				eb.parent = edit[bone.parent.name]
+
+	def _edit_end(self):
+		# parents are created before their children
+		bones = {}
+		self.bones = _collection()
+
+		def make(eb):
+			bone = bones.get(eb.name)
+			if bone is None:
+				parent = make(eb.parent) if eb.parent else None
+				head = Vector(eb.head)
+				vec = Vector(eb.tail) - head
+				mtx = Matrix.Translation(head) * _vec_roll_to_mat3(vec, eb.roll).to_4x4()
+				bone = bones[eb.name] = Bone(eb.name, mtx, vec.length, parent)
+				bone.use_deform = eb.use_deform
+				bone._roll = eb.roll
+				self.bones.append(bone)
+			return bone
+
+		for eb in self.edit_bones:
+			make(eb)
+		self.edit_bones = _edit_bone_collection(self)
+
+
+class PoseBone(types.PoseBone):
+	def __init__(self, bone):
+		self.bone = bone
+		self.name = bone.name
+		self.matrix = bone.matrix_local.copy()
+		self.location = Vector((0.0, 0.0, 0.0))
+		self.rotation_quaternion = Quaternion()
+		self.scale = Vector((1.0, 1.0, 1.0))
+		self.rotation_mode = 'QUATERNION'
+		self.constraints = []
+
+
+class Pose(object):
+	def __init__(self, armature):
+		self.bones = _collection(PoseBone(b) for b in armature.bones)
+		self._bone_map = dict((pbone.name, pbone) for pbone in self.bones)
+
+	def update(self):
+		'''	pose matrices from the bones' loc/rot/scale channels '''
+		for pbone in self.bones:
+			bone = pbone.bone
+			basis = pbone.rotation_quaternion.normalized().to_matrix().to_4x4()
+			if tuple(pbone.scale) != (1.0, 1.0, 1.0):
+				basis = basis * Matrix((
+					(pbone.scale[0], 0.0, 0.0, 0.0), (0.0, pbone.scale[1], 0.0, 0.0),
+					(0.0, 0.0, pbone.scale[2], 0.0), (0.0, 0.0, 0.0, 1.0)))
+			if tuple(pbone.location) != (0.0, 0.0, 0.0):
+				basis = Matrix.Translation(pbone.location) * basis
+			if bone.parent:
+				parent_pose = self._bone_map[bone.parent.name].matrix
+				rest_rel = bone.parent.matrix_local.inverted() * bone.matrix_local
+				pbone.matrix = parent_pose * rest_rel * basis
+			else:
+				pbone.matrix = bone.matrix_local * basis
+
+
+class Keyframe(object):
+	__slots__ = ("co", "interpolation")
+
+	def __init__(self, frame=0.0, value=0.0):
+		self.co = Vector((frame, value))
+		self.interpolation = 'LINEAR'
+
+
+class _keyframe_collection(_owned_collection):
+	def add(self, count=1):
+		self.extend(Keyframe() for i in range(count))
+
+	def insert(self, frame, value, options=set()):
+		key = Keyframe(frame, value)
+		self.append(key)
+		self._owner.update()
+		return key
+
+
+class FCurve(object):
+	'''	linear interpolation between keyframes, enough for sampling '''
+
+	def __init__(self, action, data_path, array_index=0, group=None):
+		self.data_path = data_path
+		self.array_index = array_index
+		self.group = group
+		self.keyframe_points = _keyframe_collection(self)
+		self._action = action
+		self._keys = None
+
+	def update(self):
+		self.keyframe_points.sort(key=lambda key: key.co[0])
+		self._keys = None
+		self._action._range = None
+
+	def evaluate(self, frame):
+		if self._keys is None:
+			self._keys = ([key.co[0] for key in self.keyframe_points],
+						  [key.co[1] for key in self.keyframe_points])
+		frames, values = self._keys
+		if not frames:
+			return 0.0
+		i = bisect.bisect_right(frames, frame)
+		if i == 0:
+			return values[0]
+		if i == len(frames):
+			return values[-1]
+		t = (frame - frames[i - 1]) / (frames[i] - frames[i - 1])
+		return values[i - 1] + (values[i] - values[i - 1]) * t
+
+
+class _fcurve_collection(_owned_collection):
+	def new(self, data_path, index=0, action_group=""):
+		fc = FCurve(self._owner, data_path, index, action_group or None)
+		self.append(fc)
+		self._owner._channels = None
+		return fc
+
+
+_bone_channel_re = re.compile(r'pose\.bones\["(.+?)"\]\.(\w+)$')
+
+
+class Action(object):
+	def __init__(self, name):
+		self.name = name
+		self.users = 0
+		self.use_fake_user = False
+		self.fcurves = _fcurve_collection(self)
+		self._channels = None
+		self._range = None
+
+	@property
+	def frame_range(self):
+		if self._range is None:
+			frames = [key.co[0] for fc in self.fcurves for key in fc.keyframe_points]
+			self._range = (min(frames), max(frames)) if frames else (0.0, 0.0)
+		return self._range
+
+	def evaluate(self, ob, frame):
+		if ob.type != 'ARMATURE':
+			return
+		if self._channels is None:
+			self._channels = {}
+			for fc in self.fcurves:
+				match = _bone_channel_re.match(fc.data_path)
+				if match:
+					self._channels.setdefault(match.group(1), []).append(
+						(match.group(2), fc.array_index, fc))
+		for pbone in ob.pose.bones:
+			for prop, index, fc in self._channels.get(pbone.name, ()):
+				getattr(pbone, prop)[index] = fc.evaluate(frame)
+		ob.pose.update()
+
+
+class AnimData(object):
+	def __init__(self, action=None):
+		self.action = action
+
+
+####################################
+# Objects / scenes
+
+class VertexGroup(object):
+	def __init__(self, ob, name, index):
+		self.name = name
+		self.index = index
+		self._ob = ob
+
+	def add(self, index, weight, type):
+		vertices = self._ob.data.vertices
+		for i in index:
+			groups = vertices[i].groups
+			for g in groups:
+				if g.group == self.index:
+					if type == 'ADD':
+						g.weight = min(1.0, g.weight + weight)
+					elif type == 'SUBTRACT':
+						g.weight = max(0.0, g.weight - weight)
+					else:
+						g.weight = weight
+					break
+			else:
+				groups.append(VertexGroupElement(self.index, weight))
+
+
+class _vertex_group_collection(_owned_collection):
+	def new(self, name="Group"):
+		vg = VertexGroup(self._owner, name, len(self))
+		self.append(vg)
+		self.active = vg
+		return vg
+
+
+class _rna_property(object):
+	__slots__ = ("identifier", "type")
+
+	def __init__(self, identifier, type):
+		self.identifier = identifier
+		self.type = type
+
+
+class _rna_struct(object):
+	'''	bl_rna of the stand-in structs, properties from their attributes '''
+	__slots__ = ("properties",)
+
+	def __init__(self, owner, pointers=()):
+		self.properties = [_rna_property("rna_type", 'POINTER')]
+		for name, value in sorted(vars(owner).items()):
+			if name in pointers:
+				type = 'POINTER'
+			elif isinstance(value, bool):
+				type = 'BOOLEAN'
+			elif isinstance(value, int):
+				type = 'INT'
+			elif isinstance(value, float):
+				type = 'FLOAT'
+			elif isinstance(value, str):
+				type = 'STRING'
+			else:
+				type = 'FLOAT'
+			self.properties.append(_rna_property(name, type))
+
+
+class Modifier(object):
+	def __init__(self, name, type):
+		self.name = name
+		self.type = type
+		self.object = None
+		self.show_viewport = True
+		self.show_render = True
+
+	@property
+	def bl_rna(self):
+		return _rna_struct(self, pointers=("object",))
+
+
+class _modifier_collection(_owned_collection):
+	def new(self, name, type):
+		mod = Modifier(name, type)
+		self.append(mod)
+		return mod
+
+
+class _resolved_prop(object):
+	def __init__(self, data):
+		self.data = data
+
+
+class Object(_idprops, types.Object):
+	def __init__(self, name, data=None, type=None):
+		self._idprops = {}
+		self.name = name
+		self.data = data
+		if type is None:
+			if isinstance(data, Mesh):
+				type = 'MESH'
+			elif isinstance(data, Armature):
+				type = 'ARMATURE'
+			else:
+				type = 'EMPTY'
+		self.type = type
+		self.users = 0
+		self.matrix_world = Matrix()
+		self.scale = Vector((1.0, 1.0, 1.0))
+		self.parent = None
+		self.parent_type = 'OBJECT'
+		self.parent_bone = ""
+		self.dupli_type = 'NONE'
+		self.dupli_list = []
+		self._dupli_objects = []
+		self.vertex_groups = _vertex_group_collection(self)
+		self.constraints = []
+		self.modifiers = _modifier_collection(self)
+		self.animation_data = None
+		self.pose = Pose(data) if type == 'ARMATURE' else None
+		self.show_only_shape_key = False
+		self.active_shape_key_index = 0
+		self.tag = False
+		self.select = True
+		self.hide = False
+		self.is_updated = False
+		self.is_updated_data = False
+
+	def __hash__(self):
+		return id(self)
+
+	def __eq__(self, other):
+		return self is other
+
+	def find_armature(self):
+		for mod in self.modifiers:
+			if mod.type == 'ARMATURE' and mod.object:
+				return mod.object
+		if self.parent and self.parent.type == 'ARMATURE' and self.parent_type == 'ARMATURE':
+			return self.parent
+		return None
+
+	def animation_data_create(self):
+		if self.animation_data is None:
+			self.animation_data = AnimData()
+		return self.animation_data
+
+	def shape_key_add(self, name="Key", from_mix=True):
+		return self.data.add_shape_key(name)
+
+	def update_tag(self, refresh=set()):
+		pass
+
+	def update_from_editmode(self):
+		return False
+
+	def to_mesh(self, scene, apply_modifiers, settings, calc_tessface=True, calc_undeformed=False):
+		me = self.data.copy()
+		for mod in self.modifiers:
+			if mod.show_viewport and hasattr(mod, "apply"):
+				mod.apply(me)
+		me.calc_normals()
+		if calc_tessface:
+			me.calc_tessface()
+		data.meshes.append(me)
+		return me
+
+	def path_resolve(self, path, coerce=True):
+		match = re.match(r'pose\.bones\["(.+?)"\]', path)
+		if match and self.pose:
+			return _resolved_prop(self.pose.bones[match.group(1)])
+		raise ValueError("path not found: %r" % path)
+
+	def dupli_list_create(self, scene, settings='VIEW'):
+		dupli_objects = list(self._dupli_objects)
+		if self.dupli_type == 'VERTS' and self.type == 'MESH':
+			# children placed on each vertex, not rotated
+			children = [ob for ob in data.objects if ob.parent is self]
+			for v in self.data.vertices:
+				mtx = self.matrix_world * Matrix.Translation(v.co)
+				dupli_objects.extend((ob, mtx.copy()) for ob in children)
+		self.dupli_list = [DupliObject(ob, mtx) for ob, mtx in dupli_objects]
+
+	def dupli_list_clear(self):
+		self.dupli_list = []
+
+
+class DupliObject(object):
+	def __init__(self, ob, matrix):
+		self.object = ob
+		self.matrix = matrix
+
+
+class World(object):
+	def __init__(self):
+		self.ambient_color = Color((0.0, 0.0, 0.0))
+		self.horizon_color = Color((0.05, 0.05, 0.05))
+
+		class _mist(object):
+			use_mist = False
+			intensity = 0.0
+			start = 5.0
+			depth = 25.0
+		self.mist_settings = _mist()
+
+
+class RenderSettings(object):
+	def __init__(self):
+		self.fps = 24
+		self.fps_base = 1.0
+		self.resolution_x = 1920
+		self.resolution_y = 1080
+
+
+class _scene_objects(_collection):
+	active = None
+
+	def link(self, ob):
+		if ob not in self:
+			self.append(ob)
+			ob.users += 1
+
+	def unlink(self, ob):
+		if ob in self:
+			self.remove(ob)
+			ob.users -= 1
+		if self.active is ob:
+			self.active = None
+
+
+class Scene(object):
+	def __init__(self, name="Scene"):
+		self.name = name
+		self.objects = _scene_objects()
+		self.world = None
+		self.render = RenderSettings()
+		self.frame_start = 1
+		self.frame_end = 250
+		self.frame_current = 1
+		self.cursor_location = Vector((0.0, 0.0, 0.0))
+		self.layers = [True] * 20
+
+	def frame_set(self, frame, subframe=0.0):
+		self.frame_current = frame
+		for ob in self.objects:
+			if ob.type == 'ARMATURE':
+				if ob.data.pose_position == 'REST':
+					for pbone in ob.pose.bones:
+						pbone.matrix = pbone.bone.matrix_local.copy()
+				elif ob.animation_data and ob.animation_data.action:
+					ob.animation_data.action.evaluate(ob, frame)
+				else:
+					ob.pose.update()
+
+	def update(self):
+		pass
+
+
+class _id_collection(_collection):
+	'''	bpy.data collection, new() creates and adds a datablock '''
+
+	def __init__(self, factory):
+		_collection.__init__(self)
+		self._factory = factory
+
+	def new(self, *args, **kwargs):
+		item = self._factory(*args, **kwargs)
+		self.append(item)
+		return item
+
+
+def _new_image(name, width=1024, height=1024, alpha=False, float_buffer=False):
+	return Image(name)
+
+
+class _data(object):
+	def __init__(self):
+		self.filepath = ""
+		self.objects = _id_collection(Object)
+		self.meshes = _id_collection(Mesh)
+		self.armatures = _id_collection(Armature)
+		self.materials = _id_collection(Material)
+		self.images = _id_collection(_new_image)
+		self.groups = _collection()
+		self.actions = _id_collection(Action)
+		self.scenes = _id_collection(Scene)
+
+
+data = _data()
+
+
+class _window_manager(_idprops):
+	def __init__(self):
+		self._idprops = {}
+		self.edit_splitnormals = False
+
+
+class _context(object):
+	def __init__(self):
+		self.window_manager = _window_manager()
+		self.scene = None
+		self.selected_objects = []
+		self.mode = 'OBJECT'
+		self.area = None
+
+	@property
+	def active_object(self):
+		return self.scene.objects.active if self.scene else None
+
+	@active_object.setter
+	def active_object(self, ob):
+		self.scene.objects.active = ob
+
+	object = active_object
+
+
+context = _context()
+context.scene = data.scenes.new("Scene")
+
+
+####################################
+# Operators
+
+def _mode_set(mode='OBJECT', toggle=False):
+	ob = context.active_object
+	if ob is None:
+		raise RuntimeError("Operator bpy.ops.object.mode_set.poll() failed, context is incorrect")
+	if ob.type == 'ARMATURE':
+		if mode == 'EDIT' and context.mode != 'EDIT_ARMATURE':
+			ob.data._edit_begin()
+			context.mode = 'EDIT_ARMATURE'
+		elif mode != 'EDIT' and context.mode == 'EDIT_ARMATURE':
+			ob.data._edit_end()
+			ob.pose = Pose(ob.data)
+			context.mode = 'OBJECT'
+	else:
+		context.mode = 'EDIT_MESH' if mode == 'EDIT' else 'OBJECT'
+	return {'FINISHED'}
+
+
+# operators that do something: path: (function, poll)
+_ops_impl = {
+	"object.mode_set": (_mode_set, lambda: context.active_object is not None),
+}
+
+
+class _ops_namespace(object):
+	'''	other operators are accepted and do nothing '''
+
+	def __init__(self, path=""):
+		self._path = path
+
+	def __getattr__(self, name):
+		return _ops_namespace(self._path + "." + name if self._path else name)
+
+	def __call__(self, *args, **kwargs):
+		impl = _ops_impl.get(self._path)
+		if impl:
+			return impl[0](**kwargs)
+		return {'FINISHED'}
+
+	def poll(self):
+		impl = _ops_impl.get(self._path)
+		return bool(impl and impl[1]())
+
+
+ops = _ops_namespace()
@@ -0,0 +1,19 @@
+# bpy.app stand-in
+
+import sys
+
+version = (2, 73, 0)
+version_string = "2.73 (sub 0)"
+binary_path = ""
+binary_path_python = sys.executable
+background = True
+
+
+class _handlers(object):
+	def __init__(self):
+		self.scene_update_post = []
+		self.save_pre = []
+		self.load_post = []
+
+
+handlers = _handlers()
@@ -0,0 +1,18 @@
+# bpy.path stand-in
+
+import os
+import re
+
+_clean_re = re.compile(r'[^A-Za-z0-9_\-]')
+
+
+def clean_name(name, replace="_"):
+	return _clean_re.sub(replace, name)
+
+
+def basename(path):
+	return os.path.basename(path[2:] if path.startswith("//") else path)
+
+
+def abspath(path, start=None, library=None):
+	return path[2:] if path.startswith("//") else path
@@ -0,0 +1,19 @@
+# bpy.props stand-in: property definitions are plain (type, kwargs) tuples
+
+def _prop(kind):
+	def define(**kwargs):
+		return (kind, kwargs)
+	define.__name__ = kind
+	return define
+
+
+BoolProperty = _prop("BoolProperty")
+BoolVectorProperty = _prop("BoolVectorProperty")
+IntProperty = _prop("IntProperty")
+IntVectorProperty = _prop("IntVectorProperty")
+FloatProperty = _prop("FloatProperty")
+FloatVectorProperty = _prop("FloatVectorProperty")
+StringProperty = _prop("StringProperty")
+EnumProperty = _prop("EnumProperty")
+PointerProperty = _prop("PointerProperty")
+CollectionProperty = _prop("CollectionProperty")
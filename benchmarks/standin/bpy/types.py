@@ -0,0 +1,53 @@
+# bpy.types stand-in: base classes the addon subclasses or checks against
+
+class _struct(object):
+	bl_rna = None
+
+
+class ID(_struct):
+	pass
+
+
+class Bone(_struct):
+	pass
+
+
+class PoseBone(_struct):
+	pass
+
+
+class Operator(_struct):
+	def report(self, type, message):
+		print("%s: %s" % ("/".join(sorted(type)), message))
+
+
+class Panel(_struct):
+	pass
+
+
+class PropertyGroup(_struct):
+	pass
+
+
+class Object(ID):
+	pass
+
+
+class Mesh(ID):
+	pass
+
+
+class WindowManager(_struct):
+	pass
+
+
+class SpaceView3D(_struct):
+	pass
+
+
+class INFO_MT_file_export(_struct):
+	pass
+
+
+class INFO_MT_file_import(_struct):
+	pass
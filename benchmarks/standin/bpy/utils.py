@@ -0,0 +1,19 @@
+# bpy.utils stand-in
+
+import os
+import tempfile
+
+
+def register_class(cls):
+	pass
+
+
+def unregister_class(cls):
+	pass
+
+
+def user_resource(resource_type, path="", create=False):
+	target = os.path.join(tempfile.gettempdir(), "blender_standin", resource_type.lower(), path)
+	if create and not os.path.exists(target):
+		os.makedirs(target)
+	return target
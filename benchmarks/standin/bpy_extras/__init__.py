@@ -0,0 +1,2 @@
+# bpy_extras stand-in
+from . import io_utils
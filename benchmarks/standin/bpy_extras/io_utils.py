@@ -0,0 +1,43 @@
+# bpy_extras.io_utils stand-in
+
+import os
+
+from mathutils import Matrix, Vector
+
+
+class ExportHelper(object):
+	filepath = ""
+
+	def check(self, context):
+		return False
+
+
+class ImportHelper(object):
+	filepath = ""
+
+
+path_reference_mode = ("EnumProperty", {})
+
+
+def _axis_vector(axis):
+	sign = -1.0 if axis.startswith('-') else 1.0
+	vec = [0.0, 0.0, 0.0]
+	vec["XYZ".index(axis[-1])] = sign
+	return Vector(vec)
+
+
+def axis_conversion(from_forward='Y', from_up='Z', to_forward='Y', to_up='Z'):
+	def basis(forward, up):
+		f = _axis_vector(forward)
+		u = _axis_vector(up)
+		r = f.cross(u)
+		return Matrix((r[:], f[:], u[:])).transposed()
+	return basis(to_forward, to_up) * basis(from_forward, from_up).transposed()
+
+
+def path_reference(filepath, base_src, base_dst, mode='AUTO', copy_subdir="", copy_set=None, library=None):
+	return os.path.basename(filepath)
+
+
+def path_reference_copy(copy_set, report=print):
+	pass
@@ -0,0 +1,462 @@
+# Pure Python stand-in for the parts of Blender 2.7x's mathutils module used
+# by the exporter and editor.
+#
+# - values are rounded to single precision like Blender's C float storage, so
+#   data read through attribute access and through foreach_get match
+# - '*' is matrix/vector multiplication as in the 2.7x API
+#
+
+import math
+import struct
+
+_pack_f = struct.Struct('f')
+
+
+def _f32(value):
+	return _pack_f.unpack(_pack_f.pack(value))[0]
+
+
+class Vector(object):
+	__slots__ = ("_v",)
+
+	def __init__(self, seq=(0.0, 0.0, 0.0)):
+		self._v = [_f32(float(c)) for c in seq]
+
+	@classmethod
+	def Fill(cls, size, fill=0.0):
+		return cls([fill] * size)
+
+	# sequence protocol
+	def __len__(self):
+		return len(self._v)
+
+	def __iter__(self):
+		return iter(self._v)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return tuple(self._v[index])
+		return self._v[index]
+
+	def __setitem__(self, index, value):
+		if isinstance(index, slice):
+			values = [_f32(float(c)) for c in value]
+			self._v[index] = values
+		else:
+			self._v[index] = _f32(float(value))
+
+	def __repr__(self):
+		return "Vector((%s))" % ", ".join("%.4f" % c for c in self._v)
+
+	def __eq__(self, other):
+		try:
+			return len(other) == len(self._v) and all(a == b for a, b in zip(self._v, other))
+		except TypeError:
+			return False
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+	__hash__ = None
+
+	# components
+	def _get(i):
+		def getter(self):
+			return self._v[i]
+
+		def setter(self, value):
+			self._v[i] = _f32(float(value))
+		return property(getter, setter)
+
+	x = _get(0)
+	y = _get(1)
+	z = _get(2)
+	w = _get(3)
+	del _get
+
+	# math
+	def __add__(self, other):
+		return Vector([a + b for a, b in zip(self._v, other)])
+
+	__radd__ = __add__
+
+	def __iadd__(self, other):
+		self._v = [_f32(a + b) for a, b in zip(self._v, other)]
+		return self
+
+	def __sub__(self, other):
+		return Vector([a - b for a, b in zip(self._v, other)])
+
+	def __rsub__(self, other):
+		return Vector([b - a for a, b in zip(self._v, other)])
+
+	def __isub__(self, other):
+		self._v = [_f32(a - b) for a, b in zip(self._v, other)]
+		return self
+
+	def __neg__(self):
+		return Vector([-a for a in self._v])
+
+	def __mul__(self, other):
+		if isinstance(other, (int, float)):
+			return Vector([a * other for a in self._v])
+		if isinstance(other, Vector):
+			return self.dot(other)
+		if isinstance(other, Matrix):
+			# row vector * matrix
+			return Vector([sum(self._v[r] * other._rows[r][c] for r in range(len(self._v)))
+					for c in range(other._cols)])
+		return NotImplemented
+
+	def __rmul__(self, other):
+		if isinstance(other, (int, float)):
+			return Vector([a * other for a in self._v])
+		return NotImplemented
+
+	def __truediv__(self, other):
+		return Vector([a / other for a in self._v])
+
+	def dot(self, other):
+		return _f32(sum(a * b for a, b in zip(self._v, other)))
+
+	def cross(self, other):
+		a = self._v
+		b = other
+		return Vector((
+			a[1] * b[2] - a[2] * b[1],
+			a[2] * b[0] - a[0] * b[2],
+			a[0] * b[1] - a[1] * b[0]))
+
+	@property
+	def length(self):
+		return _f32(math.sqrt(sum(a * a for a in self._v)))
+
+	@property
+	def length_squared(self):
+		return _f32(sum(a * a for a in self._v))
+
+	def normalized(self):
+		v = self.copy()
+		v.normalize()
+		return v
+
+	def normalize(self):
+		length = math.sqrt(sum(a * a for a in self._v))
+		if length > 1.0e-35:
+			self._v = [_f32(a / length) for a in self._v]
+		else:
+			self._v = [0.0] * len(self._v)
+
+	def zero(self):
+		self._v = [0.0] * len(self._v)
+
+	def copy(self):
+		v = Vector.__new__(Vector)
+		v._v = list(self._v)
+		return v
+
+	def to_tuple(self, precision=-1):
+		if precision == -1:
+			return tuple(self._v)
+		return tuple(round(c, precision) for c in self._v)
+
+	def to_3d(self):
+		return Vector((self._v + [0.0, 0.0, 0.0])[:3])
+
+	def to_4d(self):
+		return Vector((self._v + [0.0, 0.0, 0.0])[:3] + [1.0])
+
+
+class Color(Vector):
+	__slots__ = ()
+
+	def _get(i):
+		def getter(self):
+			return self._v[i]
+
+		def setter(self, value):
+			self._v[i] = _f32(float(value))
+		return property(getter, setter)
+
+	r = _get(0)
+	g = _get(1)
+	b = _get(2)
+	del _get
+
+	def __add__(self, other):
+		return Color([a + b for a, b in zip(self._v, other)])
+
+	def copy(self):
+		return Color(self._v)
+
+
+class Euler(Vector):
+	__slots__ = ("order",)
+
+	def __init__(self, seq=(0.0, 0.0, 0.0), order='XYZ'):
+		Vector.__init__(self, seq)
+		self.order = order
+
+	def to_matrix(self):
+		x, y, z = self._v
+		return (Matrix.Rotation(z, 3, 'Z') * Matrix.Rotation(y, 3, 'Y') *
+				Matrix.Rotation(x, 3, 'X'))
+
+	def copy(self):
+		return Euler(self._v, self.order)
+
+
+class Quaternion(object):
+	__slots__ = ("w", "x", "y", "z")
+
+	def __init__(self, seq=(1.0, 0.0, 0.0, 0.0)):
+		self.w, self.x, self.y, self.z = [_f32(float(c)) for c in seq]
+
+	def __iter__(self):
+		return iter((self.w, self.x, self.y, self.z))
+
+	def __getitem__(self, index):
+		return (self.w, self.x, self.y, self.z)[index]
+
+	def __setitem__(self, index, value):
+		setattr(self, "wxyz"[index], _f32(float(value)))
+
+	def __len__(self):
+		return 4
+
+	def to_matrix(self):
+		w, x, y, z = self.w, self.x, self.y, self.z
+		return Matrix((
+			(1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - w * z), 2.0 * (x * z + w * y)),
+			(2.0 * (x * y + w * z), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - w * x)),
+			(2.0 * (x * z - w * y), 2.0 * (y * z + w * x), 1.0 - 2.0 * (x * x + y * y))))
+
+	def to_euler(self, order='XYZ', compat=None):
+		return self.to_matrix().to_euler(order, compat)
+
+	def normalized(self):
+		length = math.sqrt(self.w ** 2 + self.x ** 2 + self.y ** 2 + self.z ** 2)
+		if length == 0.0:
+			return Quaternion()
+		return Quaternion((self.w / length, self.x / length, self.y / length, self.z / length))
+
+
+class Matrix(object):
+	__slots__ = ("_rows",)
+
+	def __init__(self, rows=None):
+		if rows is None:
+			rows = [[1.0 if r == c else 0.0 for c in range(4)] for r in range(4)]
+		self._rows = [Vector(row) for row in rows]
+
+	@property
+	def _cols(self):
+		return len(self._rows[0])
+
+	@classmethod
+	def Identity(cls, size):
+		return cls([[1.0 if r == c else 0.0 for c in range(size)] for r in range(size)])
+
+	@classmethod
+	def Rotation(cls, angle, size, axis):
+		c = math.cos(angle)
+		s = math.sin(angle)
+		if isinstance(axis, str):
+			if axis == 'X':
+				m = [[1.0, 0.0, 0.0], [0.0, c, -s], [0.0, s, c]]
+			elif axis == 'Y':
+				m = [[c, 0.0, s], [0.0, 1.0, 0.0], [-s, 0.0, c]]
+			else:
+				m = [[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]]
+		else:
+			x, y, z = Vector(axis).normalized()
+			t = 1.0 - c
+			m = [[t * x * x + c, t * x * y - s * z, t * x * z + s * y],
+				 [t * x * y + s * z, t * y * y + c, t * y * z - s * x],
+				 [t * x * z - s * y, t * y * z + s * x, t * z * z + c]]
+		mat = cls(m)
+		if size == 4:
+			return mat.to_4x4()
+		return mat
+
+	@classmethod
+	def Translation(cls, vec):
+		mat = cls()
+		for i in range(3):
+			mat._rows[i][3] = vec[i]
+		return mat
+
+	@classmethod
+	def Scale(cls, factor, size, axis=None):
+		mat = cls.Identity(size)
+		for i in range(min(size, 3)):
+			mat._rows[i][i] = factor
+		return mat
+
+	def __len__(self):
+		return len(self._rows)
+
+	def __iter__(self):
+		return iter(self._rows)
+
+	def __getitem__(self, index):
+		return self._rows[index]
+
+	def __repr__(self):
+		return "Matrix(%r)" % ([r[:] for r in self._rows],)
+
+	def __eq__(self, other):
+		return isinstance(other, Matrix) and all(a == b for a, b in zip(self._rows, other._rows))
+
+	__hash__ = None
+
+	def copy(self):
+		return Matrix([r[:] for r in self._rows])
+
+	def __mul__(self, other):
+		if isinstance(other, Matrix):
+			rows = len(self._rows)
+			inner = other._cols
+			return Matrix([[sum(self._rows[r][k] * other._rows[k][c] for k in range(len(other._rows)))
+					for c in range(inner)] for r in range(rows)])
+		if isinstance(other, (int, float)):
+			return Matrix([[c * other for c in r] for r in self._rows])
+		# matrix * vector (handles 3d vectors with 4x4 matrices)
+		vec = list(other)
+		size = len(self._rows)
+		if len(vec) == 3 and size == 4:
+			vec = vec + [1.0]
+			res = [sum(self._rows[r][k] * vec[k] for k in range(4)) for r in range(3)]
+			return Vector(res)
+		return Vector([sum(self._rows[r][k] * vec[k] for k in range(len(vec))) for r in range(size)])
+
+	def transposed(self):
+		return Matrix([[self._rows[r][c] for r in range(len(self._rows))] for c in range(self._cols)])
+
+	def to_3x3(self):
+		return Matrix([[self._rows[r][c] for c in range(3)] for r in range(3)])
+
+	def to_4x4(self):
+		if len(self._rows) == 4:
+			return self.copy()
+		rows = [list(self._rows[r][:]) + [0.0] for r in range(3)]
+		rows.append([0.0, 0.0, 0.0, 1.0])
+		return Matrix(rows)
+
+	def to_translation(self):
+		return Vector((self._rows[0][3], self._rows[1][3], self._rows[2][3]))
+
+	def to_scale(self):
+		m = self.to_3x3()
+		cols = m.transposed()
+		return Vector([c.length for c in cols])
+
+	@property
+	def median_scale(self):
+		s = self.to_scale()
+		return (s[0] + s[1] + s[2]) / 3.0
+
+	def determinant(self):
+		m = [r[:] for r in self._rows]
+		n = len(m)
+		det = 1.0
+		for i in range(n):
+			pivot = max(range(i, n), key=lambda r: abs(m[r][i]))
+			if abs(m[pivot][i]) < 1.0e-30:
+				return 0.0
+			if pivot != i:
+				m[i], m[pivot] = m[pivot], m[i]
+				det = -det
+			det *= m[i][i]
+			for r in range(i + 1, n):
+				f = m[r][i] / m[i][i]
+				m[r] = [a - f * b for a, b in zip(m[r], m[i])]
+		return det
+
+	def inverted(self):
+		n = len(self._rows)
+		m = [list(r[:]) + [1.0 if i == j else 0.0 for j in range(n)] for i, r in enumerate(self._rows)]
+		for i in range(n):
+			pivot = max(range(i, n), key=lambda r: abs(m[r][i]))
+			if abs(m[pivot][i]) < 1.0e-30:
+				return Matrix.Identity(n)
+			m[i], m[pivot] = m[pivot], m[i]
+			p = m[i][i]
+			m[i] = [a / p for a in m[i]]
+			for r in range(n):
+				if r != i:
+					f = m[r][i]
+					if f:
+						m[r] = [a - f * b for a, b in zip(m[r], m[i])]
+		return Matrix([r[n:] for r in m])
+
+	def normalized(self):
+		cols = self.to_3x3().transposed()
+		return Matrix([c.normalized()[:] for c in cols]).transposed()
+
+	def to_quaternion(self):
+		m = self.to_3x3().normalized()
+		tr = m[0][0] + m[1][1] + m[2][2]
+		if tr > 0.0:
+			s = math.sqrt(tr + 1.0) * 2.0
+			w = 0.25 * s
+			x = (m[2][1] - m[1][2]) / s
+			y = (m[0][2] - m[2][0]) / s
+			z = (m[1][0] - m[0][1]) / s
+		elif m[0][0] > m[1][1] and m[0][0] > m[2][2]:
+			s = math.sqrt(1.0 + m[0][0] - m[1][1] - m[2][2]) * 2.0
+			w = (m[2][1] - m[1][2]) / s
+			x = 0.25 * s
+			y = (m[0][1] + m[1][0]) / s
+			z = (m[0][2] + m[2][0]) / s
+		elif m[1][1] > m[2][2]:
+			s = math.sqrt(1.0 + m[1][1] - m[0][0] - m[2][2]) * 2.0
+			w = (m[0][2] - m[2][0]) / s
+			x = (m[0][1] + m[1][0]) / s
+			y = 0.25 * s
+			z = (m[1][2] + m[2][1]) / s
+		else:
+			s = math.sqrt(1.0 + m[2][2] - m[0][0] - m[1][1]) * 2.0
+			w = (m[1][0] - m[0][1]) / s
+			x = (m[0][2] + m[2][0]) / s
+			y = (m[1][2] + m[2][1]) / s
+			z = 0.25 * s
+		return Quaternion((w, x, y, z)).normalized()
+
+	def decompose(self):
+		loc = self.to_translation()
+		scale = self.to_scale()
+		rot = self.to_quaternion()
+		return loc, rot, scale
+
+	def to_euler(self, order='XYZ', compat=None):
+		m = self.to_3x3().normalized()
+		cy = math.hypot(m[0][0], m[1][0])
+		if cy > 16.0 * 1.0e-7:
+			eul1 = (math.atan2(m[2][1], m[2][2]), math.atan2(-m[2][0], cy), math.atan2(m[1][0], m[0][0]))
+			eul2 = (math.atan2(-m[2][1], -m[2][2]), math.atan2(-m[2][0], -cy), math.atan2(-m[1][0], -m[0][0]))
+		else:
+			eul1 = eul2 = (math.atan2(-m[1][2], m[1][1]), math.atan2(-m[2][0], cy), 0.0)
+
+		if compat is not None:
+			eul1 = _compatible_eul(eul1, compat)
+			eul2 = _compatible_eul(eul2, compat)
+			d1 = sum(abs(a - b) for a, b in zip(eul1, compat))
+			d2 = sum(abs(a - b) for a, b in zip(eul2, compat))
+		else:
+			d1 = sum(abs(a) for a in eul1)
+			d2 = sum(abs(a) for a in eul2)
+		return Euler(eul1 if d1 <= d2 else eul2, order)
+
+
+def _compatible_eul(eul, oldrot):
+	eul = list(eul)
+	for i in range(3):
+		dif = eul[i] - oldrot[i]
+		while dif > math.pi:
+			eul[i] -= 2.0 * math.pi
+			dif = eul[i] - oldrot[i]
+		while dif < -math.pi:
+			eul[i] += 2.0 * math.pi
+			dif = eul[i] - oldrot[i]
+	return eul
@@ -14,10 +14,13 @@ bl_info = {
 
 import bpy
 import sys
+import time
+from bpy.app.handlers import persistent
 
 from . import export_menu
 from . import editorfunctions
 from . import import_normals
+from . import export_eval_cache
 
 ##########################
 # Editor:
@@ -45,11 +48,11 @@ class vertex_normals_panel(bpy.types.Panel):
 		# check if editor tab should be visible
 		showeditor = False
 		if context.window_manager.edit_splitnormals:
-			if 'polyn_meshdata' in context.active_object:
-				if len(editorfunctions.normals_data.cust_normals_ppoly) == len(context.active_object.polyn_meshdata):
+			if editorfunctions.normals_data.has_saved(context.active_object, True):
+				if len(editorfunctions.normals_data.cust_normals_ppoly) == editorfunctions.normals_data.saved_count(context.active_object, True):
 					showeditor = True
-		elif 'vertexn_meshdata' in context.active_object:
-			if len(editorfunctions.normals_data.cust_normals_pvertex) == len(context.active_object.vertexn_meshdata):
+		elif editorfunctions.normals_data.has_saved(context.active_object, False):
+			if len(editorfunctions.normals_data.cust_normals_pvertex) == editorfunctions.normals_data.saved_count(context.active_object, False):
 				showeditor = True
 			
 		if showeditor:
@@ -67,14 +70,28 @@ class vertex_normals_panel(bpy.types.Panel):
 				box2.row().operator('object.reset_polydata', text='Reset')
 				box2.row().operator('object.clear_polydata', text='Clear')
 				
+				row = box2.row(align=True)
+				row.operator('object.undo_customnormals', text='Undo')
+				row.operator('object.redo_customnormals', text='Redo')
+				box2.row().prop(context.window_manager,'vn_undo_memory',
+						text='Undo Memory (MB)')
+				
 				box2.row().prop(context.window_manager,'convert_splitnormals',
 						text='Convert on Switch')
+				if context.window_manager.convert_splitnormals:
+					box2.row().prop(context.window_manager,'convert_weighting',
+							text='Poly to Vertex')
 				box2.row().operator('object.switch_normalsmode', 
 						text='Switch Mode')
 				
 				box2.row().operator('object.display_normalsonmesh', 
 						text='Apply to Mesh')
 				
+				if context.mode == "OBJECT":
+					row = box2.row(align=True)
+					row.operator('object.batch_reset_polydata', text='Reset Selected')
+					row.operator('object.batch_display_normalsonmesh', text='Apply Selected')
+				
 				if 'vertex_normal_list' in context.active_object:
 					box2.row().operator('object.copy_normals_recalcvertexnormals', 
 							text='Copy from RVN')
@@ -102,6 +119,10 @@ class vertex_normals_panel(bpy.types.Panel):
 					box2.row().prop(context.window_manager, 
 							'vn_genselectiononly',
 							text='Selected Only')
+					if (genmode == 'AREA' or genmode == 'ANGLE') and context.window_manager.edit_splitnormals:
+						box2.row().prop(context.window_manager, 
+								'vn_gensplitsharp',
+								text='Split Sharp Edges')
 					
 					if usingMontBuild or not context.window_manager.edit_splitnormals:
 						box2.row().column().prop(context.window_manager,
@@ -120,6 +141,12 @@ class vertex_normals_panel(bpy.types.Panel):
 						'vn_genmode', text='')
 				box2.row().operator('object.generate_vnormals',
 						text='Generate')
+				
+				if context.mode == "OBJECT":
+					box2.row().operator('object.batch_generate_vnormals',
+							text='Generate Selected')
+					box2.row().prop(context.window_manager,
+							'vn_batch_workers', text='Workers')
 			
 			# Transfer Normals
 			box = layout.box()
@@ -128,30 +155,28 @@ class vertex_normals_panel(bpy.types.Panel):
 			if context.window_manager.vnpanel_showtransnormals:
 				if context.mode == "OBJECT":
 					box2 = box.box()
-					if "object_transfervertexnorms" in context.user_preferences.addons.keys():
-						box2.row().prop_search(context.window_manager, 
-								"normtrans_sourceobj", 
-								context.scene, 
-								"objects", 
-								"Source",
-								"Source",
-								False,
-								'MESH_CUBE')
-						box2.row().prop(context.window_manager,
-								'normtrans_influence', 
-								text='Influence')
-						box2.row().prop(context.window_manager,
-								'normtrans_maxdist', 
-								text='Distance')
-						box2.row().prop(context.window_manager,
-								'normtrans_bounds', 
-								text='Bounds')
-						box2.row().operator('object.transfer_normalstoobj',
-								text='Transfer Normals')
-					else:
-						box2.row().label(
-								"Transfer Vertex Normals Addon required",
-								'NONE')
+					box2.row().prop_search(context.window_manager, 
+							"normtrans_sourceobj", 
+							context.scene, 
+							"objects", 
+							"Source",
+							"Source",
+							False,
+							'MESH_CUBE')
+					box2.row().prop(context.window_manager,
+							'normtrans_influence', 
+							text='Influence')
+					box2.row().prop(context.window_manager,
+							'normtrans_maxdist', 
+							text='Distance')
+					box2.row().prop(context.window_manager,
+							'normtrans_samples', 
+							text='Samples')
+					box2.row().prop(context.window_manager,
+							'normtrans_bounds', 
+							text='Bounds')
+					box2.row().operator('object.transfer_normalstoobj',
+							text='Transfer Normals')
 					
 				else:
 					box.box().row().label("Object Mode required", 'NONE')
@@ -212,11 +237,7 @@ class vertex_normals_panel(bpy.types.Panel):
 			if context.window_manager.vnpanel_showmeshdata:
 				box.row().operator('object.reset_polydata', text='Initialize')
 				# load saved normals from data if it exists
-				if context.window_manager.edit_splitnormals:
-					if 'polyn_meshdata' in context.active_object:
-						box.row().operator('object.load_polydata',
-								text='Load')
-				elif 'vertexn_meshdata' in context.active_object:
+				if editorfunctions.normals_data.has_saved(context.active_object, context.window_manager.edit_splitnormals):
 					box.row().operator('object.load_polydata', text='Load')
 
 
@@ -246,6 +267,40 @@ class reset_polydata(bpy.types.Operator):
 		return {'FINISHED'}
 
 
+# step through the normals' own edit history
+class undo_customnormals(bpy.types.Operator):
+	bl_idname = 'object.undo_customnormals'
+	bl_label = 'Undo Normals Edit'
+	bl_description = 'Revert the last edit of the custom normals'
+	# has its own history
+	
+	@classmethod
+	def poll(cls, context):
+		if context.active_object != None and editorfunctions.owns_history(context):
+			return len(editorfunctions.current_store(context).history.undo_steps) > 0
+		return False
+	
+	def execute(self, context):
+		editorfunctions.undo_normals(context)
+		return {'FINISHED'}
+
+
+class redo_customnormals(bpy.types.Operator):
+	bl_idname = 'object.redo_customnormals'
+	bl_label = 'Redo Normals Edit'
+	bl_description = 'Repeat the last undone edit of the custom normals'
+	
+	@classmethod
+	def poll(cls, context):
+		if context.active_object != None and editorfunctions.owns_history(context):
+			return len(editorfunctions.current_store(context).history.redo_steps) > 0
+		return False
+	
+	def execute(self, context):
+		editorfunctions.undo_normals(context, True)
+		return {'FINISHED'}
+
+
 # delete data
 class clear_polydata(bpy.types.Operator):
 	bl_idname = 'object.clear_polydata'
@@ -266,10 +321,8 @@ class clear_polydata(bpy.types.Operator):
 		if len(editorfunctions.normals_data.cust_normals_pvertex) > 0:
 			editorfunctions.normals_data.cust_normals_pvertex.clear()
 		
-		if 'polyn_meshdata' in context.active_object:
-			del context.active_object['polyn_meshdata']
-		if 'vertexn_meshdata' in context.active_object:
-			del context.active_object['vertexn_meshdata']
+		editorfunctions.normals_data.pending_commit = None
+		editorfunctions.normals_data.clear_object(context.active_object)
 		
 		return {'FINISHED'}
 
@@ -434,6 +487,65 @@ class display_normalsonmesh(bpy.types.Operator):
 		return {'FINISHED'}
 
 
+# batch versions of generate / reset / display for all selected meshes
+class batch_generate_vnormals(bpy.types.Operator):
+	bl_idname = 'object.batch_generate_vnormals'
+	bl_label = 'Generate Normals (Selected)'
+	bl_description = 'Generate normals for all selected meshes'
+	bl_options = {'REGISTER', 'UNDO'}
+	
+	@classmethod
+	def poll(cls, context):
+		if context.mode == 'OBJECT':
+			return len(editorfunctions.batch_objects(context)) > 0
+		return False
+	
+	def execute(self, context):
+		objects = editorfunctions.batch_objects(context)
+		t = time.time()
+		editorfunctions.batch_generate(context, objects)
+		self.report({'INFO'}, "Generated normals for %i objects in %.2f seconds" % (len(objects), time.time() - t))
+		return {'FINISHED'}
+
+
+class batch_reset_polydata(bpy.types.Operator):
+	bl_idname = 'object.batch_reset_polydata'
+	bl_label = 'Create Normals Data (Selected)'
+	bl_description = 'Recreate normals data for all selected meshes'
+	bl_options = {'REGISTER', 'UNDO'}
+	
+	@classmethod
+	def poll(cls, context):
+		if context.mode == 'OBJECT':
+			return len(editorfunctions.batch_objects(context)) > 0
+		return False
+	
+	def execute(self, context):
+		objects = editorfunctions.batch_objects(context)
+		editorfunctions.batch_reset(context, objects)
+		self.report({'INFO'}, "Reset normals of %i objects" % len(objects))
+		return {'FINISHED'}
+
+
+class batch_display_normalsonmesh(bpy.types.Operator):
+	bl_idname = 'object.batch_display_normalsonmesh'
+	bl_label = 'Display Normals (Selected)'
+	bl_description = 'Applies the saved normals of all selected meshes'
+	bl_options = {'REGISTER', 'UNDO'}
+	
+	@classmethod
+	def poll(cls, context):
+		if context.mode == 'OBJECT':
+			return len(editorfunctions.batch_objects(context)) > 0
+		return False
+	
+	def execute(self, context):
+		objects = editorfunctions.batch_objects(context)
+		applied = editorfunctions.batch_display(context, objects)
+		self.report({'INFO'}, "Applied normals to %i of %i objects" % (applied, len(objects)))
+		return {'FINISHED'}
+
+
 # 	switch between poly and vertex mode
 class switch_normalsmode(bpy.types.Operator):
 	bl_idname = 'object.switch_normalsmode'
@@ -458,7 +570,7 @@ class switch_normalsmode(bpy.types.Operator):
 		return {'FINISHED'}
 
 
-# bridge to transfer vertex normals addon
+# transfer normals from another object (or between boundary vertices)
 class transfer_normalstoobj(bpy.types.Operator):
 	bl_idname = 'object.transfer_normalstoobj'
 	bl_label = 'Transfer'
@@ -471,7 +583,7 @@ class transfer_normalstoobj(bpy.types.Operator):
 			if not context.window_manager.edit_splitnormals:
 				if context.window_manager.normtrans_bounds == 'ONLY':
 					return True
-				elif context.window_manager.normtrans_sourceobj != "":
+				elif context.window_manager.normtrans_sourceobj in context.scene.objects:
 					return context.scene.objects[
 						context.window_manager.normtrans_sourceobj
 						].type == 'MESH'
@@ -532,6 +644,25 @@ def initdefaults():
 	types.WindowManager.convert_splitnormals = bpy.props.BoolProperty(
 			default=False,
 			description="Convert current normals on mode switch")
+	types.WindowManager.convert_weighting = bpy.props.EnumProperty(
+			name="Weighting",
+			description='How the normals of a vertex\'s loops are merged when converting to vertex mode',
+			items=(
+				('FIRST', 
+					'First Loop', 
+					"Use the normal of the vertex's first loop"),
+				('AVERAGE', 
+					'Average', 
+					"Average the normals of the vertex's loops"),
+				('ANGLE', 
+					'Angle Weighted', 
+					"Weight each loop's normal by its corner angle"),
+				('AREA', 
+					'Area Weighted', 
+					"Weight each loop's normal by its polygon's area"),
+				),
+			default='FIRST',
+			)
 	# generate
 	types.WindowManager.vn_genmode = bpy.props.EnumProperty(
 			name="Mode",
@@ -553,6 +684,14 @@ def initdefaults():
 					"Calculate normals based on mesh's face normals. " + 
 					"Close to default, but also allows generating normals " +
 					"for selected surfaces."),
+				('AREA', 
+					'Area Weighted', 
+					"Average the face normals around each vertex, " + 
+					"weighted by face area"),
+				('ANGLE', 
+					'Angle Weighted', 
+					"Average the face normals around each vertex, " + 
+					"weighted by the face's corner angle"),
 				('DEFAULT', 
 					'Smooth (Default)', 
 					"Use default normals generated by Blender"),
@@ -562,6 +701,9 @@ def initdefaults():
 	types.WindowManager.vn_genselectiononly = bpy.props.BoolProperty(
 			default=False,
 			description='Generate normals for selected vertices only')
+	types.WindowManager.vn_gensplitsharp = bpy.props.BoolProperty(
+			default=False,
+			description='Keep faces separated by sharp edges apart (poly mode)')
 	types.WindowManager.vn_genignorehidden = bpy.props.BoolProperty(
 			default=False,
 			description='Ignore hidden faces')
@@ -572,6 +714,13 @@ def initdefaults():
 			default=(0.0,0.0,-1.0),subtype='TRANSLATION')
 	types.WindowManager.vn_dirvector = bpy.props.FloatVectorProperty(
 			default=(0.0,0.0,1.0),subtype='TRANSLATION',max=1.0,min=-1.0)
+	types.WindowManager.vn_undo_memory = bpy.props.IntProperty(
+			default=64, min=1, max=4096,
+			description='Memory (MB) the undo history of the custom normals may use',
+			update=editorfunctions.set_history_limit)
+	types.WindowManager.vn_batch_workers = bpy.props.IntProperty(
+			default=1, min=1, max=64,
+			description='Threads generating normals for selected meshes, 1 generates everything on the main thread')
 	types.WindowManager.vn_settomeshongen = bpy.props.BoolProperty(
 			default=True,
 			description='Update mesh normals with the generated result')
@@ -612,6 +761,9 @@ def initdefaults():
 			description='Transfer distance, 0 for infinite',
 			subtype='DISTANCE',unit='LENGTH',
 			min=0.0,max=sys.float_info.max,soft_max=20.0,default=0.01)
+	types.WindowManager.normtrans_samples = bpy.props.IntProperty(
+			description='Source vertices to interpolate between, 1 for the nearest only',
+			min=1,max=16,default=1)
 	types.WindowManager.normtrans_bounds = bpy.props.EnumProperty(
 			name='Boundary Edges',
 			description='Management for single-face edges.',
@@ -636,13 +788,13 @@ def initdefaults():
 
 
 def clearvars():
-	props = ['edit_splitnormals','convert_splitnormals','vn_genmode',
-	'vn_genselectiononly','vn_genignorehidden','vn_genbendingratio',
-	'vn_centeroffset','vn_dirvector','vn_settomeshongen','vn_realtimeedit',
+	props = ['edit_splitnormals','convert_splitnormals','convert_weighting','vn_genmode',
+	'vn_genselectiononly','vn_gensplitsharp','vn_genignorehidden','vn_genbendingratio',
+	'vn_centeroffset','vn_dirvector','vn_undo_memory','vn_batch_workers','vn_settomeshongen','vn_realtimeedit',
 	'vn_changeasone','vn_selected_face','vn_curnormal_disp',
 	'showing_vnormals','vndisp_selectiononly','vn_disp_scale',
 	'vn_displaycolor','normtrans_sourceobj','normtrans_influence',
-	'normtrans_maxdist','normtrans_bounds','vnpanel_showmeshdata',
+	'normtrans_maxdist','normtrans_samples','normtrans_bounds','vnpanel_showmeshdata',
 	'vnpanel_showautogen','vnpanel_showmanualedit',
 	'vnpanel_showtransnormals','vnpanel_showdisplay']
 	
@@ -658,6 +810,32 @@ def clearvars():
 	editorfunctions.cleanup_datavars()
 
 
+# normals saved in the old property groups are repacked when a file is opened
+@persistent
+def migrate_normalsdata(dummy):
+	editorfunctions.normals_data.pending_commit = None
+	for ob in bpy.data.objects:
+		if ob.type == 'MESH' and not ob.library:
+			editorfunctions.normals_data.migrate_object(ob)
+
+
+# realtime edits are saved after a short pause, and before the file is written
+@persistent
+def commit_normalsdata(dummy):
+	editorfunctions.commit_pending()
+
+
+@persistent
+def flush_normalsdata(dummy):
+	editorfunctions.commit_pending(True)
+
+
+# evaluated meshes kept by the exporter belong to the file being closed
+@persistent
+def free_evalcache(dummy):
+	export_eval_cache.free_shared_eval_cache()
+
+
 def exportmenu_func(self, context):
 	self.layout.operator(export_menu.ExportFBX.bl_idname,
 						text="FBX Custom (.fbx)")
@@ -678,6 +856,8 @@ def register():
 	bpy.utils.register_class(reset_polydata)
 	bpy.utils.register_class(load_polydata)
 	bpy.utils.register_class(clear_polydata)
+	bpy.utils.register_class(undo_customnormals)
+	bpy.utils.register_class(redo_customnormals)
 	bpy.utils.register_class(switch_normalsmode)
 	# Editor Panel
 	bpy.utils.register_class(vertex_normals_panel)
@@ -686,12 +866,19 @@ def register():
 	bpy.utils.register_class(generate_vnormals)
 	bpy.utils.register_class(show_vertexnormals)
 	bpy.utils.register_class(display_normalsonmesh)
+	bpy.utils.register_class(batch_generate_vnormals)
+	bpy.utils.register_class(batch_reset_polydata)
+	bpy.utils.register_class(batch_display_normalsonmesh)
 	
 	bpy.utils.register_class(transfer_normalstoobj)
 	bpy.utils.register_class(copy_normals_recalcvertexnormals)
 	
 	bpy.types.INFO_MT_file_export.append(exportmenu_func)
 	bpy.types.INFO_MT_file_import.append(importmenu_func)
+	bpy.app.handlers.load_post.append(migrate_normalsdata)
+	bpy.app.handlers.scene_update_post.append(commit_normalsdata)
+	bpy.app.handlers.save_pre.append(flush_normalsdata)
+	bpy.app.handlers.load_pre.append(free_evalcache)
 	
 	initdefaults()
 
@@ -701,6 +888,8 @@ def unregister():
 	bpy.utils.unregister_class(reset_polydata)
 	bpy.utils.unregister_class(load_polydata)
 	bpy.utils.unregister_class(clear_polydata)
+	bpy.utils.unregister_class(undo_customnormals)
+	bpy.utils.unregister_class(redo_customnormals)
 	bpy.utils.unregister_class(switch_normalsmode)
 	
 	# Export/Import:
@@ -712,6 +901,9 @@ def unregister():
 	bpy.utils.unregister_class(generate_vnormals)
 	bpy.utils.unregister_class(show_vertexnormals)
 	bpy.utils.unregister_class(display_normalsonmesh)
+	bpy.utils.unregister_class(batch_generate_vnormals)
+	bpy.utils.unregister_class(batch_reset_polydata)
+	bpy.utils.unregister_class(batch_display_normalsonmesh)
 	bpy.utils.unregister_class(vertex_normals_panel)
 	# Mesh Data
 	bpy.utils.unregister_class(vert_data)
@@ -722,7 +914,16 @@ def unregister():
 	
 	bpy.types.INFO_MT_file_export.remove(exportmenu_func)
 	bpy.types.INFO_MT_file_import.remove(importmenu_func)
-	
+	if migrate_normalsdata in bpy.app.handlers.load_post:
+		bpy.app.handlers.load_post.remove(migrate_normalsdata)
+	if commit_normalsdata in bpy.app.handlers.scene_update_post:
+		bpy.app.handlers.scene_update_post.remove(commit_normalsdata)
+	if flush_normalsdata in bpy.app.handlers.save_pre:
+		bpy.app.handlers.save_pre.remove(flush_normalsdata)
+	if free_evalcache in bpy.app.handlers.load_pre:
+		bpy.app.handlers.load_pre.remove(free_evalcache)
+	
+	export_eval_cache.free_shared_eval_cache()
 	clearvars()
 
 
@@ -4,10 +4,14 @@ import bpy
 import bmesh
 import bgl
 import math
-from mathutils import Vector
-import sys
+import time
+import hashlib
+from mathutils import Vector, kdtree
+
+import numpy as np
 
 from . import normals_data
+from . import normals_generate
 
 
 
@@ -23,17 +27,8 @@ def in_distance(p1, p2, checkdist):
 def generate_newnormals(self, context):
 	genmode = context.window_manager.vn_genmode
 	me = context.active_object.data
-	bm = bmesh.new()
-	
-	if context.mode == 'EDIT_MESH':
-		bm = bmesh.from_edit_mesh(me)
-	else:
-		bm.from_mesh(me)
-	
-	me.update()
-	
-	faces_list = [f for f in bm.faces]
-	verts_list = [v for v in bm.verts]
+	store = current_store(context)
+	store.begin_edit()
 	
 	# DEFAULT: Blender default
 	if (genmode == 'DEFAULT'):
@@ -41,193 +36,120 @@ def generate_newnormals(self, context):
 		
 		if wasobjmode:
 			bpy.ops.object.mode_set(mode='EDIT')
-			bm = bmesh.from_edit_mesh(me)
-			me.update()
-			faces_list = [f for f in bm.faces]
-			verts_list = [v for v in bm.verts]
+		
+		bm = bmesh.from_edit_mesh(me)
+		me.update()
+		faces_list = [f for f in bm.faces]
+		verts_list = [v for v in bm.verts]
 		
 		bpy.ops.mesh.normals_make_consistent()
 		
 		if context.window_manager.edit_splitnormals:
-			normals_data.cust_normals_ppoly.clear()
-			for i in range(len(faces_list)):
-				faceverts = [v for v in faces_list[i].verts]
-				normals_data.cust_normals_ppoly.append([])
-				for j in range(len(faceverts)):
-					normals_data.cust_normals_ppoly[len(normals_data.cust_normals_ppoly) - 1].append(faceverts[j].normal.copy())
+			normals_data.cust_normals_ppoly.set_loops(
+				[v.normal[:] for f in faces_list for v in f.verts], [len(f.verts) for f in faces_list])
 		else:
-			normals_data.cust_normals_pvertex.clear()
-			for i in range(len(verts_list)):
-				normals_data.cust_normals_pvertex.append(verts_list[i].normal.copy())
+			normals_data.cust_normals_pvertex.set_vertices([v.normal[:] for v in verts_list])
 		
 		if wasobjmode:
 			bpy.ops.object.mode_set(mode='OBJECT')
+	else:
+		generate_arraynormals(context, genmode)
 	
-	# UPVECT: custom direction
-	elif (genmode == 'UPVECT'):
-		if context.window_manager.edit_splitnormals:
-			if context.window_manager.vn_genselectiononly:
-				for i in range(len(normals_data.cust_normals_ppoly)):
-					for j in range(len(normals_data.cust_normals_ppoly[i])):
-						if faces_list[i].verts[j].select:
-							normals_data.cust_normals_ppoly[i][j] = Vector(context.window_manager.vn_dirvector)
-			else:
-				for i in range(len(normals_data.cust_normals_ppoly)):
-					for j in range(len(normals_data.cust_normals_ppoly[i])):
-						normals_data.cust_normals_ppoly[i][j] = Vector(context.window_manager.vn_dirvector)
-		else:
-			if context.window_manager.vn_genselectiononly:
-				for i in range(len(verts_list)):
-					if verts_list[i].select:
-						normals_data.cust_normals_pvertex[i] = Vector(context.window_manager.vn_dirvector)
-			else:
-				for i in range(len(verts_list)):
-					normals_data.cust_normals_pvertex[i] = Vector(context.window_manager.vn_dirvector)
-	
-	# BENT: Bent from point (3D cursor)
-	elif (genmode == 'BENT'):
-		cursorloc = context.scene.cursor_location
-		if context.window_manager.edit_splitnormals:
-			if context.window_manager.vn_genselectiononly:
-				for i in range(len(normals_data.cust_normals_ppoly)):
-					for j in range(len(normals_data.cust_normals_ppoly[i])):
-						if not (faces_list[i].hide) and faces_list[i].select:
-							tempv = Vector(faces_list[i].verts[j].co) - cursorloc
-							tempv = tempv.normalized()
-							normals_data.cust_normals_ppoly[i][j] = tempv.copy()
-			else:
-				for i in range(len(faces_list)):
-					for j in range(len(faces_list[i].verts)):
-						tempv = Vector(vd.vpos) - cursorloc
-						tempv = tempv.normalized()
-						normals_data.cust_normals_ppoly[i][j] = tempv.copy()
-		else:
-			if context.window_manager.vn_genselectiononly:
-				for i in range(len(verts_list)):
-					if verts_list[i].select:
-						tempv = Vector(verts_list[i].co) - cursorloc
-						tempv = tempv.normalized()
-						tempv = (normals_data.cust_normals_pvertex[i] * (1.0 - context.window_manager.vn_genbendingratio)) + (tempv * (context.window_manager.vn_genbendingratio))
-						normals_data.cust_normals_pvertex[i] = tempv
-			else:
-				for i in range(len(verts_list)):
-					tempv = Vector(verts_list[i].co) - cursorloc
-					tempv = tempv.normalized()
-					tempv = (normals_data.cust_normals_pvertex[i] * (1.0 - context.window_manager.vn_genbendingratio)) + (tempv * (context.window_manager.vn_genbendingratio))
-					normals_data.cust_normals_pvertex[i] = tempv
-	
-	# G_FOLIAGE: combination of bent and up-vector for ground foliage
-	elif (genmode == 'G_FOLIAGE'):
-		ignorehidden = context.window_manager.vn_genignorehidden
-		cursorloc = Vector(context.window_manager.vn_centeroffset)
-		if context.window_manager.edit_splitnormals:
-			for i in range(len(faces_list)):
-				ignoreface = False
-				if ignorehidden:
-					if faces_list[i].hide:
-						ignoreface = True
-				for j in range(len(faces_list[i].verts)):
-					if faces_list[i].verts[j].select:
-						if not ignoreface:
-							normals_data.cust_normals_ppoly[i][j] = Vector((0.0,0.0,1.0))
-					else:	
-						if not ignoreface:
-							tempv = faces_list[i].verts[j].co - cursorloc
-							normals_data.cust_normals_ppoly[i][j] = tempv.normalized()
-		else:
-			for i in range(len(verts_list)):
-				if ignorehidden:
-					if not verts_list[i].hide:
-						if verts_list[i].select:
-							normals_data.cust_normals_pvertex[i] = Vector((0.0,0.0,1.0))
-						else:
-							tempv = verts_list[i].co - cursorloc
-							normals_data.cust_normals_pvertex[i] = tempv.normalized()
-				else:
-					if verts_list[i].select:
-						normals_data.cust_normals_pvertex[i] = Vector((0.0,0.0,1.0))
-					else:
-						tempv = verts_list[i].co - cursorloc
-						normals_data.cust_normals_pvertex[i] = tempv.normalized()
-	
-	# CUSTOM: generate for selected faces independently from mesh (or for the whole mesh)
-	# - based on existing face nomals, so the mesh requires faces
-	# - seems to be weighted by mesh topology when used in poly mode
-	#   - number of intersecting edges on connected face influences the direction
-	elif (genmode == 'CUSTOM'):
-		if context.window_manager.edit_splitnormals:
-			for i in range(len(faces_list)):
-				f = faces_list[i]
-				if context.window_manager.vn_genselectiononly:
-					if f.select:
-						for j in range(len(f.verts)):
-							fncount = 0
-							tempfvect = Vector((0.0,0.0,0.0))
-							if f.verts[j].select:
-								for vf in f.verts[j].link_faces:
-									if vf.select:
-										fncount += 1
-										tempfvect = tempfvect + vf.normal
-								if fncount > 0:
-									normals_data.cust_normals_ppoly[i][j] = (tempfvect / float(fncount)).normalized()
-				else:
-					for j in range(len(f.verts)):
-						fncount = len(f.verts[j].link_faces)
-						tempfvect = Vector((0.0,0.0,0.0))
-						for vf in f.verts[j].link_faces:
-							tempfvect = tempfvect + vf.normal
-						normals_data.cust_normals_ppoly[i][j] = (tempfvect / float(fncount)).normalized()
-		else:
-			for i in range(len(verts_list)):
-				v = verts_list[i]
-				if context.window_manager.vn_genselectiononly:
-					if v.select:
-						fncount = 0
-						tempfvect = Vector((0.0,0.0,0.0))
-						for j in range(len(v.link_faces)):
-							if v.link_faces[j].select:
-								fncount += 1
-								tempfvect = tempfvect + v.link_faces[j].normal
-						if fncount > 0:
-							normals_data.cust_normals_pvertex[i] = (tempfvect / float(fncount)).normalized()
-				else:
-					fncount = len(v.link_faces)
-					tempfvect = Vector((0.0,0.0,0.0))
-					for j in range(len(v.link_faces)):
-						tempfvect = tempfvect + v.link_faces[j].normal
-					normals_data.cust_normals_pvertex[i] = (tempfvect / float(fncount)).normalized()
-				
+	# the modes above edit the whole array, everything is saved
+	store.mark_dirty()
+	store.end_edit()
 	save_normalsdata(context)
 	
 	if (hasattr(context.active_object.data, "define_normals_split_custom") or not context.window_manager.edit_splitnormals) and context.window_manager.vn_settomeshongen:
 		set_meshnormals(context)
 
 
+# UPVECT, BENT, G_FOLIAGE, CUSTOM, AREA and ANGLE modes, computed for all normals at once
+# - mesh data is read with foreach_get into a job (generation_job), the
+#   numbers are done by normals_generate.generate_rows
+# - rows: loops in poly mode, vertices in vertex mode
+def generate_arraynormals(context, genmode):
+	wm = context.window_manager
+	ob = context.active_object
+	if context.mode == 'EDIT_MESH':
+		# update_from_editmode is new in 2.79, toggling writes the edit mesh back before that
+		if hasattr(ob, "update_from_editmode"):
+			ob.update_from_editmode()
+		else:
+			bpy.ops.object.mode_set(mode='OBJECT')
+			bpy.ops.object.mode_set(mode='EDIT')
+
+	if wm.edit_splitnormals:
+		store = normals_data.cust_normals_ppoly
+	else:
+		store = normals_data.cust_normals_pvertex
+	fit_store(ob.data, store, wm.edit_splitnormals)
+	
+	store.record()
+	normals_generate.generate_rows(generation_job(context, ob.data, store.normals, genmode))
+
+
+# resets store to me's vertex normals if it doesn't match the mesh
+def fit_store(me, store, split):
+	if split:
+		if len(store.normals) != len(me.loops):
+			loop_verts, face_sizes = normals_data.mesh_loops(me)
+			store.set_loops(normals_data.read_vectors(me.vertices, "normal")[loop_verts], face_sizes)
+	elif len(store.normals) != len(me.vertices):
+		store.set_vertices(normals_data.read_vectors(me.vertices, "normal"))
+
+
+# reads what generate_rows needs for genmode from me
+# - rows: the normals to write into, in the current mode's layout
+def generation_job(context, me, rows, genmode):
+	wm = context.window_manager
+	split = wm.edit_splitnormals
+	loop_verts, face_sizes = normals_data.mesh_loops(me)
+	job = {
+		"mode": genmode,
+		"split": split,
+		"rows": rows,
+		"co": normals_data.read_vectors(me.vertices, "co").astype(np.float64),
+		"vert_select": normals_data.read_flags(me.vertices, "select"),
+		"loop_verts": loop_verts,
+		"face_sizes": face_sizes,
+		"selection_only": wm.vn_genselectiononly,
+		"ignore_hidden": wm.vn_genignorehidden,
+		"split_sharp": wm.vn_gensplitsharp,
+		"dirvector": tuple(wm.vn_dirvector),
+		"cursor": np.array(context.scene.cursor_location),
+		"center": np.array(wm.vn_centeroffset),
+		"bend_ratio": wm.vn_genbendingratio,
+	}
+	if genmode in ('BENT', 'CUSTOM', 'G_FOLIAGE'):
+		job["face_select"] = normals_data.read_flags(me.polygons, "select")
+		job["face_hide"] = normals_data.read_flags(me.polygons, "hide")
+		job["vert_hide"] = normals_data.read_flags(me.vertices, "hide")
+	if genmode in ('CUSTOM', 'AREA', 'ANGLE'):
+		job["face_normals"] = normals_data.read_vectors(me.polygons, "normal").astype(np.float64)
+	if genmode == 'AREA':
+		job["face_areas"] = normals_data.read_areas(me)
+	if genmode in ('AREA', 'ANGLE') and split and wm.vn_gensplitsharp:
+		job["loop_edges"], job["edge_sharp"] = normals_data.read_loop_edges(me)
+	return job
+
+
 # create new normals list
 def reset_normals(context):
 	me = context.active_object.data
 	me.update()
 	
+	vert_normals = normals_data.read_vectors(me.vertices, "normal")
 	if context.window_manager.edit_splitnormals:
-		normals_data.cust_normals_ppoly.clear()
-		faces_list = [f for f in me.polygons]
-		verts_list = [v.normal for v in me.vertices]
-		
-		for f in faces_list:
-			normals_data.cust_normals_ppoly.append([])
-			for j in f.vertices:
-				normals_data.cust_normals_ppoly[len(normals_data.cust_normals_ppoly) - 1].append(verts_list[j].copy())
+		loop_verts, face_sizes = normals_data.mesh_loops(me)
+		normals_data.cust_normals_ppoly.set_loops(vert_normals[loop_verts], face_sizes)
 		
 		if context.window_manager.convert_splitnormals and len(normals_data.cust_normals_pvertex) > 0:
 			convert_pvertextoppoly(context)
 		
 		normals_data.cust_normals_pvertex.clear()
 	else:
-		normals_data.cust_normals_pvertex.clear()
-		verts_list = [v.normal for v in me.vertices]
-		
-		for j in range(len(verts_list)):
-			normals_data.cust_normals_pvertex.append(verts_list[j].copy())
+		normals_data.cust_normals_pvertex.set_vertices(vert_normals)
 		
 		if context.window_manager.convert_splitnormals and len(normals_data.cust_normals_ppoly) > 0:
 			convert_ppolytopvertex(context)
@@ -238,63 +160,101 @@ def reset_normals(context):
 
 
 # load normals from saved data
+# - normals saved in the old property groups are repacked on the way
 def load_normalsdata(context):
+	ob = context.active_object
+	me = ob.data
+	commit_pending(True)
+	normals_data.migrate_object(ob)
 	if context.window_manager.edit_splitnormals:
-		me = context.active_object.data
-		if len(context.active_object.polyn_meshdata) == len(me.polygons):
-			normals_data.cust_normals_ppoly.clear()
-			for f in context.active_object.polyn_meshdata:
-				normals_data.cust_normals_ppoly.append([])
-				for v in f.vdata:
-					normals_data.cust_normals_ppoly[len(normals_data.cust_normals_ppoly) - 1].append(v.vnormal.copy())
+		if normals_data.saved_count(ob, True) == len(me.polygons):
+			normals_data.read_object(ob, True, normals_data.cust_normals_ppoly)
 	else:
-		me = context.active_object.data
-		if len(context.active_object.vertexn_meshdata) == len(me.vertices):
-			normals_data.cust_normals_pvertex.clear()
-			for v in context.active_object.vertexn_meshdata:
-				normals_data.cust_normals_pvertex.append(v.vnormal.copy())
-	
+		if normals_data.saved_count(ob, False) == len(me.vertices):
+			normals_data.read_object(ob, False, normals_data.cust_normals_pvertex)
+
+
+# the store edited in the current mode
+def current_store(context):
+	if context.window_manager.edit_splitnormals:
+		return normals_data.cust_normals_ppoly
+	return normals_data.cust_normals_pvertex
+
+
+# the history holds the edits of the object that last loaded / saved the store
+def owns_history(context):
+	return context.active_object is not None and current_store(context).owner == context.active_object.name
+
+
+# steps back / forward through the current store's edits
+# - redo: False to undo
+def undo_normals(context, redo=False):
+	store = current_store(context)
+	if not owns_history(context):
+		return False
+	if redo:
+		applied = store.redo()
+	else:
+		applied = store.undo()
+	if applied:
+		save_normalsdata(context)
+		if (hasattr(context.active_object.data, "define_normals_split_custom") or not context.window_manager.edit_splitnormals) and context.window_manager.vn_settomeshongen:
+			set_meshnormals(context)
+	return applied
+
+
+# vn_undo_memory changed
+def set_history_limit(self, context):
+	normals_data.history_bytes = context.window_manager.vn_undo_memory * 1024 * 1024
+	for store in (normals_data.cust_normals_ppoly, normals_data.cust_normals_pvertex):
+		store.history.max_bytes = normals_data.history_bytes
+		store.history.trim()
 
 
+# saves the rows changed since the last save
 def save_normalsdata(context):
+	normals_data.pending_commit = None
 	if context.window_manager.edit_splitnormals:
-		if 'vertexn_meshdata' in context.active_object:
-			del context.active_object['vertexn_meshdata']
-		if 'polyn_meshdata' not in context.active_object:
-			context.active_object['polyn_meshdata'] = []
-		context.active_object.polyn_meshdata.clear()
-		
-		for f in normals_data.cust_normals_ppoly:
-			newface = context.active_object.polyn_meshdata.add()
-			for v in f:
-				newvert = newface.vdata.add()
-				newvert.vnormal = v.copy()
+		normals_data.commit_object(context.active_object, normals_data.cust_normals_ppoly)
 	else:
-		if 'polyn_meshdata' in context.active_object:
-			del context.active_object['polyn_meshdata']
-		if 'vertexn_meshdata' not in context.active_object:
-			context.active_object['vertexn_meshdata'] = []
-		context.active_object.vertexn_meshdata.clear()
-		
-		for v in normals_data.cust_normals_pvertex:
-			newdata = context.active_object.vertexn_meshdata.add()
-			newdata.vnormal = v.copy()
-	
+		normals_data.commit_object(context.active_object, normals_data.cust_normals_pvertex)
+
+
+# realtime edits are saved once the value was left alone for commit_delay seconds
+# - commit_pending runs on scene updates, force saves right away
+commit_delay = 0.3
+
+def request_commit(context):
+	normals_data.pending_commit = (context.active_object.name, context.window_manager.edit_splitnormals)
+	normals_data.pending_time = time.time()
+
+
+def commit_pending(force=False):
+	if normals_data.pending_commit is None:
+		return
+	if not force and time.time() - normals_data.pending_time < commit_delay:
+		return
+	obname, split = normals_data.pending_commit
+	normals_data.pending_commit = None
+	ob = bpy.data.objects.get(obname)
+	if ob is not None:
+		if split:
+			normals_data.commit_object(ob, normals_data.cust_normals_ppoly)
+		else:
+			normals_data.commit_object(ob, normals_data.cust_normals_pvertex)
 
 
 # converts per poly normals list to per vertex
+# - loops are merged as set by convert_weighting, unused vertices keep theirs
 def convert_ppolytopvertex(context):
 	me = context.active_object.data
-	#bm = bmesh.from_edit_mesh(me)
-	#me.update()
+	loop_verts, face_sizes = normals_data.mesh_loops(me)
 	
-	faces_list = [f for f in me.polygons]
-	used_indices = []
-	for i in range(len(faces_list)):
-		for j in range(len(faces_list[i].vertices)):
-			if faces_list[i].vertices[j] not in used_indices:
-				normals_data.cust_normals_pvertex[faces_list[i].vertices[j]] = normals_data.cust_normals_ppoly[i][j].copy()
-				used_indices.append(faces_list[i].vertices[j])
+	weights = normals_data.loop_weights(me, context.window_manager.convert_weighting, loop_verts, face_sizes)
+	
+	normals_data.cust_normals_pvertex.record()
+	normals_data.cust_normals_ppoly.vertex_normals(loop_verts, normals_data.cust_normals_pvertex.normals, weights)
+	normals_data.cust_normals_pvertex.mark_dirty()
 	
 	return True
 
@@ -302,13 +262,12 @@ def convert_ppolytopvertex(context):
 # converts per vertex normals list to per poly
 def convert_pvertextoppoly(context):
 	me = context.active_object.data
-	#bm = bmesh.from_edit_mesh(me)
-	#me.update()
+	loop_verts, face_sizes = normals_data.mesh_loops(me)
 	
-	faces_list = [f for f in me.polygons]
-	for i in range(len(faces_list)):
-		for j in range(len(faces_list[i].vertices)):
-			normals_data.cust_normals_ppoly[i][j] = normals_data.cust_normals_pvertex[faces_list[i].vertices[j]].copy()
+	store = normals_data.cust_normals_ppoly
+	store.record()
+	store.normals[:] = normals_data.cust_normals_pvertex.loop_normals(loop_verts)
+	store.mark_dirty()
 	
 	return True
 
@@ -318,31 +277,41 @@ def convert_pvertextoppoly(context):
 
 def vn_set_auto(self, context):
 	if context.window_manager.vn_realtimeedit:
-		vn_set_manual(context)
+		vn_set_manual(context, True)
 
 
 # set selected vertices' normals to manual edit var
-def vn_set_manual(context):
+# - debounce: save later with commit_pending, used while a value is dragged
+def vn_set_manual(context, debounce=False):
 	me = context.active_object.data
 	bm = bmesh.from_edit_mesh(me)
+	store = current_store(context)
+	store.begin_edit()
 	
 	if context.window_manager.edit_splitnormals:
 		faces_list = [f for f in bm.faces]
 		for i in range(len(faces_list)):
 			if faces_list[i].select:
 				if context.window_manager.vn_changeasone:
-					for j in range(len(faces_list[i].verts)):
-						normals_data.cust_normals_ppoly[i][j] = Vector(context.window_manager.vn_curnormal_disp)
+					normals_data.cust_normals_ppoly[i] = Vector(context.window_manager.vn_curnormal_disp)
 				else:
 					if context.window_manager.vn_selected_face < len(faces_list[i].verts):
 						if faces_list[i].verts[context.window_manager.vn_selected_face].select:
+							normals_data.cust_normals_ppoly.record(i)
 							normals_data.cust_normals_ppoly[i][context.window_manager.vn_selected_face] = Vector(context.window_manager.vn_curnormal_disp)
+							normals_data.cust_normals_ppoly.mark_dirty(i)
 	else:
 		verts_list = [v for v in bm.verts]
 		for i in range(len(verts_list)):
 			if verts_list[i].select:
 				normals_data.cust_normals_pvertex[i] = context.window_manager.vn_curnormal_disp
-	save_normalsdata(context)
+	
+	# realtime edits of the same selection are one undo step
+	store.end_edit(debounce)
+	if debounce:
+		request_commit(context)
+	else:
+		save_normalsdata(context)
 
 
 # get current normal for manual edit (first selected vertex):
@@ -369,35 +338,145 @@ def vn_get(context):
 				break
 
 
-# bridge to Transfer Vertex Normals addon
+# Transfer normals from another object:
+# - source vertices go in a kdtree (world space), kept in
+#   normals_data.transfer_sources until the source mesh or its transform change
+# - every target vertex takes the normal of its nearest source vertex (or the
+#   distance weighted normals of normtrans_samples vertices) within
+#   normtrans_maxdist, blended with its own by normtrans_influence
+# - bounds 'ONLY' averages the normals of the target's own boundary vertices
+#   that are within normtrans_maxdist of each other (closes seams)
+
+def matrix_array(matrix):
+	return np.array([row[:] for row in matrix], dtype=np.float64)
+
+
+def to_world(me, matrix):
+	'''	world space positions and normals of me's vertices '''
+	co = normals_data.read_vectors(me.vertices, "co").astype(np.float64)
+	normals = normals_data.read_vectors(me.vertices, "normal").astype(np.float64)
+	return co.dot(matrix[:3, :3].T) + matrix[:3, 3], normals_data.normalized_rows(normals.dot(np.linalg.inv(matrix[:3, :3])))
+
+
+def boundary_verts(me):
+	'''	(V,) bool, vertices on edges used by a single polygon '''
+	loop_edges = np.empty(len(me.loops), dtype=np.int32)
+	me.loops.foreach_get("edge_index", loop_edges)
+	edge_verts = np.empty(len(me.edges) * 2, dtype=np.int32)
+	me.edges.foreach_get("vertices", edge_verts)
+	uses = np.bincount(loop_edges, minlength=len(me.edges))
+	boundary = np.zeros(len(me.vertices), dtype=bool)
+	boundary[edge_verts.reshape(-1, 2)[uses == 1].ravel()] = True
+	return boundary
+
+
+def build_kdtree(co, indices):
+	tree = kdtree.KDTree(len(indices))
+	for i, p in zip(indices.tolist(), co[indices].tolist()):
+		tree.insert(p, i)
+	tree.balance()
+	return tree
+
+
+def transfer_source(ob, bounds):
+	'''	(kdtree, world space normals) of ob's vertices, cached per mesh state '''
+	me = ob.data
+	matrix = matrix_array(ob.matrix_world)
+	co, normals = to_world(me, matrix)
+	
+	h = hashlib.sha1(repr((me.name, bounds, len(me.edges), len(me.loops))).encode("utf8"))
+	h.update(co.data)
+	h.update(normals.data)
+	boundary = None
+	if bounds == 'IGNORE':
+		boundary = boundary_verts(me)
+		h.update(boundary.data)
+	key = h.hexdigest()
+	
+	cached = normals_data.transfer_sources.get(ob.name)
+	if cached is not None and cached[0] == key:
+		return cached[1], cached[2]
+	
+	if boundary is None:
+		indices = np.arange(len(co), dtype=np.int32)
+	else:
+		indices = np.flatnonzero(~boundary).astype(np.int32)
+	tree = build_kdtree(co, indices)
+	normals_data.transfer_sources[ob.name] = (key, tree, normals)
+	return tree, normals
+
+
+def find_nearest(tree, co, samples, maxdist):
+	'''	(V, samples) indices (-1 for none) and distances of the nearest tree
+		points within maxdist (0: any distance) of each row of co
+	'''
+	found = np.full((len(co), samples), -1, dtype=np.int64)
+	dists = np.full((len(co), samples), np.inf)
+	if samples == 1:
+		for i, p in enumerate(co.tolist()):
+			hit = tree.find(p)
+			if hit[1] is not None:
+				found[i, 0] = hit[1]
+				dists[i, 0] = hit[2]
+	else:
+		for i, p in enumerate(co.tolist()):
+			for j, hit in enumerate(tree.find_n(p, samples)):
+				found[i, j] = hit[1]
+				dists[i, j] = hit[2]
+	if maxdist > 0.0:
+		found[dists > maxdist] = -1
+	return found, dists
+
+
 def transfer_normals(self, context):
-	mod = sys.modules["object_transfervertexnorms"]
-	if context.window_manager.normtrans_influence != 0.0:
-		if context.window_manager.normtrans_bounds != 'ONLY':
-			tempobjstr = context.window_manager.normtrans_sourceobj
-			sourceobj = context.scene.objects[tempobjstr]
-			if sourceobj != context.active_object:
-				mod.transferVertexNormals(self, context, sourceobj,
-						[context.active_object],
-						context.window_manager.normtrans_influence,
-						context.window_manager.normtrans_maxdist,
-						context.window_manager.normtrans_bounds)
-		else:
-			mod.joinBoundaryVertexNormals(self, context, 
-						[context.active_object],
-						context.window_manager.normtrans_influence,
-						context.window_manager.normtrans_maxdist)
+	wm = context.window_manager
+	ob = context.active_object
+	me = ob.data
+	influence = wm.normtrans_influence
+	maxdist = wm.normtrans_maxdist
 	
-	normals_data.cust_normals_pvertex.clear()
-	me = context.active_object.data
-	verts_list = [v.normal for v in me.vertices]
+	store = normals_data.cust_normals_pvertex
+	if len(store.normals) != len(me.vertices):
+		store.set_vertices(normals_data.read_vectors(me.vertices, "normal"))
 	
-	for j in range(len(verts_list)):
-		normals_data.cust_normals_pvertex.append(verts_list[j].copy())
+	store.begin_edit()
+	if influence != 0.0:
+		matrix = matrix_array(ob.matrix_world)
+		co = normals_data.read_vectors(me.vertices, "co").astype(np.float64)
+		co = co.dot(matrix[:3, :3].T) + matrix[:3, 3]
+		current = normals_data.normalized_rows(store.normals.astype(np.float64).dot(np.linalg.inv(matrix[:3, :3])))
 	
+		if wm.normtrans_bounds != 'ONLY':
+			sourceobj = context.scene.objects[wm.normtrans_sourceobj]
+			if sourceobj == ob:
+				store.end_edit()
+				return
+			tree, source_normals = transfer_source(sourceobj, wm.normtrans_bounds)
+			found, dists = find_nearest(tree, co, wm.normtrans_samples, maxdist)
+			weights = np.where(found >= 0, 1.0 / np.maximum(dists, 1e-9), 0.0)
+			transferred = (source_normals[np.maximum(found, 0)] * weights[:, :, None]).sum(axis=1)
+			hit = found[:, 0] >= 0
+		else:
+			# boundary vertices closer than maxdist share their normals
+			hit = boundary_verts(me)
+			indices = np.flatnonzero(hit).astype(np.int32)
+			tree = build_kdtree(co, indices)
+			radius = maxdist if maxdist > 0.0 else 1e-5
+			transferred = np.zeros((len(co), 3), dtype=np.float64)
+			for i, p in zip(indices.tolist(), co[indices].tolist()):
+				near = [n[1] for n in tree.find_range(p, radius)]
+				transferred[i] = current[near].sum(axis=0)
+	
+		transferred = normals_data.normalized_rows(transferred)
+		blended = normals_data.normalized_rows(current * (1.0 - abs(influence)) + transferred * influence)
+		local = normals_data.normalized_rows(blended.dot(matrix[:3, :3]))
+		store.record()
+		store.normals[hit] = local[hit]
+		store.mark_dirty()
+	
+	store.end_edit()
 	save_normalsdata(context)
 	set_meshnormals(context)
-	
 
 
 # copy normals from adsn's addon to this one
@@ -406,9 +485,8 @@ def copy_fromadsn(context):
 		if 'vertex_normal_list' in context.active_object:
 			me = context.active_object.data
 			if len(context.active_object.vertex_normal_list) == len(me.vertices):
-				normals_data.cust_normals_pvertex.clear()
-				for v in context.active_object.vertex_normal_list:
-					normals_data.cust_normals_pvertex.append(Vector(v.normal))
+				normals_data.cust_normals_pvertex.set_vertices(
+					normals_data.read_vectors(context.active_object.vertex_normal_list, "normal"))
 				save_normalsdata(context)
 				set_meshnormals(context)
 	
@@ -444,9 +522,10 @@ def draw_vertex_normals(self, context):
 						for j in range(len(bm.faces[i].verts)):
 							draw_line(bm.faces[i].verts[j].co, normals_data.cust_normals_ppoly[i][j], scale)
 			else:
-				for i in range(len(me.polygons)):
-					for j in range(len(me.polygons[i].vertices)):
-						draw_line(me.vertices[me.polygons[i].vertices[j]].co, normals_data.cust_normals_ppoly[i][j], scale)
+				loop_verts, face_sizes = normals_data.mesh_loops(me)
+				loop_cos = normals_data.read_vectors(me.vertices, "co")[loop_verts]
+				for co, normal in zip(loop_cos.tolist(), normals_data.cust_normals_ppoly.normals.tolist()):
+					draw_line(co, normal, scale)
 		else:
 			normals_data.lastdisplaymesh = ''
 			context.window_manager.showing_vnormals = -1
@@ -459,8 +538,9 @@ def draw_vertex_normals(self, context):
 					if bm.verts[i].select:
 						draw_line(bm.verts[i].co, normals_data.cust_normals_pvertex[i], scale)
 			else:
-				for i in range(len(normals_data.cust_normals_pvertex)):
-					draw_line(me.vertices[i].co, normals_data.cust_normals_pvertex[i], scale)
+				vert_cos = normals_data.read_vectors(me.vertices, "co")
+				for co, normal in zip(vert_cos.tolist(), normals_data.cust_normals_pvertex.normals.tolist()):
+					draw_line(co, normal, scale)
 		else:
 			normals_data.lastdisplaymesh = ''
 			context.window_manager.showing_vnormals = -1
@@ -475,33 +555,146 @@ def set_meshnormals(context):
 			if len(normals_data.cust_normals_pvertex) > 0:
 				me = context.active_object.data
 				bm = bmesh.from_edit_mesh(me)
-				for i in range(len(bm.verts)):
-					bm.verts[i].normal = normals_data.cust_normals_pvertex[i]
+				for v, n in zip(bm.verts, normals_data.cust_normals_pvertex.normals.tolist()):
+					v.normal = n
 				context.area.tag_redraw()
 	elif context.mode == "OBJECT":
-		if hasattr(context.active_object.data, "define_normals_split_custom"):
-			me = context.active_object.data
-			me.create_normals_split()
+		me = context.active_object.data
+		store = current_store(context)
+		if hasattr(me, "define_normals_split_custom"):
+			apply_meshnormals(me, store)
+		elif len(store) > 0:
+			apply_meshnormals(me, store)
+			context.area.tag_redraw()
+
+
+# apply store's normals to me in object mode
+# - returns False if they don't fit the mesh or can't be shown (poly mode
+#   without custom split normals)
+def apply_meshnormals(me, store):
+	split = store.offsets is not None
+	if hasattr(me, "define_normals_split_custom"):
+		me.create_normals_split()
+		# validate only once per topology, it walks the whole mesh
+		key = normals_data.topology_key(me)
+		if normals_data.validated_meshes.get(me.name) != key:
 			me.validate()
-			if not context.window_manager.edit_splitnormals:
-				normalslist = tuple(tuple(v) for v in normals_data.cust_normals_pvertex)
+			key = normals_data.topology_key(me)
+			normals_data.validated_meshes[me.name] = key
+		if not split:
+			if len(store.normals) == len(me.vertices):
 				me.use_auto_smooth = True
 				me.free_normals_split()
-				me.define_normals_split_custom_from_vertices(normalslist)
-			else:
-				normalslist = ()
-				for f in normals_data.cust_normals_ppoly:
-					normalslist = normalslist + tuple(tuple(l) for l in f)
+				me.define_normals_split_custom_from_vertices(store.normals.tolist())
+				return True
+		else:
+			if len(store.normals) == len(me.loops):
 				me.use_auto_smooth = True
 				me.free_normals_split()
-				me.define_normals_split_custom(normalslist)
+				me.define_normals_split_custom(store.normals.tolist())
+				return True
+	elif not split and len(store.normals) == len(me.vertices):
+		me.vertices.foreach_set("normal", store.normals.ravel())
+		return True
+	return False
+
+
+##################################
+# Batch operations on all selected meshes:
+# - mesh data is read and written on the main thread, generation runs on
+#   normals_generate.generate_pool workers, a few objects per batch
+# - each object's saved normals for the current mode are used (its vertex
+#   normals if it has none) and saved back
+# - the editor reloads the active object's normals afterwards
+
+def batch_objects(context):
+	return [ob for ob in context.selected_objects if ob.type == 'MESH' and not ob.library]
+
+
+# store set to me's vertex normals
+def fill_store(me, store, split):
+	vert_normals = normals_data.read_vectors(me.vertices, "normal")
+	if split:
+		loop_verts, face_sizes = normals_data.mesh_loops(me)
+		store.set_loops(vert_normals[loop_verts], face_sizes)
+	else:
+		store.set_vertices(vert_normals)
+	return store
+
+
+def batch_store(ob, split):
+	store = normals_data.read_object(ob, split)
+	if store is None:
+		return fill_store(ob.data, normals_data.normals_store(), split)
+	fit_store(ob.data, store, split)
+	return store
+
+
+def batch_reload(context, objects):
+	if context.active_object in objects:
+		normals_data.cust_normals_ppoly.clear()
+		normals_data.cust_normals_pvertex.clear()
+		normals_data.read_object(context.active_object, context.window_manager.edit_splitnormals, current_store(context))
+
+
+# runs work(batch) for every batch of objects, reports progress
+def batch_run(context, objects, batch_size, work):
+	wm = context.window_manager
+	commit_pending(True)
+	wm.progress_begin(0, len(objects))
+	for start in range(0, len(objects), batch_size):
+		work(objects[start:start + batch_size])
+		wm.progress_update(min(len(objects), start + batch_size))
+	wm.progress_end()
+	batch_reload(context, objects)
+
+
+# generate with the Auto Generate settings
+# - Smooth (Default) uses the meshes' vertex normals as they are
+def batch_generate(context, objects):
+	wm = context.window_manager
+	split = wm.edit_splitnormals
+	genmode = wm.vn_genmode
+	pool = normals_generate.generate_pool(wm.vn_batch_workers)
+	
+	def work(batch):
+		if genmode == 'DEFAULT':
+			stores = [fill_store(ob.data, normals_data.normals_store(), split) for ob in batch]
 		else:
-			if not context.window_manager.edit_splitnormals:
-				if len(normals_data.cust_normals_pvertex) > 0:
-					me = context.active_object.data
-					for i in range(len(me.vertices)):
-						me.vertices[i].normal = normals_data.cust_normals_pvertex[i]
-					context.area.tag_redraw()
+			stores = [batch_store(ob, split) for ob in batch]
+			pool.generate([generation_job(context, ob.data, store.normals, genmode) for ob, store in zip(batch, stores)])
+		for ob, store in zip(batch, stores):
+			normals_data.write_object(ob, store)
+			if wm.vn_settomeshongen:
+				apply_meshnormals(ob.data, store)
+	
+	batch_run(context, objects, max(1, wm.vn_batch_workers * 2), work)
+	pool.close()
+
+
+def batch_reset(context, objects):
+	split = context.window_manager.edit_splitnormals
+	
+	def work(batch):
+		for ob in batch:
+			normals_data.write_object(ob, fill_store(ob.data, normals_data.normals_store(), split))
+	
+	batch_run(context, objects, 16, work)
+
+
+# returns the number of objects the normals were applied to
+def batch_display(context, objects):
+	split = context.window_manager.edit_splitnormals
+	applied = [0]
+	
+	def work(batch):
+		for ob in batch:
+			store = normals_data.read_object(ob, split)
+			if store is not None and apply_meshnormals(ob.data, store):
+				applied[0] += 1
+	
+	batch_run(context, objects, 16, work)
+	return applied[0]
 
 
 def cleanup_datavars():
@@ -0,0 +1,88 @@
+############################################################
+# Array formatting for the ASCII writer
+#
+# - formats whole (N, k) arrays in one go instead of one fw() per value
+# - output matches the old per-value loops exactly:
+#   items are separated by ',', every `wrap` rows the separator gets a
+#   line break + indent in front of the comma
+# - works on numpy arrays filled with foreach_get, lists of Vectors and
+#   flat lists of ints/floats
+# - unique_rows turns per corner layers into a table + index list for
+#   IndexToDirect layers, used by both writers
+#
+
+import numpy as np
+
+
+# number of values formatted per % call, keeps the template strings small
+chunk_values = 65536
+
+
+def format_array(values, fmt, wrap, sep):
+	'''	values: (N, k) or (N,) array or sequence
+		fmt: format for one row, e.g. '%.6f,%.6f,%.6f'
+		wrap: number of rows per line
+		sep: line break + indent written in front of the comma that starts a new line
+	'''
+	arr = np.asarray(values)
+	rows = len(arr)
+	if not rows:
+		return ''
+
+	row_size = arr.size // rows
+	flat = arr.ravel().tolist()
+
+	joiner = sep + ','
+	line_fmt = ','.join((fmt,) * wrap)
+	line_size = row_size * wrap
+	full_lines, rest = divmod(rows, wrap)
+
+	step = max(1, chunk_values // line_size)
+	chunks = []
+	for start in range(0, full_lines, step):
+		count = min(step, full_lines - start)
+		chunks.append(
+			joiner.join((line_fmt,) * count) % tuple(flat[start * line_size:(start + count) * line_size])
+		)
+	if rest:
+		chunks.append(','.join((fmt,) * rest) % tuple(flat[full_lines * line_size:]))
+
+	return joiner.join(chunks)
+
+
+def format_range(count, wrap, sep):
+	'''	0..count-1 as written for direct index lists (UVIndex, ColorIndex) '''
+	return format_array(np.arange(count), '%i', wrap, sep)
+
+
+def unique_rows(values):
+	'''	splits a per corner layer into IndexToDirect form
+		- returns (table, indices), table holds every distinct row once in
+		  order of first use and table[indices] equals values
+		- rows are compared by their bytes, so only exact duplicates merge
+	'''
+	arr = np.ascontiguousarray(values)
+	if not len(arr):
+		return arr, np.zeros(0, dtype=np.int32)
+
+	rows = arr.reshape(len(arr), -1)
+	keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+	keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+	# np.unique sorts by bytes, renumber to first use so the table reads like the mesh
+	order = np.argsort(first, kind='mergesort')
+	renumber = np.empty(len(order), dtype=np.int32)
+	renumber[order] = np.arange(len(order), dtype=np.int32)
+	return arr[first[order]], renumber[inverse.ravel()]
+
+
+def tessface_corner_mask(me_faces):
+	'''	(F, 4) bool array, True for the corners each tessface uses
+		- vertices_raw is 0 in the 4th slot for triangles, blender makes sure
+		  a quad's 4th vertex is never 0
+	'''
+	faceverts = np.empty(len(me_faces) * 4, dtype=np.int32)
+	me_faces.foreach_get("vertices_raw", faceverts)
+	mask = np.ones((len(me_faces), 4), dtype=bool)
+	mask[:, 3] = faceverts.reshape(-1, 4)[:, 3] != 0
+	return mask
@@ -0,0 +1,199 @@
+############################################################
+# On-disk cache for formatted ASCII mesh blocks
+#
+# - blocks are keyed by a sha1 of everything that goes into them: mesh
+#   data, Blender's split normals, custom normals lists, material/texture
+#   mapping, the already formatted Model header (name, transform, shape
+#   key names) and the export options
+# - one zlib compressed file per block, the file's mtime is its last use
+# - the cache is trimmed to max_size by removing the least recently used
+#   blocks when an export finishes
+#
+
+import os
+import zlib
+import hashlib
+import tempfile
+
+import numpy as np
+
+from . import normals_data
+
+
+# bump when the block format changes to invalidate old entries
+cache_format = 1
+
+cache_dir_default = os.path.join(tempfile.gettempdir(), "udk_fbx_tools_cache")
+cache_ext = ".blk"
+
+
+def _hash_array(h, collection, attr, count, dtype=np.float32):
+	values = np.empty(count, dtype=dtype)
+	collection.foreach_get(attr, values)
+	h.update(values.data)
+
+
+def _hash_vectors(h, vectors):
+	h.update(np.ascontiguousarray(vectors, dtype=np.float32).data)
+
+
+def mesh_key(my_mesh, head, options):
+	'''	sha1 hex digest for a mesh's block
+		- my_mesh: save_single's my_object_generic, blenData is the (evaluated) mesh
+		- head: the formatted Model header, covers object name + transform
+		- options: tuple of export settings that change the block
+	'''
+	me = my_mesh.blenData
+	ob = my_mesh.blenObject
+	h = hashlib.sha1()
+	h.update(repr((cache_format, options)).encode("utf8"))
+	h.update(head.encode("utf8"))
+
+	# geometry
+	h.update(repr((len(me.vertices), len(me.edges), len(me.loops), len(me.polygons), len(me.tessfaces))).encode())
+	_hash_array(h, me.vertices, "co", len(me.vertices) * 3)
+	_hash_array(h, me.edges, "vertices", len(me.edges) * 2, np.int32)
+	_hash_array(h, me.edges, "use_edge_sharp", len(me.edges), bool)
+	_hash_array(h, me.loops, "vertex_index", len(me.loops), np.int32)
+	_hash_array(h, me.polygons, "loop_start", len(me.polygons), np.int32)
+	_hash_array(h, me.polygons, "use_smooth", len(me.polygons), bool)
+	_hash_array(h, me.polygons, "material_index", len(me.polygons), np.int32)
+	_hash_array(h, me.tessfaces, "vertices_raw", len(me.tessfaces) * 4, np.int32)
+	_hash_array(h, me.tessfaces, "use_smooth", len(me.tessfaces), bool)
+	_hash_array(h, me.tessfaces, "material_index", len(me.tessfaces), np.int32)
+	h.update(repr((me.use_auto_smooth, me.auto_smooth_angle)).encode())
+
+	# Blender's split normals, exported in BLEND mode and whenever a custom
+	# list is missing, and used for DEFAULT tangents. They change without the
+	# vertices changing (custom split normals, Normal Edit / Data Transfer
+	# modifiers)
+	me.calc_normals_split()
+	_hash_array(h, me.loops, "normal", len(me.loops) * 3)
+	me.free_normals_split()
+
+	# uv + color layers, per loop and per tessface (empty unless tessellated)
+	for uvlayer, uvtexture in zip(me.uv_layers, me.uv_textures):
+		h.update(uvlayer.name.encode("utf8"))
+		_hash_array(h, uvlayer.data, "uv", len(uvlayer.data) * 2)
+		h.update(repr([f.image.name if f.image else None for f in uvtexture.data]).encode("utf8"))
+	for collayer in me.vertex_colors:
+		h.update(collayer.name.encode("utf8"))
+		_hash_array(h, collayer.data, "color", len(collayer.data) * 3)
+	for uvlayer in me.tessface_uv_textures:
+		h.update(uvlayer.name.encode("utf8"))
+		_hash_array(h, uvlayer.data, "uv_raw", len(uvlayer.data) * 8)
+		h.update(repr([f.image.name if f.image else None for f in uvlayer.data]).encode("utf8"))
+	for collayer in me.tessface_vertex_colors:
+		h.update(collayer.name.encode("utf8"))
+		for j in range(4):
+			_hash_array(h, collayer.data, "color%i" % (j + 1), len(collayer.data) * 3)
+
+	# materials + textures as mapped for this mesh
+	h.update(repr([(getattr(mat, "name", None), getattr(tex, "name", None))
+				   for mat, tex in my_mesh.blenMaterials]).encode("utf8"))
+	h.update(repr([getattr(mat, "name", None) for mat in my_mesh.blenMaterialList]).encode("utf8"))
+	h.update(repr([getattr(tex, "name", None) for tex in my_mesh.blenTextures]).encode("utf8"))
+
+	# shape keys
+	if ob.type == 'MESH' and ob.data.shape_keys:
+		for kb in ob.data.shape_keys.key_blocks:
+			h.update(kb.name.encode("utf8"))
+			_hash_array(h, kb.data, "co", len(kb.data) * 3)
+
+	# custom normals lists
+	mode = normals_data.saved_mode(ob)
+	if mode:
+		store = normals_data.read_object(ob, mode == 'POLY')
+		h.update(mode.encode())
+		_hash_vectors(h, store.normals)
+		if store.offsets is not None:
+			h.update(store.offsets.data)
+	if 'vertex_normal_list' in ob:
+		_hash_vectors(h, [vd.normal[:] for vd in ob.vertex_normal_list])
+
+	return h.hexdigest()
+
+
+class export_cache(object):
+	'''	least recently used, size bounded block store '''
+	__slots__ = ("path", "max_size", "hits", "misses", "evictions", "bytes_read", "bytes_written")
+
+	def __init__(self, path="", max_size=512 * 1024 * 1024):
+		self.path = path or cache_dir_default
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.bytes_read = 0
+		self.bytes_written = 0
+		os.makedirs(self.path, exist_ok=True)
+
+	def _file(self, key):
+		return os.path.join(self.path, key + cache_ext)
+
+	def get(self, key):
+		'''	cached block text or None '''
+		filepath = self._file(key)
+		try:
+			with open(filepath, "rb") as f:
+				data = f.read()
+			text = zlib.decompress(data).decode("utf8")
+		except (IOError, OSError, zlib.error, UnicodeDecodeError):
+			self.misses += 1
+			return None
+		# mark as recently used
+		try:
+			os.utime(filepath, None)
+		except OSError:
+			pass
+		self.hits += 1
+		self.bytes_read += len(data)
+		return text
+
+	def put(self, key, text):
+		data = zlib.compress(text.encode("utf8"), 1)
+		filepath = self._file(key)
+		tmppath = filepath + ".tmp"
+		try:
+			with open(tmppath, "wb") as f:
+				f.write(data)
+			os.replace(tmppath, filepath)
+		except (IOError, OSError) as e:
+			print("export cache: couldn't write %r (%s)" % (filepath, e))
+			return
+		self.bytes_written += len(data)
+
+	def trim(self):
+		'''	removes the least recently used blocks until the cache fits max_size '''
+		entries = []
+		total = 0
+		for name in os.listdir(self.path):
+			if not name.endswith(cache_ext):
+				continue
+			filepath = os.path.join(self.path, name)
+			try:
+				st = os.stat(filepath)
+			except OSError:
+				continue
+			entries.append((st.st_mtime, st.st_size, filepath))
+			total += st.st_size
+
+		entries.sort()
+		for mtime, size, filepath in entries:
+			if total <= self.max_size:
+				break
+			try:
+				os.remove(filepath)
+			except OSError:
+				continue
+			total -= size
+			self.evictions += 1
+		return total
+
+	def clear(self):
+		for name in os.listdir(self.path):
+			if name.endswith(cache_ext):
+				os.remove(os.path.join(self.path, name))
+
+	def stats(self):
+		return "cache: %i hits, %i misses, %i evicted" % (self.hits, self.misses, self.evictions)
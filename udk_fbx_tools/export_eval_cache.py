@@ -0,0 +1,280 @@
+############################################################
+# Evaluated mesh cache
+#
+# - keeps the meshes made by ob.to_mesh between exports and between the
+#   files of a batch export, so objects with unchanged modifier stacks
+#   are evaluated once
+# - keyed by a sha1 of the object's mesh data and shape keys, its
+#   modifier settings, the objects the modifiers point at (mesh, armature
+#   pose, curve and lattice data, transforms) and the current frame
+# - objects whose result depends on data the key doesn't cover (vertex
+#   group weights, textures, simulations, other object types) are
+#   evaluated every time
+# - meshes are found by name and carry their key in an id property, a
+#   mesh that was removed or came from another .blend is never reused
+# - only MESH objects are cached, curves/text/metaballs are evaluated
+#   every time
+#
+
+import hashlib
+
+import numpy as np
+
+import bpy
+
+from .export_cache import _hash_array
+
+
+key_prop = "udk_fbx_eval_key"
+
+
+class _unhashable(Exception):
+	'''	the evaluated mesh depends on data the key can't cover '''
+	pass
+
+
+def _hash_matrix(h, matrix):
+	h.update(np.array([row[:] for row in matrix], dtype=np.float32).data)
+
+
+def _hash_mesh(h, me):
+	h.update(repr((len(me.vertices), len(me.edges), len(me.loops), len(me.polygons))).encode())
+	_hash_array(h, me.vertices, "co", len(me.vertices) * 3)
+	_hash_array(h, me.edges, "vertices", len(me.edges) * 2, np.int32)
+	_hash_array(h, me.edges, "use_edge_sharp", len(me.edges), bool)
+	_hash_array(h, me.loops, "vertex_index", len(me.loops), np.int32)
+	_hash_array(h, me.polygons, "loop_start", len(me.polygons), np.int32)
+	_hash_array(h, me.polygons, "use_smooth", len(me.polygons), bool)
+	_hash_array(h, me.polygons, "material_index", len(me.polygons), np.int32)
+	for uvlayer, uvtexture in zip(me.uv_layers, me.uv_textures):
+		h.update(uvlayer.name.encode("utf8"))
+		_hash_array(h, uvlayer.data, "uv", len(uvlayer.data) * 2)
+		h.update(repr([f.image.name if f.image else None for f in uvtexture.data]).encode("utf8"))
+	for collayer in me.vertex_colors:
+		h.update(collayer.name.encode("utf8"))
+		_hash_array(h, collayer.data, "color", len(collayer.data) * 3)
+	h.update(repr([getattr(mat, "name", None) for mat in me.materials]).encode("utf8"))
+	h.update(repr((me.use_auto_smooth, me.auto_smooth_angle)).encode())
+
+
+def _hash_shape_keys(h, ob):
+	'''	shape keys of ob's mesh and how ob mixes them
+		- keys limited to a vertex group depend on weights, see _uses_weights
+	'''
+	key = ob.data.shape_keys
+	if not key:
+		return
+	h.update(repr((key.use_relative, ob.show_only_shape_key, ob.active_shape_key_index)).encode("utf8"))
+	for kb in key.key_blocks:
+		if kb.vertex_group:
+			raise _unhashable(kb.name)
+		h.update(repr((kb.name, kb.value, kb.mute, getattr(kb.relative_key, "name", None),
+				kb.slider_min, kb.slider_max, kb.interpolation)).encode("utf8"))
+		_hash_array(h, kb.data, "co", len(kb.data) * 3)
+
+
+def _hash_props(h, struct, seen):
+	'''	every plain property of struct, objects it points at are hashed
+		with _hash_object, other pointers can't be hashed
+	'''
+	for prop in struct.bl_rna.properties:
+		if prop.identifier == "rna_type":
+			continue
+		value = getattr(struct, prop.identifier, None)
+		if prop.type == 'POINTER':
+			if value is None:
+				pass
+			elif isinstance(value, bpy.types.Object):
+				if value.name not in seen:
+					seen.add(value.name)
+					_hash_object(h, value, seen)
+				value = value.name
+			else:
+				# textures, particle systems, simulation settings...
+				raise _unhashable(prop.identifier)
+		elif prop.type == 'COLLECTION':
+			continue
+		elif isinstance(value, (set, frozenset)):
+			value = tuple(sorted(value))
+		elif hasattr(value, "__len__") and not isinstance(value, str):
+			value = tuple(value)
+		h.update(repr((prop.identifier, value)).encode("utf8"))
+
+
+def _hash_curve(h, cu):
+	h.update(repr((cu.dimensions, cu.resolution_u, cu.twist_mode, cu.use_path,
+			cu.use_stretch, cu.use_deform_bounds, len(cu.splines))).encode("utf8"))
+	for spline in cu.splines:
+		h.update(repr((spline.type, spline.use_cyclic_u, spline.resolution_u, spline.order_u,
+				spline.use_endpoint_u, spline.use_bezier_u, len(spline.points), len(spline.bezier_points))).encode("utf8"))
+		if spline.type == 'BEZIER':
+			for attr in ("co", "handle_left", "handle_right"):
+				_hash_array(h, spline.bezier_points, attr, len(spline.bezier_points) * 3)
+			for attr in ("tilt", "radius"):
+				_hash_array(h, spline.bezier_points, attr, len(spline.bezier_points))
+		else:
+			_hash_array(h, spline.points, "co", len(spline.points) * 4)
+			for attr in ("tilt", "radius"):
+				_hash_array(h, spline.points, attr, len(spline.points))
+
+
+def _hash_lattice(h, lt):
+	h.update(repr((lt.points_u, lt.points_v, lt.points_w, lt.interpolation_type_u,
+			lt.interpolation_type_v, lt.interpolation_type_w, lt.use_outside)).encode("utf8"))
+	_hash_array(h, lt.points, "co_deform", len(lt.points) * 3)
+
+
+def _hash_object(h, ob, seen):
+	'''	state of an object a modifier points at '''
+	h.update(repr((ob.name, ob.type)).encode("utf8"))
+	_hash_matrix(h, ob.matrix_world)
+	if ob.type == 'ARMATURE':
+		h.update(repr(ob.data.pose_position).encode("utf8"))
+		if ob.pose:
+			for pbone in ob.pose.bones:
+				_hash_matrix(h, pbone.matrix)
+	elif ob.type == 'MESH':
+		_hash_mesh(h, ob.data)
+		_hash_shape_keys(h, ob)
+		for mod in ob.modifiers:
+			h.update(repr((mod.name, mod.type)).encode("utf8"))
+			_hash_props(h, mod, seen)
+	elif ob.type == 'CURVE':
+		_hash_curve(h, ob.data)
+	elif ob.type == 'LATTICE':
+		_hash_lattice(h, ob.data)
+	elif ob.type != 'EMPTY':
+		raise _unhashable(ob.type)
+
+
+def _uses_weights(mod):
+	'''	True if the modifier's result depends on vertex group weights
+		- an armature in rest position deforms nothing, its weights don't matter
+	'''
+	if mod.type == 'ARMATURE':
+		arm = mod.object
+		if arm is None or arm.data.pose_position == 'REST':
+			return False
+		return getattr(mod, "use_vertex_groups", True) or bool(getattr(mod, "vertex_group", ""))
+	if mod.type == 'MASK' and getattr(mod, "mode", None) == 'ARMATURE':
+		return True
+	for prop in mod.bl_rna.properties:
+		if prop.type == 'STRING' and prop.identifier.startswith("vertex_group"):
+			if getattr(mod, prop.identifier, ""):
+				return True
+	return False
+
+
+def eval_key(ob, scene, settings):
+	'''	sha1 hex digest for ob.to_mesh(scene, True, settings), None if the
+		result depends on data that isn't hashed
+		- Blender has no bulk access to vertex group weights, objects with
+		  modifiers or shape keys that use them are not cached
+	'''
+	h = hashlib.sha1()
+	h.update(repr((ob.name, ob.data.name, settings, scene.frame_current)).encode("utf8"))
+	_hash_mesh(h, ob.data)
+
+	seen = set([ob.name])
+	try:
+		_hash_shape_keys(h, ob)
+		for mod in ob.modifiers:
+			if _uses_weights(mod):
+				return None
+			h.update(repr((mod.name, mod.type)).encode("utf8"))
+			_hash_props(h, mod, seen)
+	except _unhashable:
+		return None
+
+	# the transform only matters relative to the objects modifiers point at
+	if len(seen) > 1:
+		_hash_matrix(h, ob.matrix_world)
+	return h.hexdigest()
+
+
+class eval_cache(object):
+	'''	least recently used store of evaluated meshes
+		- max_meshes: meshes kept when trim() is called, the rest are removed
+	'''
+	__slots__ = ("max_meshes", "entries", "clock", "hits", "misses", "evictions")
+
+	def __init__(self, max_meshes=32):
+		self.max_meshes = max_meshes
+		self.entries = {}  # key: [mesh name, last use]
+		self.clock = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def _lookup(self, key):
+		entry = self.entries.get(key)
+		if entry is None:
+			return None
+		me = bpy.data.meshes.get(entry[0])
+		if me is None or me.get(key_prop) != key:
+			del self.entries[key]
+			return None
+		return me
+
+	def to_mesh(self, ob, scene, settings='PREVIEW'):
+		'''	ob.to_mesh(scene, True, settings) or the mesh from an earlier call
+			- returns (mesh, cached), cached meshes belong to the cache and
+			  must not be removed by the caller
+		'''
+		if ob.type != 'MESH':
+			return ob.to_mesh(scene, True, settings, calc_tessface=False), False
+
+		key = eval_key(ob, scene, settings)
+		if key is None:
+			self.misses += 1
+			return ob.to_mesh(scene, True, settings, calc_tessface=False), False
+		self.clock += 1
+		me = self._lookup(key)
+		if me is not None:
+			self.hits += 1
+		else:
+			self.misses += 1
+			me = ob.to_mesh(scene, True, settings, calc_tessface=False)
+			me[key_prop] = key
+		self.entries[key] = [me.name, self.clock]
+		return me, True
+
+	def trim(self, max_meshes=None):
+		'''	removes the least recently used meshes past max_meshes '''
+		if max_meshes is None:
+			max_meshes = self.max_meshes
+		entries = sorted(self.entries.items(), key=lambda item: item[1][1])
+		for key, (name, used) in entries[:max(0, len(entries) - max_meshes)]:
+			me = self._lookup(key)
+			if me is not None and not me.users:
+				bpy.data.meshes.remove(me)
+			self.entries.pop(key, None)
+			self.evictions += 1
+
+	def clear(self):
+		self.trim(0)
+
+	def stats(self):
+		return "evaluated meshes: %i hits, %i misses, %i evicted" % (self.hits, self.misses, self.evictions)
+
+
+# one cache for the whole session, shared by every export
+_shared = None
+
+
+def shared_eval_cache(max_meshes):
+	global _shared
+	if _shared is None:
+		_shared = eval_cache(max_meshes)
+	_shared.max_meshes = max_meshes
+	return _shared
+
+
+def free_shared_eval_cache():
+	'''	removes the shared cache and its meshes (unregister, file load,
+		exports that don't use the cache)
+	'''
+	global _shared
+	if _shared is not None:
+		_shared.clear()
+		_shared = None
@@ -47,6 +47,8 @@ import os
 import time
 import math
 
+import numpy as np
+
 import bpy
 import bmesh
 from mathutils import Vector, Matrix
@@ -54,6 +56,14 @@ from mathutils import Vector, Matrix
 from bpy_extras.io_utils import axis_conversion
 
 from . import cust_tangents
+from . import normals_data
+from .export_mesh_data import (
+	mesh_arrays, face_materials, needs_tessfaces, shape_key_deltas, merge_color_layers,
+)
+from .export_mesh_ascii import mesh_format_pool
+from .export_cache import export_cache, mesh_key
+from .export_eval_cache import shared_eval_cache, free_shared_eval_cache
+from .export_profiler import export_profiler, profiler_off, profile_path
 
 # I guess FBX uses degrees instead of radians (Arystan).
 # Call this function just before writing to FBX.
@@ -226,6 +236,207 @@ def meshNormalizedWeights(ob, me):
 
 	return groupNames, vWeightList
 
+# Gathers the normals and tangents written for a mesh
+# - per face corner in the order of data's faces, as (N, 3) float32 arrays
+# - shared by the ascii and binary writers
+# - data is the mesh's export_mesh_data.mesh_arrays
+def get_mesh_shading(operator, me, meshobject, data, is_collision,
+		normals_export_mode, export_tangentspace_base, tangentspace_uvlnum, profiler=profiler_off):
+	# base lists for new features:
+	me_normals = []
+	me_tangents = []
+	me_binormals = []
+	
+	normalsmode = normals_export_mode
+	usedefaultnormals = False
+	export_tangents = False
+	
+	if not is_collision:
+		# check if tangents need to be exported and uv layer exists
+		if export_tangentspace_base != 'NONE':
+			if len(data.uv_layers) > tangentspace_uvlnum:
+				export_tangents = True
+		
+		# check if required data exists / autodetect if needed
+		if normalsmode == 'AUTO':
+			if normals_data.saved_mode(meshobject):
+				normalsmode = 'NORMEDIT'
+			elif 'vertex_normal_list' in meshobject:
+				normalsmode = 'RECALCVN'
+			else:
+				normalsmode = 'BLEND'
+				usedefaultnormals = True
+		elif normalsmode == 'NORMEDIT':
+			if not normals_data.has_saved(meshobject, bpy.context.window_manager.edit_splitnormals):
+				operator.report({'WARNING'}, "List not found")
+				usedefaultnormals = True
+		elif normalsmode == 'RECALCVN':
+			if 'vertex_normal_list' not in meshobject:
+				operator.report({'WARNING'}, "List not found")
+				usedefaultnormals = True
+		elif normalsmode == 'BLEND':
+			usedefaultnormals = True
+	else:
+		usedefaultnormals = True
+	
+	
+	#################
+	# Normals:
+	profiler.begin("normals")
+	if not usedefaultnormals:
+		# Included normals editor
+		if normalsmode == 'NORMEDIT':
+			# convert per vertex to per poly if needed
+			store = normals_data.read_object(meshobject, bpy.context.window_manager.edit_splitnormals)
+			if bpy.context.window_manager.edit_splitnormals:
+				if store is not None and len(store) == len(data.face_sizes) and np.array_equal(store.face_sizes(), data.face_sizes):
+					me_normals = store.loop_normals(data.polyverts)
+				else:
+					operator.report({'WARNING'}, "List size mismatch")
+					usedefaultnormals = True
+			else:
+				if store is not None and len(store) == len(data.vertcos):
+					me_normals = store.loop_normals(data.polyverts)
+				else:
+					operator.report({'WARNING'}, "List size mismatch")
+					usedefaultnormals = True
+			
+			
+		# adsn's Recalc Vertex Normals addon
+		elif normalsmode == 'RECALCVN':
+			if 'vertex_normal_list' in meshobject:
+				if len(meshobject.vertex_normal_list) == len(data.vertcos):
+					me_normals = data.corner_values(
+						[vn.normal[:] for vn in meshobject.vertex_normal_list]).reshape(-1, 3)
+				else:
+					operator.report({'WARNING'}, "List size mismatch")
+					usedefaultnormals = True
+	
+	
+	# Blender split vertex normals 
+	# - Default / fallback / Mont29 + Blender 2.74 custom normals
+	if usedefaultnormals:
+		me.calc_normals_split()
+		me_normals = np.empty(len(me.loops) * 3, dtype=np.float32)
+		me.loops.foreach_get("normal", me_normals)
+		me.free_normals_split()
+	
+	me_normals = np.asarray(me_normals, dtype=np.float32).reshape(-1, 3)
+	profiler.end("normals")
+	
+	
+	
+	##############################################################
+	# Tangents + Binormals:
+	profiler.begin("tangents")
+	if export_tangents:
+		# Blender Default - MikkTSpace (read from loops)
+		# - copy() because me_tangents is cleared by calc_normals_split
+		if export_tangentspace_base == 'DEFAULT':
+			if usedefaultnormals:
+				me.calc_normals_split()
+				me.calc_tangents(me.uv_layers[tangentspace_uvlnum].name)
+				
+				me_tangents = np.empty(len(me.loops) * 3, dtype=np.float32)
+				me_binormals = np.empty(len(me.loops) * 3, dtype=np.float32)
+				me.loops.foreach_get("tangent", me_tangents)
+				me.loops.foreach_get("bitangent", me_binormals)
+				
+				me.free_tangents()
+				me.free_normals_split()
+			else:
+				operator.report({'WARNING'}, "Default Tangents only work with Blender normals")
+				export_tangents = False
+			
+			
+		# Custom - modified Lengyel's method
+		elif export_tangentspace_base == 'LENGYEL':
+			t_uvlayer = [uvl for uvl in me.tessface_uv_textures[tangentspace_uvlnum].data]
+			
+			me_tangents, me_binormals = cust_tangents.build_initialtanlists(
+				me.tessfaces, me.vertices, t_uvlayer, [Vector(n) for n in me_normals.tolist()]
+			)
+		
+	
+	######################################
+	
+	me_tangents = np.asarray(me_tangents, dtype=np.float32).reshape(-1, 3)
+	me_binormals = np.asarray(me_binormals, dtype=np.float32).reshape(-1, 3)
+	profiler.end("tangents")
+	
+	return me_normals, me_tangents, me_binormals, export_tangents
+
+
+# Removes keys that lie on the line between their neighbours
+# - keys is a list of (value, frame) tuples, changed in place
+# - shared by the ascii and binary animation writers
+def reduce_anim_keys(keys, precision_float):
+	# last frame to fisrt frame, missing 1 frame on either side.
+	# removeing in a backwards loop is faster
+	j = len(keys) - 2
+	while j > 0 and len(keys) > 2:
+		# Is this key the same as the ones next to it?
+
+		# co-linear horizontal...
+		if		abs(keys[j][0] - keys[j - 1][0]) < precision_float and \
+				abs(keys[j][0] - keys[j + 1][0]) < precision_float:
+
+			del keys[j]
+
+		else:
+			frame_range = float(keys[j + 1][1] - keys[j - 1][1])
+			frame_range_fac1 = (keys[j + 1][1] - keys[j][1]) / frame_range
+			frame_range_fac2 = 1.0 - frame_range_fac1
+
+			if abs(((keys[j - 1][0] * frame_range_fac1 + keys[j + 1][0] * frame_range_fac2)) - keys[j][0]) < precision_float:
+				del keys[j]
+			else:
+				j -= 1
+
+		# keep the index below the list length
+		if j > len(keys) - 2:
+			j = len(keys) - 2
+
+	return keys
+
+
+# Collects formatted strings and writes them to the file in large blocks,
+# the array loops in save_single call fw() once per value which is slow
+# when each call goes straight to the file object
+class fbx_write_buffer(object):
+	__slots__ = ("file", "flush_size", "chunks", "pending", "bytes_written", "flush_count", "io_time")
+
+	def __init__(self, file, flush_size=1048576):
+		self.file = file  # opened in binary mode, text is encoded on flush
+		self.flush_size = max(1, flush_size)
+		self.chunks = []
+		self.pending = 0
+		self.bytes_written = 0
+		self.flush_count = 0
+		self.io_time = 0.0  # seconds spent encoding + writing
+
+	def write(self, data):
+		self.chunks.append(data)
+		self.pending += len(data)
+		if self.pending >= self.flush_size:
+			self.flush()
+
+	def flush(self):
+		if self.chunks:
+			t = time.perf_counter()
+			data = ''.join(self.chunks).encode("utf8")
+			self.file.write(data)
+			self.io_time += time.perf_counter() - t
+			self.bytes_written += len(data)
+			self.flush_count += 1
+			self.chunks = []
+			self.pending = 0
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+
 header_comment = \
 '''; FBX 6.1.0 project file
 ; Created by Blender FBX Exporter Customized
@@ -241,11 +452,18 @@ def save_single(operator, scene, filepath="",
 		object_types={'ARMATURE', 'MESH'},
 		global_scale=1.0,
 		use_mesh_modifiers=False,
+		use_instancing=True,
+		use_eval_cache=False,
+		eval_cache_size=32,
 		mesh_smooth_type='FACE',
 		normals_export_mode='AUTO',
 		export_tangentspace_base='NONE',
 		tangentspace_uvlnum=0,
 		merge_vertexcollayers=False,
+		vertexcol_merge_mode='ADD',
+		use_layer_dedup=True,
+		use_tessfaces=False,
+		use_shape_normals=False,
 		use_armature_deform_only=False,
 		use_anim=False,
 		use_anim_optimize=False,
@@ -253,6 +471,13 @@ def save_single(operator, scene, filepath="",
 		use_anim_action_all=False,
 		use_mesh_edges=False,
 		use_default_take=False,
+		write_buffer_size=1024,
+		fbx_format='ASCII61',
+		mesh_workers=1,
+		use_export_cache=False,
+		export_cache_dir="",
+		export_cache_size=512,
+		use_profile=False,
 	):
 	
 	import bpy_extras.io_utils
@@ -377,9 +602,12 @@ def save_single(operator, scene, filepath="",
 					 "blenObject",
 					 "blenData",
 					 "origData",
+					 "blenTessfaces",
 					 "blenTextures",
 					 "blenMaterials",
 					 "blenMaterialList",
+					 "blenFaceMaterials",
+					 "blenMatrix",
 					 "blenAction",
 					 "blenActionList",
 					 "fbxGroupNames",
@@ -387,6 +615,7 @@ def save_single(operator, scene, filepath="",
 					 "fbxBoneParent",
 					 "fbxBones",
 					 "fbxArm",
+					 "fbxGeometry",
 					 "matrixWorld",
 					 "__anim_poselist",
 					 )
@@ -399,9 +628,10 @@ def save_single(operator, scene, filepath="",
 			self.fbxParent = None  # set later on IF the parent is in the selection.
 			self.fbxArm = None
 			if matrixWorld:
-				self.matrixWorld = global_matrix * matrixWorld
+				self.blenMatrix = matrixWorld
 			else:
-				self.matrixWorld = global_matrix * ob.matrix_world
+				self.blenMatrix = ob.matrix_world
+			self.matrixWorld = global_matrix * self.blenMatrix
 
 			self.__anim_poselist = {}  # we should only access this
 
@@ -444,8 +674,12 @@ def save_single(operator, scene, filepath="",
 
 	print('\nFBX export starting... %r' % filepath)
 	start_time = time.clock()
+	profiler = export_profiler(use_profile)
 	try:
-		file = open(filepath, "w", encoding="utf8", newline="\n")
+		if fbx_format == 'BIN74':
+			file = open(filepath, "wb")
+		else:
+			file = fbx_write_buffer(open(filepath, "wb"), write_buffer_size * 1024)
 	except:
 		import traceback
 		traceback.print_exc()
@@ -458,47 +692,6 @@ def save_single(operator, scene, filepath="",
 	# scene = context.scene  # now passed as an arg instead of context
 	world = scene.world
 
-	# ---------------------------- Write the header first
-	fw(header_comment)
-	curtime = time.localtime()[0:6]
-	
-	# moved creation time + creator into header
-	fw(
-'''FBXHeaderExtension:  {
-	FBXHeaderVersion: 1003
-	FBXVersion: 6100
-	CreationTimeStamp:  {
-		Version: 1000
-		Year: %.4i
-		Month: %.2i
-		Day: %.2i
-		Hour: %.2i
-		Minute: %.2i
-		Second: %.2i
-		Millisecond: 0
-	}
-''' % (curtime))
-	fw(
-'''	Creator: "FBX Custom 6.1 - Blender %s"
-}''' % (bpy.app.version_string))
-	
-	# Document description - not really part of header, but close to the start
-	fw(
-'''
-
-; Document Description
-;------------------------------------------------------------------
-
-Document:  {
-	Name: ""
-}
-
-; Document References
-;------------------------------------------------------------------
-
-References:  {
-}''')
-	
 	pose_items = []  # list of (fbxName, matrix) to write pose data for, easier to collect along the way
 
 	# --------------- funcs for exporting
@@ -1385,167 +1578,27 @@ References:  {
 	
 	
 	
-	def write_mesh(my_mesh):
-		#Gather mesh data
-		me = my_mesh.blenData
-		meshobject = my_mesh.blenObject
-		
-		# if there are non NULL materials on this mesh
-		do_materials = bool(my_mesh.blenMaterials)
-		do_textures = bool(my_mesh.blenTextures)
-		do_uvs = bool(me.tessface_uv_textures)
-		do_shapekeys = (my_mesh.blenObject.type == 'MESH' and
-						my_mesh.blenObject.data.shape_keys and
-						len(my_mesh.blenObject.data.vertices) == len(me.vertices))
-		
+	def fw_capture(func, *args):
+		# runs a write function with fw collecting into a string instead of the file
+		nonlocal fw
+		fw_file = fw
+		out = []
+		fw = out.append
+		try:
+			func(*args)
+		finally:
+			fw = fw_file
+		return ''.join(out)
+	
+	def write_mesh_head(my_mesh, do_shapekeys):
 		fw('\n\tModel: "Model::%s", "Mesh" {' % my_mesh.fbxName)
 		fw('\n\t\tVersion: 232')  # newline is added in write_object_props
 		
-		me_vertices = [v for v in me.vertices]
-		me_edges = [e for e in me.edges] if use_mesh_edges else ()
-		me_faces = [f for f in me.tessfaces]
-		
-		# base lists for new features:
-		me_normals = []
-		me_tangents = []
-		me_binormals = []
-		
-		uvverts_list = []
-		uv_vertcoords = []
-		vindices = []
-		vindexlist2 = []
-		
-		is_collision = ("UCX_" in meshobject.name)
-		
-		normalsmode = normals_export_mode
-		usedefaultnormals = False
-		export_tangents = False
-		
-		if not is_collision:
-			# check if tangents need to be exported and uv layer exists
-			if export_tangentspace_base != 'NONE':
-				if len(me.tessface_uv_textures) > tangentspace_uvlnum:
-					export_tangents = True
-			
-			# check if required data exists / autodetect if needed
-			if normalsmode == 'AUTO':
-				if 'polyn_meshdata' in meshobject or 'vertexn_meshdata' in meshobject:
-					normalsmode = 'NORMEDIT'
-				elif 'vertex_normal_list' in meshobject:
-					normalsmode = 'RECALCVN'
-				else:
-					normalsmode = 'BLEND'
-					usedefaultnormals = True
-			elif normalsmode == 'NORMEDIT':
-				if bpy.context.window_manager.edit_splitnormals:
-					if 'polyn_meshdata' not in meshobject:
-						operator.report({'WARNING'}, "List not found")
-						usedefaultnormals = True
-				else:
-					if 'vertexn_meshdata' not in meshobject:
-						operator.report({'WARNING'}, "List not found")
-						usedefaultnormals = True
-			elif normalsmode == 'RECALCVN':
-				if 'vertex_normal_list' not in meshobject:
-					operator.report({'WARNING'}, "List not found")
-					usedefaultnormals = True
-			elif normalsmode == 'BLEND':
-				usedefaultnormals = True
-		else:
-			usedefaultnormals = True
-		
-		
-		#################
-		# Normals:
-		if not usedefaultnormals:
-			# Included normals editor
-			if normalsmode == 'NORMEDIT':
-				# convert per vertex to per poly if needed
-				if bpy.context.window_manager.edit_splitnormals:
-					if len(meshobject.polyn_meshdata) == len(me_faces):
-						for i in range(len(meshobject.polyn_meshdata)):
-							tempvcount = 0
-							for vd in meshobject.polyn_meshdata[i].vdata:
-								if tempvcount < len(me_faces[i].vertices):
-									me_normals.append(Vector(vd.vnormal))
-								tempvcount += 1
-					else:
-						operator.report({'WARNING'}, "List size mismatch")
-						usedefaultnormals = True
-				else:
-					if len(meshobject.vertexn_meshdata) == len(me_vertices):
-						for f in me_faces:
-							tempverts = [v for v in f.vertices]
-							for j in tempverts:
-								me_normals.append(Vector(meshobject.vertexn_meshdata[j].vnormal))
-					else:
-						operator.report({'WARNING'}, "List size mismatch")
-						usedefaultnormals = True
-				
-				
-			# adsn's Recalc Vertex Normals addon
-			elif normalsmode == 'RECALCVN':
-				if 'vertex_normal_list' in meshobject:
-					if len(meshobject.vertex_normal_list) == len(me_vertices):
-						for i in range(len(me_faces)):
-							for j in me_faces[i].vertices:
-								me_normals.append(Vector(meshobject.vertex_normal_list[j].normal))
-					else:
-						operator.report({'WARNING'}, "List size mismatch")
-						usedefaultnormals = True
-		
-		
-		# Blender split vertex normals 
-		# - Default / fallback / Mont29 + Blender 2.74 custom normals
-		if usedefaultnormals:
-			me.calc_normals_split()
-			me_normals = [t.normal.copy() for t in me.loops]
-			me.free_normals_split()
-		
-		
-		
-		##############################################################
-		# Tangents + Binormals:
-		if export_tangents:
-			# Blender Default - MikkTSpace (read from loops)
-			# - copy() because me_tangents is cleared by calc_normals_split
-			if export_tangentspace_base == 'DEFAULT':
-				if usedefaultnormals:
-					me.calc_normals_split()
-					me.calc_tangents(me.uv_layers[tangentspace_uvlnum].name)
-					
-					me_tangents = [t.tangent.copy() for t in me.loops]
-					me_binormals = [t.bitangent.copy() for t in me.loops]
-					
-					me.free_tangents()
-					me.free_normals_split()
-				else:
-					operator.report({'WARNING'}, "Default Tangents only work with Blender normals")
-					export_tangents = False
-				
-				
-			# Custom - modified Lengyel's method
-			elif export_tangentspace_base == 'LENGYEL':
-				t_uvlayer = [uvl for uvl in me.tessface_uv_textures[tangentspace_uvlnum].data]
-				
-				me_tangents, me_binormals = cust_tangents.build_initialtanlists(
-					me_faces, me_vertices, t_uvlayer, me_normals
-				)
-			
-		
-		######################################
-		
-		
 		# use global matrix here to apply scale + axis settings to the mesh
 		poseMatrix = write_object_props(
-			my_mesh.blenObject, None, meshobject.matrix_world * global_matrix
+			my_mesh.blenObject, None, my_mesh.blenMatrix * global_matrix
 		)[3]
 		
-		# Calculate the global transform for the mesh in the bind pose the same way we do
-		# in write_sub_deformer_skin
-		globalMeshBindPose = my_mesh.matrixWorld * mtx4_z90
-		pose_items.append((my_mesh.fbxName, globalMeshBindPose))
-		
 		if do_shapekeys:
 			for kb in my_mesh.blenObject.data.shape_keys.key_blocks[1:]:
 				fw('\n\t\t\tProperty: "%s", "Number", "AN",0' % kb.name)
@@ -1557,621 +1610,88 @@ References:  {
 		   '\n\t\tShading: Y'
 		   '\n\t\tCulling: "CullingOff"'
 		   )
+	
+	def mesh_do_shapekeys(my_mesh):
+		return (my_mesh.blenObject.type == 'MESH' and
+				my_mesh.blenObject.data.shape_keys and
+				len(my_mesh.blenObject.data.vertices) == len(my_mesh.blenData.vertices))
+	
+	def extract_mesh(my_mesh, head):
+		"""
+		Gathers everything write_mesh needs from bpy into plain values and numpy arrays,
+		the text is made by export_mesh_format.format_mesh (possibly in another process)
+		"""
+		me = my_mesh.blenData
+		meshobject = my_mesh.blenObject
 		
-		############################################
-		# Write the Real Mesh data here
-		
-		fw('\n\t\tVertices: ')
-		i = -1
-		
-		for v in me_vertices:
-			if i == -1:
-				fw('%.6f,%.6f,%.6f' % v.co[:])
-				i = 0
-			else:
-				if i == 4:
-					fw('\n\t\t')
-					i = 0
-				fw(',%.6f,%.6f,%.6f' % v.co[:])
-			i += 1
-		
-		fw('\n\t\tPolygonVertexIndex: ')
-		i = -1
-		for f in me_faces:
-			fi = [fv for fv in f.vertices]
-			# last index XORd w. -1 indicates end of face
-			if i == -1:
-				if len(fi) == 3:
-					fw('%i,%i,%i' % (fi[0], fi[1], fi[2] ^ -1))
-				else:
-					fw('%i,%i,%i,%i' % (fi[0], fi[1], fi[2], fi[3] ^ -1))
-				i = 0
-			else:
-				if i == 13:
-					fw('\n\t\t')
-					i = 0
-				if len(fi) == 3:
-					fw(',%i,%i,%i' % (fi[0], fi[1], fi[2] ^ -1))
-				else:
-					fw(',%i,%i,%i,%i' % (fi[0], fi[1], fi[2], fi[3] ^ -1))
-			i += 1
-		
-		# write loose edges as faces.
-		if len(me_edges) > 0:
-			for ed in me_edges:
-				if ed.is_loose:
-					ed_val = ed.vertices[:]
-					ed_val = ed_val[0], ed_val[-1] ^ -1
-					if i == -1:
-						fw('%i,%i' % ed_val)
-						i = 0
-					else:
-						if i == 13:
-							fw('\n\t\t')
-							i = 0
-						fw(',%i,%i' % ed_val)
-				i += 1
-			
-			fw('\n\t\tEdges: ')
-			i = -1
-			for ed in me_edges:
-				if i == -1:
-					fw('%i,%i' % (ed.vertices[0], ed.vertices[1]))
-					i = 0
-				else:
-					if i == 13:
-						fw('\n\t\t')
-						i = 0
-					fw(',%i,%i' % (ed.vertices[0], ed.vertices[1]))
-				i += 1
-		fw('\n\t\tGeometryVersion: 124')
-		
+		do_shapekeys = mesh_do_shapekeys(my_mesh)
 		
-		########################################
-		#		Normals, Tangents, Binormals:
+		data = mesh_arrays(me, use_mesh_edges, my_mesh.blenTessfaces)
 		
-		fw('''
-		LayerElementNormal: 0 {
-			Version: 101
-			Name: ""
-			MappingInformationType: "ByPolygonVertex"
-			ReferenceInformationType: "Direct"
-			Normals: ''')
-
-		i = -1
-		for v in me_normals:
-			if i == -1:
-				fw('%.6f,%.6f,%.6f' % v[:])
-				i = 0
-			else:
-				if i == 4:
-					fw('\n\t\t\t ')
-					i = 0
-				fw(',%.6f,%.6f,%.6f'% v[:])
-			i += 1
-		fw('\n\t\t}')
+		is_collision = ("UCX_" in meshobject.name)
 		
-		if export_tangents:
+		me_normals, me_tangents, me_binormals, export_tangents = get_mesh_shading(
+			operator, me, meshobject, data, is_collision,
+			normals_export_mode, export_tangentspace_base, tangentspace_uvlnum, profiler
+		)
 		
-			fw('''
-		LayerElementBinormal: 0 {
-			Version: 101
-			Name: ""
-			MappingInformationType: "ByPolygonVertex"
-			ReferenceInformationType: "Direct"
-			Binormals: ''')
-			
-			i = -1
-			for v in me_binormals:
-				if i == -1:
-					fw('%.6f,%.6f,%.6f' % v[:])
-					i = 0
-				else:
-					if i == 4:
-						fw('\n\t\t\t ')
-						i = 0
-					fw(',%.6f,%.6f,%.6f'% v[:])
-				i += 1
-			fw('\n\t\t}')
-			
-			fw('''
-		LayerElementTangent: 0 {
-			Version: 101
-			Name: ""
-			MappingInformationType: "ByPolygonVertex"
-			ReferenceInformationType: "Direct"
-			Tangents: ''')
-			
-			i = -1
-			for v in me_tangents:
-				if i == -1:
-					fw('%.6f,%.6f,%.6f' % v[:])
-					i = 0
-				else:
-					if i == 4:
-						fw('\n\t\t\t ')
-						i = 0
-					fw(',%.6f,%.6f,%.6f'% v[:])
-				i += 1
-			fw('\n\t\t}')
+		mesh = {
+			"name": str(meshobject.name),
+			"head": head,
+			"normals": me_normals,
+			"tangents": me_tangents if export_tangents else None,
+			"binormals": me_binormals if export_tangents else None,
+			"smooth_layer": mesh_smooth_type != 'OFF',
+			"dedup": use_layer_dedup,
+		}
 		
-		###########################################
-		# Write Smoothing Groups
+		mesh["vertcos"] = data.vertcos
+		mesh["faces"] = data.face_list()
+		mesh["edges"] = data.edges.tolist()
+		mesh["edges_loose"] = data.edges_loose.tolist()
 		
+		# Smoothing Groups
 		if mesh_smooth_type == 'FACE' or is_collision:
-			fw('''
-		LayerElementSmoothing: 0 {
-			Version: 102
-			Name: ""
-			MappingInformationType: "ByPolygon"
-			ReferenceInformationType: "Direct"
-			Smoothing: ''')
-
-			i = -1
-			for f in me_faces:
-				if i == -1:
-					fw('%i' % f.use_smooth)
-					i = 0
-				else:
-					if i == 54:
-						fw('\n\t\t\t ')
-						i = 0
-					fw(',%i' % f.use_smooth)
-				i += 1
-
-			fw('\n\t\t}')
-		# Write Edge Smoothing
+			mesh["smooth_type"] = 'FACE'
+			mesh["smoothing"] = data.face_smooth
 		elif mesh_smooth_type == 'EDGE' and not is_collision:
-			
-			fw('''
-		LayerElementSmoothing: 0 {
-			Version: 101
-			Name: ""
-			MappingInformationType: "ByEdge"
-			ReferenceInformationType: "Direct"
-			Smoothing: ''')
-
-			i = -1
-			for ed in me_edges:
-				if i == -1:
-					fw('%i' % (ed.use_edge_sharp))
-					i = 0
-				else:
-					if i == 54:
-						fw('\n\t\t\t ')
-						i = 0
-					fw(',%i' % ed.use_edge_sharp)
-				i += 1
-
-			fw('\n\t\t}')
-		
-		# Write No Smoothing
+			mesh["smooth_type"] = 'EDGE'
+			mesh["smoothing"] = data.edges_sharp
 		elif mesh_smooth_type == 'OFF' and not is_collision:
-			pass
+			mesh["smooth_type"] = 'OFF'
 		else:
 			raise Exception("invalid mesh_smooth_type: %r" % mesh_smooth_type)
 		
-		#####################################################
+		# VertexColor Layers
+		if merge_vertexcollayers:
+			mesh["colors"] = merge_color_layers(data.color_layers, vertexcol_merge_mode)
+		else:
+			mesh["colors"] = list(data.color_layers)
 		
-		# Write VertexColor Layers
-		# note, no programs seem to use this info :/
-		collayers = []
-		if len(me.tessface_vertex_colors):
-			collayers = me.tessface_vertex_colors
-			
-			if merge_vertexcollayers:
-				newvcols = []
-				finalvcols = []
-				for collayer in collayers:
-					newvcols = []
-					findex = 0
-					for cf in collayer.data:						
-						newvcols.append(cf.color1)
-						newvcols.append(cf.color2)
-						newvcols.append(cf.color3)
-						if len(me_faces[findex].vertices) == 4:
-							newvcols.append(cf.color4)
-						
-						findex += 1
-					
-					tempcount = 0
-					for cc in newvcols:
-						if len(finalvcols) < len(newvcols):
-							finalvcols.append(cc)
-						else:
-							finalvcols[tempcount] = cc + finalvcols[tempcount]
-						
-						tempcount += 1
-							
-				fw('''
-		LayerElementColor: 0 {
-			Version: 101
-			Name: "colscombined"
-			MappingInformationType: "ByPolygonVertex"
-			ReferenceInformationType: "IndexToDirect"
-			Colors: ''')
-				
-				i = -1
-				ii = 0  # Count how many Colors we write
-				
-				for col in finalvcols:
-					if i == -1:
-						fw('%.4f,%.4f,%.4f,1' % (col[0], col[1], col[2]))
-						i = 0
-					else:
-						if i == 7:
-							fw('\n\t\t\t\t')
-							i = 0
-						fw(',%.4f,%.4f,%.4f,1' % (col[0], col[1], col[2]))
-					i += 1
-					ii += 1  # One more Color
-				
-				fw('\n\t\t\tColorIndex: ')
-				i = -1
-				for j in range(ii):
-					if i == -1:
-						fw('%i' % j)
-						i = 0
-					else:
-						if i == 55:
-							fw('\n\t\t\t\t')
-							i = 0
-						fw(',%i' % j)
-					i += 1
-				fw('\n\t\t}')
-				collayers = [collayers[0]]
-				
+		# UV and texture layers
+		mesh["uvs"] = uvlayers = []
+		mesh["textures"] = len(my_mesh.blenTextures)
+		for uvindex, (uvname, uvs) in enumerate(data.uv_layers):
+			if len(my_mesh.blenTextures) > 1:
+				texture_ids = my_mesh.blenFaceMaterials.texture_ids[uvindex]
 			else:
-			
-			
-			
-				for colindex, collayer in enumerate(collayers):
-					fw('''
-		LayerElementColor: %i {
-			Version: 101
-			Name: "%s"
-			MappingInformationType: "ByPolygonVertex"
-			ReferenceInformationType: "IndexToDirect"
-			Colors: ''' % (colindex, collayer.name))
-					
-					i = -1
-					ii = 0  # Count how many Colors we write
-					print(len(me_faces), len(collayer.data))
-					for fi, cf in enumerate(collayer.data):
-						if len(me_faces[fi].vertices) == 4:
-							colors = cf.color1[:], cf.color2[:], cf.color3[:], cf.color4[:]
-						else:
-							colors = cf.color1[:], cf.color2[:], cf.color3[:]
-						
-						for col in colors:
-							if i == -1:
-								fw('%.4f,%.4f,%.4f,1' % col)
-								i = 0
-							else:
-								if i == 7:
-									fw('\n\t\t\t\t')
-									i = 0
-								fw(',%.4f,%.4f,%.4f,1' % col)
-							i += 1
-							ii += 1  # One more Color
-					
-					fw('\n\t\t\tColorIndex: ')
-					i = -1
-					for j in range(ii):
-						if i == -1:
-							fw('%i' % j)
-							i = 0
-						else:
-							if i == 55:
-								fw('\n\t\t\t\t')
-								i = 0
-							fw(',%i' % j)
-						i += 1
-					fw('\n\t\t}')
+				texture_ids = None
+			uvlayers.append((uvname, uvs, texture_ids))
 		
-		# Write UV and texture layers.
-		uvlayers = []
-		if do_uvs:
-			uvlayers = me.tessface_uv_textures
-			for uvindex, uvlayer in enumerate(me.tessface_uv_textures):
-				fw('\n\t\tLayerElementUV: %i {' % uvindex)
-				fw('\n\t\t\tVersion: 101')
-				fw('\n\t\t\tName: "%s"' % uvlayer.name)
-				fw('''
-			MappingInformationType: "ByPolygonVertex"
-			ReferenceInformationType: "IndexToDirect"
-			UV: ''')
-				
-				i = -1
-				ii = 0  # Count how many UVs we write
-				
-				for uf in uvlayer.data:
-					# workaround, since uf.uv iteration is wrong atm
-					for uv in uf.uv:
-						if i == -1:
-							fw('%.6f,%.6f' % uv[:])
-							i = 0
-						else:
-							if i == 7:
-								fw('\n\t\t\t ')
-								i = 0
-							fw(',%.6f,%.6f' % uv[:])
-						i += 1
-						ii += 1  # One more UV
-				
-				fw('\n\t\t\tUVIndex: ')
-				i = -1
-				for j in range(ii):
-					if i == -1:
-						fw('%i' % j)
-						i = 0
-					else:
-						if i == 55:
-							fw('\n\t\t\t\t')
-							i = 0
-						fw(',%i' % j)
-					i += 1
-				
-				fw('\n\t\t}')
-				
-				if do_textures:
-					fw('\n\t\tLayerElementTexture: %i {' % uvindex)
-					fw('\n\t\t\tVersion: 101')
-					fw('\n\t\t\tName: "%s"' % uvlayer.name)
-					
-					if len(my_mesh.blenTextures) == 1:
-						fw('\n\t\t\tMappingInformationType: "AllSame"')
-					else:
-						fw('\n\t\t\tMappingInformationType: "ByPolygon"')
-					
-					fw('\n\t\t\tReferenceInformationType: "IndexToDirect"')
-					fw('\n\t\t\tBlendMode: "Translucent"')
-					fw('\n\t\t\tTextureAlpha: 1')
-					fw('\n\t\t\tTextureId: ')
-					
-					if len(my_mesh.blenTextures) == 1:
-						fw('0')
-					else:
-						texture_mapping_local = {None: -1}
-						
-						i = 0  # 1 for dummy
-						for tex in my_mesh.blenTextures:
-							if tex:  # None is set above
-								texture_mapping_local[tex] = i
-								i += 1
-						
-						i = -1
-						for f in uvlayer.data:
-							img_key = f.image
-							
-							if i == -1:
-								i = 0
-								fw('%s' % texture_mapping_local[img_key])
-							else:
-								if i == 55:
-									fw('\n			 ')
-									i = 0
-								
-								fw(',%s' % texture_mapping_local[img_key])
-							i += 1
-						
-				else:
-					fw('''
-		LayerElementTexture: 0 {
-			Version: 101
-			Name: ""
-			MappingInformationType: "NoMappingInformation"
-			ReferenceInformationType: "IndexToDirect"
-			BlendMode: "Translucent"
-			TextureAlpha: 1
-			TextureId: ''')
-				fw('\n\t\t}')
+		# Materials
+		mesh["materials"] = len(my_mesh.blenMaterials)
+		if len(my_mesh.blenMaterials) > 1:
+			mesh["material_ids"] = my_mesh.blenFaceMaterials.material_ids
 		
-		# Done with UV/textures.
-		if do_materials:
-			fw('\n\t\tLayerElementMaterial: 0 {')
-			fw('\n\t\t\tVersion: 101')
-			fw('\n\t\t\tName: ""')
-
-			if len(my_mesh.blenMaterials) == 1:
-				fw('\n\t\t\tMappingInformationType: "AllSame"')
-			else:
-				fw('\n\t\t\tMappingInformationType: "ByPolygon"')
-
-			fw('\n\t\t\tReferenceInformationType: "IndexToDirect"')
-			fw('\n\t\t\tMaterials: ')
-
-			if len(my_mesh.blenMaterials) == 1:
-				fw('0')
-			else:
-				# Build a material mapping for this
-				material_mapping_local = {}  # local-mat & tex : global index.
-
-				for j, mat_tex_pair in enumerate(my_mesh.blenMaterials):
-					material_mapping_local[mat_tex_pair] = j
-
-				mats = my_mesh.blenMaterialList
-
-				if me.tessface_uv_textures.active:
-					uv_faces = me.tessface_uv_textures.active.data
-				else:
-					uv_faces = [None] * len(me_faces)
-
-				i = -1
-				for f, uf in zip(me_faces, uv_faces):
-					try:
-						mat = mats[f.material_index]
-					except:
-						mat = None
-
-					if do_uvs:
-						tex = uf.image  # WARNING - MULTI UV LAYER IMAGES NOT SUPPORTED :/
-					else:
-						tex = None
-
-					if i == -1:
-						i = 0
-						fw('%s' % material_mapping_local[mat, tex])  # None for mat or tex is ok
-					else:
-						if i == 55:
-							fw('\n\t\t\t\t')
-							i = 0
-
-						fw(',%s' % material_mapping_local[mat, tex])
-					i += 1
-
-			fw('\n\t\t}')
-
-		fw('''
-		Layer: 0 {
-			Version: 100
-			LayerElement:  {
-				Type: "LayerElementNormal"
-				TypedIndex: 0
-			}''')
-
-		fw('''
-			LayerElement:  {
-				Type: "LayerElementBinormal"
-				TypedIndex: 0
-			}''')
-
-		fw('''
-			LayerElement:  {
-				Type: "LayerElementTangent"
-				TypedIndex: 0
-			}''')
-
-		if do_materials:
-			fw('''
-			LayerElement:  {
-				Type: "LayerElementMaterial"
-				TypedIndex: 0
-			}''')
-
-		# Smoothing info
-		if mesh_smooth_type != 'OFF':
-			fw('''
-			LayerElement:  {
-				Type: "LayerElementSmoothing"
-				TypedIndex: 0
-			}''')
-
-		# Always write this
-		if do_textures:
-			fw('''
-			LayerElement:  {
-				Type: "LayerElementTexture"
-				TypedIndex: 0
-			}''')
-
-		if me.tessface_vertex_colors:
-			fw('''
-			LayerElement:  {
-				Type: "LayerElementColor"
-				TypedIndex: 0
-			}''')
-
-		if do_uvs:  # same as me.faceUV
-			fw('''
-			LayerElement:  {
-				Type: "LayerElementUV"
-				TypedIndex: 0
-			}''')
-
-		fw('\n\t\t}')
-
-		if len(uvlayers) > 1:
-			for i in range(1, len(uvlayers)):
-
-				fw('\n\t\tLayer: %i {' % i)
-				fw('\n\t\t\tVersion: 100')
-
-				fw('''
-			LayerElement:  {
-				Type: "LayerElementUV"''')
-
-				fw('\n\t\t\t\tTypedIndex: %i' % i)
-				fw('\n\t\t\t}')
-
-				if do_textures:
-
-					fw('''
-			LayerElement:  {
-				Type: "LayerElementTexture"''')
-
-					fw('\n\t\t\t\tTypedIndex: %i' % i)
-					fw('\n\t\t\t}')
-
-				fw('\n\t\t}')
-
-		if len(collayers) > 1:
-			# Take into account any UV layers
-			for i in range(1, len(collayers)):
-				fw('\n\t\tLayer: %i {' % i)
-				fw('\n\t\t\tVersion: 100')
-
-				fw('''
-			LayerElement:  {
-				Type: "LayerElementColor"''')
-
-				fw('\n\t\t\t\tTypedIndex: %i' % i)
-				fw('\n\t\t\t}')
-				fw('\n\t\t}')
-
+		# Shape keys
 		if do_shapekeys:
 			key_blocks = my_mesh.blenObject.data.shape_keys.key_blocks[:]
-			for kb in key_blocks[1:]:
-
-				fw('\n\t\tShape: "%s" {' % kb.name)
-				fw('\n\t\t\tIndexes: ')
-
-				basis_verts = key_blocks[0].data
-				range_verts = []
-				delta_verts = []
-				i = -1
-				for j, kv in enumerate(kb.data):
-					delta = kv.co - basis_verts[j].co
-					if delta.length > 0.000001:
-						if i == -1:
-							fw('%d' % j)
-						else:
-							if i == 7:
-								fw('\n\t\t\t')
-								i = 0
-							fw(',%d' % j)
-						delta_verts.append(delta[:])
-						i += 1
-
-				fw('\n\t\t\tVertices: ')
-				i = -1
-				for dv in delta_verts:
-					if i == -1:
-						fw("%.6f,%.6f,%.6f" % dv)
-					else:
-						if i == 4:
-							fw('\n\t\t\t')
-							i = 0
-						fw(",%.6f,%.6f,%.6f" % dv)
-					i += 1
-
-				# all zero, why? - campbell
-				fw('\n\t\t\tNormals: ')
-				for j in range(len(delta_verts)):
-					if i == -1:
-						fw("0,0,0")
-					else:
-						if i == 4:
-							fw('\n\t\t\t')
-							i = 0
-						fw(",0,0,0")
-					i += 1
-				fw('\n\t\t}')
-				
-		# not completely sure about this, but it's in the converter output:
-		fw('\n\t\tNodeAttributeName: "Geometry::%s' % (str(meshobject.name) + '_ncl1_1"'))
-		fw('\n\t}')
-
+			mesh["shapes"] = shape_key_deltas(me, key_blocks, use_shape_normals)
+		else:
+			mesh["shapes"] = []
+		
+		return mesh
+	
 	def write_group(name):
 		fw('\n\tGroupSelection: "GroupSelection::%s", "Default" {' % name)
 
@@ -2185,8 +1705,16 @@ References:  {
 		MultiLayer: 0
 	}''')
 
+	profiler.begin("collect")
+	
 	# add meshes here to clear because they are not used anywhere.
 	meshes_to_clear = []
+	# evaluated meshes kept between exports, only with modifiers applied
+	eval_meshes = None
+	if use_mesh_modifiers and use_eval_cache:
+		eval_meshes = shared_eval_cache(eval_cache_size)
+	else:
+		free_shared_eval_cache()
 
 	ob_meshes = []
 	ob_lights = []
@@ -2206,6 +1734,15 @@ References:  {
 
 	tmp_ob_type = None  # in case no objects are exported, so as not to raise an error
 
+	ob_instanced = {}  # object name: first my_mesh made from it
+	geometry_owners = {}  # geometry key: my_mesh that writes the geometry
+
+	def geometry_key(ob, me):
+		# normals can be stored on the object, and collision names change how they're written
+		if "UCX_" in ob.name or normals_data.saved_mode(ob) or 'vertex_normal_list' in ob:
+			return me.name, ob.name
+		return me.name, None
+
 ## XXX
 
 	if 'ARMATURE' in object_types:
@@ -2254,10 +1791,16 @@ References:  {
 				if 'EMPTY' in object_types:
 					ob_null.append(my_object_generic(ob, mtx))
 			elif 'MESH' in object_types:
+				# dupli instances of an object reuse the mesh evaluated for the first one
+				instance_of = ob_instanced.get(ob.name)
 				origData = True
-				if tmp_ob_type != 'MESH':
+				if instance_of:
+					me = instance_of.blenData
+					origData = instance_of.origData
+					mats = instance_of.blenMaterialList
+				elif tmp_ob_type != 'MESH':
 					try:
-						me = ob.to_mesh(scene, True, 'PREVIEW')
+						me = ob.to_mesh(scene, True, 'PREVIEW', calc_tessface=False)
 					except:
 						me = None
 
@@ -2268,15 +1811,19 @@ References:  {
 				else:
 					# Mesh Type!
 					if use_mesh_modifiers:
-						me = ob.to_mesh(scene, True, 'PREVIEW')
+						if eval_meshes is not None:
+							me, cached = eval_meshes.to_mesh(ob, scene)
+						else:
+							me = ob.to_mesh(scene, True, 'PREVIEW', calc_tessface=False)
+							cached = False
 
 						# print ob, me, me.getVertGroupNames()
-						meshes_to_clear.append(me)
+						if not cached:
+							meshes_to_clear.append(me)
 						origData = False
 						mats = me.materials
 					else:
 						me = ob.data
-						me.update(calc_tessface=True)
 						mats = me.materials
 
 # 						# Support object colors
@@ -2296,25 +1843,24 @@ References:  {
 # 					if EXP_MESH_HQ_NORMALS:
 # 						BPyMesh.meshCalcNormals(me) # high quality normals nice for realtime engines.
 
-					texture_mapping_local = {}
-					material_mapping_local = {}
-					if me.tessface_uv_textures:
-						for uvlayer in me.tessface_uv_textures:
-							for f, uf in zip(me.tessfaces, uvlayer.data):
-								tex = uf.image
-								textures[tex] = texture_mapping_local[tex] = None
-
-								try:
-									mat = mats[f.material_index]
-								except:
-									mat = None
-
-								materials[mat, tex] = material_mapping_local[mat, tex] = None  # should use sets, wait for blender 2.5
-
+					if instance_of:
+						mesh_tessfaces = instance_of.blenTessfaces
+						face_mats = instance_of.blenFaceMaterials
 					else:
-						for mat in mats:
-							# 2.44 use mat.lib too for uniqueness
-							materials[mat, None] = material_mapping_local[mat, None] = None
+						# faces are read from polygons + loops unless they have to be tessellated
+						mesh_tessfaces = use_tessfaces or needs_tessfaces(me, export_tangentspace_base, tangentspace_uvlnum)
+						if mesh_tessfaces:
+							me.update(calc_tessface=True)
+					
+						# material/texture of each face, reused by the writers
+						face_mats = face_materials(me, mats, mesh_tessfaces)
+						for mat_tex_pair in face_mats.materials:
+							materials[mat_tex_pair] = None
+						if me.uv_textures:
+							for tex in face_mats.textures:
+								textures[tex] = None
+							if not face_mats.textures:
+								textures[None] = None
 						else:
 							materials[None, None] = None
 
@@ -2343,21 +1889,23 @@ References:  {
 					my_mesh = my_object_generic(ob, mtx)
 					my_mesh.blenData = me
 					my_mesh.origData = origData
-					my_mesh.blenMaterials = list(material_mapping_local.keys())
+					my_mesh.blenTessfaces = mesh_tessfaces
+					my_mesh.blenMaterials = face_mats.materials
 					my_mesh.blenMaterialList = mats
-					my_mesh.blenTextures = list(texture_mapping_local.keys())
-
-					# sort the name so we get predictable output, some items may be NULL
-					my_mesh.blenMaterials.sort(key=lambda m: (getattr(m[0], "name", ""), getattr(m[1], "name", "")))
-					my_mesh.blenTextures.sort(key=lambda m: getattr(m, "name", ""))
-
-					# if only 1 null texture then empty the list
-					if len(my_mesh.blenTextures) == 1 and my_mesh.blenTextures[0] is None:
-						my_mesh.blenTextures = []
+					my_mesh.blenTextures = face_mats.textures
+					my_mesh.blenFaceMaterials = face_mats
 
 					my_mesh.fbxArm = armob  # replace with my_object_generic armature instance later
 					my_mesh.fbxBoneParent = blenParentBoneName  # replace with my_bone instance later
 
+					# meshes with the same geometry key are written as one Geometry (binary)
+					# - skinned meshes keep their own, the clusters belong to the geometry
+					geom_key = None
+					if use_instancing and not armob:
+						geom_key = geometry_key(ob, me)
+					my_mesh.fbxGeometry = geometry_owners.setdefault(geom_key, my_mesh) if geom_key else my_mesh
+
+					ob_instanced.setdefault(ob.name, my_mesh)
 					ob_meshes.append(my_mesh)
 
 		# not forgetting to free dupli_list
@@ -2377,8 +1925,10 @@ References:  {
 			scene.frame_set(scene.frame_current)
 
 	del tmp_ob_type, context_objects
+	profiler.end("collect")
 
 	# now we have collected all armatures, add bones
+	profiler.begin("armatures")
 	for i, ob in enumerate(ob_arms):
 
 		ob_arms[i] = my_arm = my_object_generic(ob)
@@ -2458,6 +2008,12 @@ References:  {
 		bone_deformer_count += len(my_bone.blenMeshes)
 
 	del my_bone_blenParent
+	profiler.end("armatures")
+	
+	profiler.count("meshes", len(ob_meshes))
+	profiler.count("armatures", len(ob_arms))
+	profiler.count("bones", len(ob_bones))
+	profiler.count("nulls", len(ob_null))
 
 	# Build blenObject -> fbxObject mapping
 	# this is needed for groups as well as fbxParenting
@@ -2502,6 +2058,114 @@ References:  {
 	materials.sort(key=lambda m: m[0])  # sort by name
 	textures.sort(key=lambda m: m[0])
 
+	def finish_export():
+		# Clear mesh data Only when writing with modifiers applied
+		for me in meshes_to_clear:
+			bpy.data.meshes.remove(me)
+		if eval_meshes is not None:
+			eval_meshes.trim()
+			print(eval_meshes.stats())
+		
+		# XXX, shouldnt be global!
+		for mapping in (sane_name_mapping_ob,
+						sane_name_mapping_ob_unique,
+						sane_name_mapping_mat,
+						sane_name_mapping_tex,
+						sane_name_mapping_take,
+						sane_name_mapping_group,
+						):
+			mapping.clear()
+		
+		del ob_arms[:]
+		del ob_bones[:]
+		del ob_cameras[:]
+		del ob_lights[:]
+		del ob_meshes[:]
+		del ob_null[:]
+		
+		file.close()
+		if fbx_format != 'BIN74':
+			profiler.add_time("file_io", file.io_time, file.flush_count)
+		
+		# copy all collected files.
+		bpy_extras.io_utils.path_reference_copy(copy_set)
+		
+		print('export finished in %.4f sec.' % (time.clock() - start_time))
+		if fbx_format == 'BIN74':
+			print('wrote %i bytes' % os.path.getsize(filepath))
+			operator.report({'INFO'}, "Wrote %i bytes" % os.path.getsize(filepath))
+		else:
+			print('wrote %i bytes in %i flushes' % (file.bytes_written, file.flush_count))
+			operator.report({'INFO'}, "Wrote %i bytes in %i flushes" % (file.bytes_written, file.flush_count))
+		
+		if use_profile:
+			report_path = profile_path(filepath)
+			try:
+				profiler.write_json(report_path,
+					file=filepath, format=fbx_format, bytes=os.path.getsize(filepath),
+					blender=bpy.app.version_string, mesh_workers=mesh_workers,
+				)
+			except (IOError, OSError) as e:
+				operator.report({'WARNING'}, "Couldn't write profile %r (%s)" % (report_path, e))
+			else:
+				print(profiler.summary())
+				operator.report({'INFO'}, "Wrote profile %r" % report_path)
+		return {'FINISHED'}
+	
+	if fbx_format == 'BIN74':
+		from . import export_fbx_bin
+		
+		export_fbx_bin.write_binary(
+			operator, file, scene, filepath, object_tx,
+			ob_meshes, ob_bones, ob_arms, ob_null, materials, textures,
+			global_matrix, world_amb, base_src, base_dst, copy_set,
+			mesh_smooth_type, normals_export_mode, export_tangentspace_base, tangentspace_uvlnum,
+			use_anim, use_anim_optimize, anim_optimize_precision, use_anim_action_all, use_default_take,
+			merge_vertexcollayers, vertexcol_merge_mode, use_layer_dedup, use_shape_normals, profiler,
+		)
+		return finish_export()
+	
+	# ---------------------------- Write the header first
+	fw(header_comment)
+	curtime = time.localtime()[0:6]
+	
+	# moved creation time + creator into header
+	fw(
+'''FBXHeaderExtension:  {
+	FBXHeaderVersion: 1003
+	FBXVersion: 6100
+	CreationTimeStamp:  {
+		Version: 1000
+		Year: %.4i
+		Month: %.2i
+		Day: %.2i
+		Hour: %.2i
+		Minute: %.2i
+		Second: %.2i
+		Millisecond: 0
+	}
+''' % (curtime))
+	fw(
+'''	Creator: "FBX Custom 6.1 - Blender %s"
+}''' % (bpy.app.version_string))
+	
+	# Document description - not really part of header, but close to the start
+	fw(
+'''
+
+; Document Description
+;------------------------------------------------------------------
+
+Document:  {
+	Name: ""
+}
+
+; Document References
+;------------------------------------------------------------------
+
+References:  {
+}''')
+	
 	camera_count = 8 if 'CAMERA' in object_types else 0
 
 	# sanity checks
@@ -2634,8 +2298,83 @@ Objects:  {''')
 	for my_light in ob_lights:
 		write_light(my_light)
 
-	for my_mesh in ob_meshes:
-		write_mesh(my_mesh)
+	# mesh data is gathered here, the text is formatted in batches by the worker pool
+	# - unchanged meshes are read from the export cache instead
+	if use_export_cache:
+		cache = export_cache(export_cache_dir, export_cache_size * 1024 * 1024)
+		cache_options = (
+			mesh_smooth_type, normals_export_mode, export_tangentspace_base, tangentspace_uvlnum,
+			merge_vertexcollayers, vertexcol_merge_mode, use_layer_dedup, use_tessfaces,
+			use_shape_normals, use_mesh_edges,
+			bool(bpy.context.window_manager.edit_splitnormals),
+		)
+	
+	profiler.begin("mesh_write")
+	mesh_pool = mesh_format_pool(mesh_workers)
+	mesh_batch = max(1, mesh_workers * 2)
+	# fbx 6.1 has no shared geometry, instances of an object copy the text
+	# formatted for the first one after their own Model header
+	geometry_bodies = {}
+	geometry_shared = set(my_mesh.fbxGeometry for my_mesh in ob_meshes if my_mesh.fbxGeometry is not my_mesh)
+	for batch_start in range(0, len(ob_meshes), mesh_batch):
+		texts = []
+		heads = []
+		pending = []
+		instances = []
+		records = []
+		for my_mesh in ob_meshes[batch_start:batch_start + mesh_batch]:
+			record = profiler.object_begin(my_mesh.fbxName, 'MESH')
+			records.append(record)
+			head = fw_capture(write_mesh_head, my_mesh, mesh_do_shapekeys(my_mesh))
+			heads.append(head)
+			
+			# Calculate the global transform for the mesh in the bind pose the same way we do
+			# in write_sub_deformer_skin
+			globalMeshBindPose = my_mesh.matrixWorld * mtx4_z90
+			pose_items.append((my_mesh.fbxName, globalMeshBindPose))
+			
+			text = key = None
+			owner = my_mesh.fbxGeometry
+			if owner is not my_mesh and owner.blenObject.name == my_mesh.blenObject.name:
+				instances.append((len(texts), owner))
+			else:
+				if use_export_cache:
+					key = mesh_key(my_mesh, head, cache_options)
+					text = cache.get(key)
+				if text is None:
+					pending.append((len(texts), key, extract_mesh(my_mesh, head)))
+			texts.append(text)
+			
+			me = my_mesh.blenData
+			profiler.object_end(record,
+				vertices=len(me.vertices), faces=len(me.tessfaces if my_mesh.blenTessfaces else me.polygons),
+				edges=len(me.edges), uv_layers=len(me.uv_textures), color_layers=len(me.vertex_colors),
+				materials=len(my_mesh.blenMaterials), cached=text is not None,
+			)
+		
+		texts_new = mesh_pool.format([mesh for i, key, mesh in pending])
+		for (i, key, mesh), text, seconds in zip(pending, texts_new, mesh_pool.times):
+			texts[i] = text
+			profiler.object_add(records[i], format_time=seconds)
+			if use_export_cache:
+				cache.put(key, text)
+		
+		for i, my_mesh in enumerate(ob_meshes[batch_start:batch_start + mesh_batch]):
+			if my_mesh in geometry_shared and texts[i] is not None:
+				geometry_bodies[my_mesh] = texts[i][len(heads[i]):]
+		for i, owner in instances:
+			texts[i] = heads[i] + geometry_bodies[owner]
+		
+		for text, record in zip(texts, records):
+			profiler.object_add(record, bytes=len(text))
+			fw(text)
+	mesh_pool.close()
+	profiler.end("mesh_write")
+	
+	if use_export_cache:
+		cache.trim()
+		print(cache.stats())
+		operator.report({'INFO'}, cache.stats())
 
 	#for bonename, bone, obname, me, armob in ob_bones:
 	for my_bone in ob_bones:
@@ -2722,15 +2461,19 @@ Objects:  {''')
 			write_deformer_skin(my_mesh.fbxName)
 
 			# Get normalized weights for temorary use
+			profiler.begin("skin_weights")
 			if my_mesh.fbxBoneParent:
 				weights = None
 			else:
 				weights = meshNormalizedWeights(my_mesh.blenObject, my_mesh.blenData)
+			profiler.end("skin_weights")
 
 			#for bonename, bone, obname, bone_mesh, armob in ob_bones:
+			profiler.begin("skin_write")
 			for my_bone in ob_bones:
 				if me in iter(my_bone.blenMeshes.values()):
 					write_sub_deformer_skin(my_mesh, my_bone, weights)
+			profiler.end("skin_write")
 
 
 	for groupname, group in groups:
@@ -2852,6 +2595,7 @@ Connections:  {''')
 	ob_anim_lists = ob_bones, ob_meshes, ob_null, ob_cameras, ob_lights, ob_arms
 
 	if use_anim and [tmp for tmp in ob_anim_lists if tmp]:
+		profiler.begin("takes")
 
 		frame_orig = scene.frame_current
 
@@ -2947,6 +2691,8 @@ Takes:  {''')
 					if my_arm.blenObject.animation_data and blenAction in my_arm.blenActionList:
 						my_arm.blenObject.animation_data.action = blenAction
 
+			take_record = profiler.object_begin(take_name, 'TAKE')
+			
 			# Use the action name as the take name and the take filename (JCB)
 			fw('\n\tTake: "%s" {' % take_name)
 			fw('\n\t\tFileName: "%s.tak"' % take_name.replace(" ", "_"))
@@ -2964,6 +2710,7 @@ Takes:  {''')
 			for my_bone in ob_bones:
 				my_bone.flushAnimData()
 			'''
+			profiler.begin("anim_sampling")
 			i = act_start
 			while i <= act_end:
 				scene.frame_set(i)
@@ -2977,6 +2724,7 @@ Takes:  {''')
 							my_ob.setPoseFrame(i)
 
 				i += 1
+			profiler.end("anim_sampling")
 
 			#for bonename, bone, obname, me, armob in ob_bones:
 			for ob_generic in (ob_bones, ob_meshes, ob_null, ob_cameras, ob_lights, ob_arms):
@@ -2992,7 +2740,10 @@ Takes:  {''')
 						fw('\n\t\t\tVersion: 1.1')
 						fw('\n\t\t\tChannel: "Transform" {')
 
+						profiler.begin("anim_sampling")
 						context_bone_anim_mats = [(my_ob.getAnimParRelMatrix(frame), my_ob.getAnimParRelMatrixRot(frame)) for frame in range(act_start, act_end + 1)]
+						profiler.end("anim_sampling")
+						profiler.object_add(take_record, models=1)
 
 						# ----------------
 						# ----------------
@@ -3041,34 +2792,9 @@ Takes:  {''')
 									# remove unneeded keys, j is the frame, needed when some frames are removed.
 									context_bone_anim_keys = [(vec[i], j) for j, vec in enumerate(context_bone_anim_vecs)]
 
-									# last frame to fisrt frame, missing 1 frame on either side.
-									# removeing in a backwards loop is faster
-									#for j in xrange( (act_end-act_start)-1, 0, -1 ):
-									# j = (act_end-act_start)-1
-									j = len(context_bone_anim_keys) - 2
-									while j > 0 and len(context_bone_anim_keys) > 2:
-										# print j, len(context_bone_anim_keys)
-										# Is this key the same as the ones next to it?
-
-										# co-linear horizontal...
-										if		abs(context_bone_anim_keys[j][0] - context_bone_anim_keys[j - 1][0]) < ANIM_OPTIMIZE_PRECISSION_FLOAT and \
-												abs(context_bone_anim_keys[j][0] - context_bone_anim_keys[j + 1][0]) < ANIM_OPTIMIZE_PRECISSION_FLOAT:
-
-											del context_bone_anim_keys[j]
-
-										else:
-											frame_range = float(context_bone_anim_keys[j + 1][1] - context_bone_anim_keys[j - 1][1])
-											frame_range_fac1 = (context_bone_anim_keys[j + 1][1] - context_bone_anim_keys[j][1]) / frame_range
-											frame_range_fac2 = 1.0 - frame_range_fac1
-
-											if abs(((context_bone_anim_keys[j - 1][0] * frame_range_fac1 + context_bone_anim_keys[j + 1][0] * frame_range_fac2)) - context_bone_anim_keys[j][0]) < ANIM_OPTIMIZE_PRECISSION_FLOAT:
-												del context_bone_anim_keys[j]
-											else:
-												j -= 1
-
-										# keep the index below the list length
-										if j > len(context_bone_anim_keys) - 2:
-											j = len(context_bone_anim_keys) - 2
+									profiler.begin("key_reduction")
+									reduce_anim_keys(context_bone_anim_keys, ANIM_OPTIMIZE_PRECISSION_FLOAT)
+									profiler.end("key_reduction")
 
 									if len(context_bone_anim_keys) == 2 and context_bone_anim_keys[0][0] == context_bone_anim_keys[1][0]:
 
@@ -3107,6 +2833,7 @@ Takes:  {''')
 
 			# end the take
 			fw('\n\t}')
+			profiler.object_end(take_record, frames=1 + act_end - act_start)
 
 			# end action loop. set original actions
 			# do this after every loop in case actions effect eachother.
@@ -3122,6 +2849,7 @@ Takes:  {''')
 		fw('\n}')
 
 		scene.frame_set(frame_orig)
+		profiler.end("takes")
 
 	else:
 		# no animation
@@ -3135,10 +2863,6 @@ Takes:  {''')
 	# write meshes animation
 	#for obname, ob, mtx, me, mats, arm, armname in ob_meshes:
 
-	# Clear mesh data Only when writing with modifiers applied
-	for me in meshes_to_clear:
-		bpy.data.meshes.remove(me)
-
 	# --------------------------- Footer
 	if world:
 		m = world.mist_settings
@@ -3183,32 +2907,7 @@ Takes:  {''')
 	fw('\n}')
 	fw('\n')
 
-	# XXX, shouldnt be global!
-	for mapping in (sane_name_mapping_ob,
-					sane_name_mapping_ob_unique,
-					sane_name_mapping_mat,
-					sane_name_mapping_tex,
-					sane_name_mapping_take,
-					sane_name_mapping_group,
-					):
-		mapping.clear()
-	del mapping
-
-	del ob_arms[:]
-	del ob_bones[:]
-	del ob_cameras[:]
-	del ob_lights[:]
-	del ob_meshes[:]
-	del ob_null[:]
-
-	file.close()
-
-	# copy all collected files.
-	bpy_extras.io_utils.path_reference_copy(copy_set)
-
-	print('export finished in %.4f sec.' % (time.clock() - start_time))
-	return {'FINISHED'}
-
+	return finish_export()
 
 def save(operator, context,
 		 filepath="",
@@ -0,0 +1,908 @@
+############################################################
+# Binary FBX 7.4 writer
+#
+# - called from export_fbx.save_single after the scene data is collected,
+#   shares its normals/tangents gathering and UE bone transforms
+# - objects are numbered with the id scheme in exporter_data
+# - armature objects are not written, root bones are parented to the
+#   scene like in the ascii files (UE root bone fix)
+# - textures are connected to their materials' diffuse color
+#
+
+import math
+import time
+
+import numpy as np
+
+import bpy
+from mathutils import Matrix
+
+from . import exporter_data
+from .exporter_data import (
+	get_fbx_GeomID, get_fbx_MeshID, get_fbx_NullModelID, get_fbx_BoneID,
+	get_fbx_BoneAttributeID, get_fbx_NullAttributeID, get_fbx_DeformerSkinID,
+	get_fbx_DeformerClusterID, get_fbx_MaterialID, get_fbx_TextureID, get_fbx_VideoID,
+	add_fbx_index,
+)
+from .fbx_binary import fbx_elem, add_p, fbx_name_class, write_file, fbx_version
+from .export_arrays import unique_rows
+from .export_mesh_data import mesh_arrays, shape_key_deltas, merge_color_layers
+from .export_profiler import profiler_off
+from .export_fbx import (
+	get_mesh_shading, reduce_anim_keys, meshNormalizedWeights, tuple_rad_to_deg,
+	action_bone_names, sane_takename, sane_name_mapping_take,
+)
+
+
+mtx4_z90 = Matrix.Rotation(math.pi / 2.0, 4, 'Z')
+
+# static ids, see exporter_data
+fbx_id_root = 0
+fbx_id_document = 10
+fbx_id_pose = 100
+
+# FileId and CreationTime have to match each other, values from Blender's exporter
+fbx_file_id = b'\x28\xb3\x2a\xeb\xb6\x24\xcc\xc2\xbf\xc8\xb0\x2a\xa9\x2b\xfc\xf1'
+fbx_creation_time = "1970-01-01 10:00:00:000"
+
+# linear interpolation, auto tangents
+fbx_key_attr_flags = (1 << 2) | (1 << 8)
+fbx_key_attr_data = (0.0, 0.0, 9.419963346924634e-30, 0.0)
+
+# fps -> FbxTime::EMode
+fbx_time_modes = {120: 1, 100: 2, 60: 3, 50: 4, 48: 5, 30: 6, 25: 10, 24: 11, 1000: 12}
+
+# ObjectType names for the Definitions section, in writing order
+fbx_definition_types = (
+	b"Model", b"NodeAttribute", b"Geometry", b"Material", b"Texture", b"Video",
+	b"Deformer", b"Pose", b"AnimationStack", b"AnimationLayer",
+	b"AnimationCurveNode", b"AnimationCurve",
+)
+
+
+def fbx_time(t, fps):
+	return int(0.5 + ((t / fps) * 46186158000))
+
+
+def matrix_to_array(mat):
+	# blender matrix is row major, fbx is col major
+	return [f for v in mat.transposed() for f in v]
+
+
+def connect(connections, ctype, child, parent, prop=None):
+	c = connections.add_elem(b"C")
+	c.add_string(ctype)
+	c.add_int64(child)
+	c.add_int64(parent)
+	if prop is not None:
+		c.add_string(prop)
+
+
+def add_object(objects, id, elem_type, name, cls, subtype):
+	elem = objects.add_elem(elem_type)
+	elem.add_int64(id)
+	elem.add_string(fbx_name_class(name, cls))
+	elem.add_string(subtype)
+	return elem
+
+
+def add_single(parent, id, kind, value):
+	elem = parent.add_elem(id)
+	getattr(elem, "add_" + kind)(value)
+	return elem
+
+
+def add_model_props(model, loc, rot, scale):
+	props = model.add_elem(b"Properties70")
+	add_p(props, b"Lcl Translation", "Lcl Translation", loc, True)
+	add_p(props, b"Lcl Rotation", "Lcl Rotation", tuple_rad_to_deg(rot), True)
+	add_p(props, b"Lcl Scaling", "Lcl Scaling", scale, True)
+	add_p(props, b"DefaultAttributeIndex", "int", 0)
+	add_p(props, b"InheritType", "enum", 1)
+	return props
+
+
+def add_model(objects, id, name, subtype, loc, rot, scale):
+	model = add_object(objects, id, b"Model", name, b"Model", subtype)
+	add_single(model, b"Version", "int32", 232)
+	add_model_props(model, loc, rot, scale)
+	add_single(model, b"MultiLayer", "int32", 0)
+	add_single(model, b"MultiTake", "int32", 0)
+	add_single(model, b"Shading", "bool", True)
+	add_single(model, b"Culling", "string", "CullingOff")
+	return model
+
+
+def add_layer_element(parent, id, index, name, mapping, reference, version=101):
+	elem = parent.add_elem(id)
+	elem.add_int32(index)
+	add_single(elem, b"Version", "int32", version)
+	add_single(elem, b"Name", "string", name)
+	add_single(elem, b"MappingInformationType", "string", mapping)
+	add_single(elem, b"ReferenceInformationType", "string", reference)
+	return elem
+
+
+def add_corner_layer(parent, id, index, name, data_id, index_id, values, dedup):
+	'''	ByPolygonVertex layer element
+		- dedup: IndexToDirect, every distinct value once plus an index per corner
+		- otherwise layers with an index_id get an index that counts up, others are Direct
+	'''
+	if dedup:
+		values, indices = unique_rows(values)
+	elif index_id:
+		indices = np.arange(len(values))
+	else:
+		indices = None
+
+	elem = add_layer_element(parent, id, index, name, "ByPolygonVertex",
+							 "Direct" if indices is None else "IndexToDirect")
+	add_single(elem, data_id, "float64_array", values)
+	if indices is not None:
+		add_single(elem, index_id, "int32_array", indices)
+	return elem
+
+
+##############################################
+# Header + scene settings
+
+def write_header(root, filepath, scene, world_amb, fps, start, end):
+	curtime = time.localtime()[0:6]
+	creator = "FBX Custom 7.4 - Blender %s" % bpy.app.version_string
+
+	header = root.add_elem(b"FBXHeaderExtension")
+	add_single(header, b"FBXHeaderVersion", "int32", 1003)
+	add_single(header, b"FBXVersion", "int32", fbx_version)
+	add_single(header, b"EncryptionType", "int32", 0)
+
+	stamp = header.add_elem(b"CreationTimeStamp")
+	add_single(stamp, b"Version", "int32", 1000)
+	for id, value in zip((b"Year", b"Month", b"Day", b"Hour", b"Minute", b"Second"), curtime):
+		add_single(stamp, id, "int32", value)
+	add_single(stamp, b"Millisecond", "int32", 0)
+
+	add_single(header, b"Creator", "string", creator)
+
+	info = header.add_elem(b"SceneInfo")
+	info.add_string(fbx_name_class("GlobalInfo", b"SceneInfo"))
+	info.add_string("UserData")
+	add_single(info, b"Type", "string", "UserData")
+	add_single(info, b"Version", "int32", 100)
+	meta = info.add_elem(b"MetaData")
+	add_single(meta, b"Version", "int32", 100)
+	for id in (b"Title", b"Subject", b"Author", b"Keywords", b"Revision", b"Comment"):
+		add_single(meta, id, "string", "")
+
+	props = info.add_elem(b"Properties70")
+	add_p(props, b"DocumentUrl", "KStringUrl", filepath)
+	add_p(props, b"SrcDocumentUrl", "KStringUrl", filepath)
+	for prefix in (b"Original", b"LastSaved"):
+		add_p(props, prefix, "Compound")
+		add_p(props, prefix + b"|ApplicationVendor", "KString", "")
+		add_p(props, prefix + b"|ApplicationName", "KString", "Blender")
+		add_p(props, prefix + b"|ApplicationVersion", "KString", bpy.app.version_string)
+		add_p(props, prefix + b"|DateTime_GMT", "DateTime", "")
+	add_p(props, b"Original|FileName", "KString", "")
+
+	add_single(root, b"FileId", "bytes", fbx_file_id)
+	add_single(root, b"CreationTime", "string", fbx_creation_time)
+	add_single(root, b"Creator", "string", creator)
+
+	settings = root.add_elem(b"GlobalSettings")
+	add_single(settings, b"Version", "int32", 1000)
+	props = settings.add_elem(b"Properties70")
+	add_p(props, b"UpAxis", "int", 1)
+	add_p(props, b"UpAxisSign", "int", 1)
+	add_p(props, b"FrontAxis", "int", 2)
+	add_p(props, b"FrontAxisSign", "int", 1)
+	add_p(props, b"CoordAxis", "int", 0)
+	add_p(props, b"CoordAxisSign", "int", 1)
+	add_p(props, b"OriginalUpAxis", "int", -1)
+	add_p(props, b"OriginalUpAxisSign", "int", 1)
+	add_p(props, b"UnitScaleFactor", "double", 1.0)
+	add_p(props, b"OriginalUnitScaleFactor", "double", 1.0)
+	add_p(props, b"AmbientColor", "ColorRGB", world_amb)
+	add_p(props, b"DefaultCamera", "KString", "Producer Perspective")
+	add_p(props, b"TimeMode", "enum", fbx_time_modes.get(int(fps), 14))
+	add_p(props, b"TimeProtocol", "enum", 2)
+	add_p(props, b"SnapOnFrameMode", "enum", 0)
+	add_p(props, b"TimeSpanStart", "KTime", fbx_time(start - 1, fps))
+	add_p(props, b"TimeSpanStop", "KTime", fbx_time(end - 1, fps))
+	add_p(props, b"CustomFrameRate", "double", fps)
+	add_p(props, b"CurrentTimeMarker", "KTime", -1)
+
+	documents = root.add_elem(b"Documents")
+	add_single(documents, b"Count", "int32", 1)
+	doc = documents.add_elem(b"Document")
+	doc.add_int64(fbx_id_document)
+	doc.add_string("Scene")
+	doc.add_string("Scene")
+	props = doc.add_elem(b"Properties70")
+	add_p(props, b"SourceObject", "object")
+	add_p(props, b"ActiveAnimStackName", "KString", "")
+	add_single(doc, b"RootNode", "int64", fbx_id_root)
+
+	root.add_elem(b"References")
+
+
+def write_definitions(root, objects):
+	counts = {}
+	for elem in objects.elems:
+		counts[elem.id] = counts.get(elem.id, 0) + 1
+
+	definitions = root.add_elem(b"Definitions")
+	add_single(definitions, b"Version", "int32", 100)
+	add_single(definitions, b"Count", "int32", 1 + sum(counts.values()))
+
+	objtype = definitions.add_elem(b"ObjectType")
+	objtype.add_string(b"GlobalSettings")
+	add_single(objtype, b"Count", "int32", 1)
+
+	for id in fbx_definition_types:
+		if counts.get(id):
+			objtype = definitions.add_elem(b"ObjectType")
+			objtype.add_string(id)
+			add_single(objtype, b"Count", "int32", counts[id])
+
+
+##############################################
+# Meshes
+
+def edge_start_corners(data):
+	'''	index of the face corner each mesh edge starts at (the first one if
+		several faces share it) and a mask of the edges any face uses
+	'''
+	sizes = data.face_sizes
+	starts = np.cumsum(sizes) - sizes
+	corner_next = np.arange(1, len(data.polyverts) + 1)
+	corner_next[starts + sizes - 1] = starts
+
+	# edges as min * V + max keys, np.unique keeps the first corner of each
+	nverts = max(len(data.vertcos), 1)
+	v1 = data.polyverts.astype(np.int64)
+	v2 = v1[corner_next]
+	keys, first = np.unique(np.minimum(v1, v2) * nverts + np.maximum(v1, v2), return_index=True)
+
+	ed = data.edges.astype(np.int64)
+	edge_keys = ed.min(axis=1) * nverts + ed.max(axis=1)
+	if not len(keys):
+		return np.zeros(len(ed), dtype=np.int32), np.zeros(len(ed), dtype=bool)
+	pos = np.minimum(np.searchsorted(keys, edge_keys), len(keys) - 1)
+	return first[pos].astype(np.int32), keys[pos] == edge_keys
+
+
+def write_mesh_geometry(objects, operator, my_mesh, geom_id, mesh_smooth_type, merge_vertexcollayers,
+		normals_export_mode, export_tangentspace_base, tangentspace_uvlnum, dedup=True,
+		vertexcol_merge_mode='ADD', profiler=profiler_off):
+	me = my_mesh.blenData
+	meshobject = my_mesh.blenObject
+
+	data = mesh_arrays(me, mesh_smooth_type == 'EDGE', my_mesh.blenTessfaces)
+	is_collision = ("UCX_" in meshobject.name)
+
+	me_normals, me_tangents, me_binormals, export_tangents = get_mesh_shading(
+		operator, me, meshobject, data, is_collision,
+		normals_export_mode, export_tangentspace_base, tangentspace_uvlnum, profiler
+	)
+
+	geom = add_object(objects, geom_id, b"Geometry", meshobject.name, b"Geometry", "Mesh")
+	geom.add_elem(b"Properties70")
+	add_single(geom, b"GeometryVersion", "int32", 124)
+
+	add_single(geom, b"Vertices", "float64_array", data.vertcos)
+
+	# face corners, the last index of each face XORd w. -1
+	face_ends = np.cumsum(data.face_sizes)
+	polyverts = data.polyverts.copy()
+	polyverts[face_ends - 1] ^= -1
+	add_single(geom, b"PolygonVertexIndex", "int32_array", polyverts)
+
+	layer_elems = []
+
+	add_corner_layer(geom, b"LayerElementNormal", 0, "", b"Normals", b"NormalsIndex", me_normals, dedup)
+	layer_elems.append((b"LayerElementNormal", 0))
+
+	if export_tangents:
+		add_corner_layer(geom, b"LayerElementBinormal", 0, "", b"Binormals", b"BinormalsIndex", me_binormals, dedup)
+		add_corner_layer(geom, b"LayerElementTangent", 0, "", b"Tangents", b"TangentsIndex", me_tangents, dedup)
+		layer_elems.append((b"LayerElementBinormal", 0))
+		layer_elems.append((b"LayerElementTangent", 0))
+
+	# Smoothing
+	if mesh_smooth_type == 'FACE' or is_collision:
+		elem = add_layer_element(geom, b"LayerElementSmoothing", 0, "", "ByPolygon", "Direct", 102)
+		add_single(elem, b"Smoothing", "int32_array", data.face_smooth)
+		layer_elems.append((b"LayerElementSmoothing", 0))
+	elif mesh_smooth_type == 'EDGE':
+		# fbx 7 edges are indices into PolygonVertexIndex, pointing at the
+		# corner each edge starts at (the first one if several faces share it)
+		edges, edge_found = edge_start_corners(data)
+		add_single(geom, b"Edges", "int32_array", edges[edge_found])
+		elem = add_layer_element(geom, b"LayerElementSmoothing", 0, "", "ByEdge", "Direct", 102)
+		add_single(elem, b"Smoothing", "int32_array", ~data.edges_sharp[edge_found])
+		layer_elems.append((b"LayerElementSmoothing", 0))
+
+	# Vertex colors
+	if merge_vertexcollayers:
+		colors = merge_color_layers(data.color_layers, vertexcol_merge_mode)
+	else:
+		colors = list(data.color_layers)
+	for colindex, (name, cols) in enumerate(colors):
+		rgba = np.ones((len(cols), 4), dtype=np.float64)
+		rgba[:, :cols.shape[1]] = cols
+		add_corner_layer(geom, b"LayerElementColor", colindex, name, b"Colors", b"ColorIndex", rgba, dedup)
+
+	# UVs
+	uvlayers = data.uv_layers
+	for uvindex, (name, uvs) in enumerate(uvlayers):
+		add_corner_layer(geom, b"LayerElementUV", uvindex, name, b"UV", b"UVIndex", uvs, dedup)
+
+	# Materials, indices follow the order materials are connected to the model
+	if my_mesh.blenMaterials:
+		if len(my_mesh.blenMaterials) == 1:
+			elem = add_layer_element(geom, b"LayerElementMaterial", 0, "", "AllSame", "IndexToDirect")
+			add_single(elem, b"Materials", "int32_array", (0,))
+		else:
+			elem = add_layer_element(geom, b"LayerElementMaterial", 0, "", "ByPolygon", "IndexToDirect")
+			add_single(elem, b"Materials", "int32_array", my_mesh.blenFaceMaterials.material_ids)
+		layer_elems.append((b"LayerElementMaterial", 0))
+
+	if colors:
+		layer_elems.append((b"LayerElementColor", 0))
+	if uvlayers:
+		layer_elems.append((b"LayerElementUV", 0))
+
+	layers = [layer_elems]
+	for i in range(1, max(len(uvlayers), len(colors))):
+		extra = []
+		if i < len(uvlayers):
+			extra.append((b"LayerElementUV", i))
+		if i < len(colors):
+			extra.append((b"LayerElementColor", i))
+		layers.append(extra)
+
+	for i, layer_elems in enumerate(layers):
+		layer = geom.add_elem(b"Layer")
+		layer.add_int32(i)
+		add_single(layer, b"Version", "int32", 100)
+		for type, index in layer_elems:
+			elem = layer.add_elem(b"LayerElement")
+			add_single(elem, b"Type", "string", type)
+			add_single(elem, b"TypedIndex", "int32", index)
+
+	return geom
+
+
+def write_mesh_shapes(objects, connections, my_mesh, geom_id, use_shape_normals=False):
+	key_blocks = my_mesh.blenObject.data.shape_keys.key_blocks[:]
+
+	shape_id = add_fbx_index(exporter_data.index_fbxShapes, my_mesh.fbxName, 600000)
+	blendshape = add_object(objects, shape_id, b"Deformer", my_mesh.fbxName, b"Deformer", "BlendShape")
+	add_single(blendshape, b"Version", "int32", 100)
+	connect(connections, "OO", shape_id, geom_id)
+
+	for name, indices, deltas, normals in shape_key_deltas(my_mesh.blenData, key_blocks, use_shape_normals):
+		shapename = "%s|%s" % (my_mesh.fbxName, name)
+
+		channel_id = add_fbx_index(exporter_data.index_fbxShapeChannels, shapename, 610000)
+		channel = add_object(objects, channel_id, b"Deformer", name, b"SubDeformer", "BlendShapeChannel")
+		add_single(channel, b"Version", "int32", 100)
+		add_single(channel, b"DeformPercent", "float64", 0.0)
+		add_single(channel, b"FullWeights", "float64_array", (100.0,))
+
+		shapegeom_id = add_fbx_index(exporter_data.index_fbxShapeGeom, shapename, 110000)
+		shape = add_object(objects, shapegeom_id, b"Geometry", name, b"Geometry", "Shape")
+		add_single(shape, b"Version", "int32", 100)
+		add_single(shape, b"Indexes", "int32_array", indices)
+		add_single(shape, b"Vertices", "float64_array", deltas)
+		if normals is None:
+			normals = np.zeros(len(indices) * 3)
+		add_single(shape, b"Normals", "float64_array", normals)
+
+		connect(connections, "OO", shapegeom_id, channel_id)
+		connect(connections, "OO", channel_id, shape_id)
+
+
+def write_mesh_skin(objects, connections, my_mesh, geom_id, ob_bones, profiler=profiler_off):
+	skin_id = get_fbx_DeformerSkinID(my_mesh.fbxName)
+	skin = add_object(objects, skin_id, b"Deformer", my_mesh.fbxName, b"Deformer", "Skin")
+	add_single(skin, b"Version", "int32", 101)
+	add_single(skin, b"Link_DeformAcuracy", "float64", 50.0)
+	connect(connections, "OO", skin_id, geom_id)
+
+	if my_mesh.fbxBoneParent:
+		weights = None
+	else:
+		profiler.begin("skin_weights")
+		weights = meshNormalizedWeights(my_mesh.blenObject, my_mesh.blenData)
+		profiler.end("skin_weights")
+
+	profiler.begin("skin_write")
+	for my_bone in ob_bones:
+		if my_mesh.fbxName not in my_bone.blenMeshes:
+			continue
+
+		if my_mesh.fbxBoneParent:
+			if my_mesh.fbxBoneParent == my_bone:
+				vgroup_data = [(j, 1.0) for j in range(len(my_mesh.blenData.vertices))]
+			else:
+				vgroup_data = []
+		elif my_bone.blenName in weights[0]:
+			group_index = weights[0].index(my_bone.blenName)
+			vgroup_data = [(j, weight[group_index]) for j, weight in enumerate(weights[1]) if weight[group_index]]
+		else:
+			vgroup_data = []
+
+		global_bone_matrix = (my_bone.fbxArm.matrixWorld * my_bone.restMatrix) * mtx4_z90
+		transform_matrix = global_bone_matrix.inverted() * my_mesh.matrixWorld
+
+		cluster_id = get_fbx_DeformerClusterID("%s %s" % (my_mesh.fbxName, my_bone.fbxName))
+		cluster = add_object(objects, cluster_id, b"Deformer",
+							 "Cluster %s %s" % (my_mesh.fbxName, my_bone.fbxName), b"SubDeformer", "Cluster")
+		add_single(cluster, b"Version", "int32", 100)
+		userdata = cluster.add_elem(b"UserData")
+		userdata.add_string("")
+		userdata.add_string("")
+		add_single(cluster, b"Indexes", "int32_array", [vg[0] for vg in vgroup_data])
+		add_single(cluster, b"Weights", "float64_array", [vg[1] for vg in vgroup_data])
+		add_single(cluster, b"Transform", "float64_array", matrix_to_array(transform_matrix))
+		add_single(cluster, b"TransformLink", "float64_array", matrix_to_array(global_bone_matrix))
+
+		connect(connections, "OO", cluster_id, skin_id)
+		connect(connections, "OO", get_fbx_BoneID(my_bone.fbxName), cluster_id)
+	profiler.end("skin_write")
+
+
+##############################################
+# Materials + Textures
+
+def write_material(objects, mat_id, matname, mat, world_amb):
+	mat_cols = mat_cold = 0.8, 0.8, 0.8
+	mat_colamb = 0.0, 0.0, 0.0
+	mat_dif = 1.0
+	mat_amb = 0.5
+	mat_hard = 20.0
+	mat_spec = 0.2
+	mat_alpha = 1.0
+	mat_emit = 0.0
+	mat_shadeless = False
+	mat_shader = 'Phong'
+	if mat:
+		mat_cold = tuple(mat.diffuse_color)
+		mat_cols = tuple(mat.specular_color)
+		mat_colamb = world_amb
+		mat_dif = mat.diffuse_intensity
+		mat_amb = mat.ambient
+		mat_hard = (float(mat.specular_hardness) - 1.0) / 5.10
+		mat_spec = mat.specular_intensity / 2.0
+		mat_alpha = mat.alpha
+		mat_emit = mat.emit
+		mat_shadeless = mat.use_shadeless
+		if mat_shadeless or mat.diffuse_shader == 'LAMBERT':
+			mat_shader = 'Lambert'
+
+	material = add_object(objects, mat_id, b"Material", matname, b"Material", "")
+	add_single(material, b"Version", "int32", 102)
+	add_single(material, b"ShadingModel", "string", mat_shader.lower())
+	add_single(material, b"MultiLayer", "int32", 0)
+
+	props = material.add_elem(b"Properties70")
+	add_p(props, b"EmissiveColor", "Color", mat_cold, True)
+	add_p(props, b"EmissiveFactor", "Number", mat_emit, True)
+	add_p(props, b"AmbientColor", "Color", mat_colamb, True)
+	add_p(props, b"AmbientFactor", "Number", mat_amb, True)
+	add_p(props, b"DiffuseColor", "Color", mat_cold, True)
+	add_p(props, b"DiffuseFactor", "Number", mat_dif, True)
+	add_p(props, b"TransparentColor", "Color", (1.0, 1.0, 1.0), True)
+	add_p(props, b"TransparencyFactor", "Number", 1.0 - mat_alpha, True)
+	add_p(props, b"Opacity", "double", mat_alpha)
+	if not mat_shadeless:
+		add_p(props, b"SpecularColor", "Color", mat_cols, True)
+		add_p(props, b"SpecularFactor", "Number", mat_spec, True)
+		add_p(props, b"ShininessExponent", "Number", mat_hard, True)
+		add_p(props, b"ReflectionColor", "Color", (0.0, 0.0, 0.0), True)
+		add_p(props, b"ReflectionFactor", "Number", 1.0, True)
+
+
+def write_texture(objects, tex_id, video_id, texname, tex, base_src, base_dst, copy_set):
+	if tex:
+		fname_rel = bpy_extras_path_reference(tex, base_src, base_dst, copy_set)
+		fname_strip = bpy.path.basename(fname_rel)
+	else:
+		fname_strip = fname_rel = ""
+
+	video = add_object(objects, video_id, b"Video", texname, b"Video", "Clip")
+	add_single(video, b"Type", "string", "Clip")
+	props = video.add_elem(b"Properties70")
+	add_p(props, b"Path", "KStringXRefUrl", fname_strip)
+	add_single(video, b"UseMipMap", "int32", 0)
+	add_single(video, b"Filename", "string", fname_strip)
+	add_single(video, b"RelativeFilename", "string", fname_rel)
+
+	texture = add_object(objects, tex_id, b"Texture", texname, b"Texture", "")
+	add_single(texture, b"Type", "string", "TextureVideoClip")
+	add_single(texture, b"Version", "int32", 202)
+	add_single(texture, b"TextureName", "string", fbx_name_class(texname, b"Texture"))
+	props = texture.add_elem(b"Properties70")
+	add_p(props, b"UseMaterial", "bool", 1)
+	add_p(props, b"WrapModeU", "enum", tex.use_clamp_x if tex else 0)
+	add_p(props, b"WrapModeV", "enum", tex.use_clamp_y if tex else 0)
+	add_single(texture, b"Media", "string", fbx_name_class(texname, b"Video"))
+	add_single(texture, b"FileName", "string", fname_strip)
+	add_single(texture, b"RelativeFilename", "string", fname_rel)
+	uvtrans = texture.add_elem(b"ModelUVTranslation")
+	uvtrans.add_float64(0.0)
+	uvtrans.add_float64(0.0)
+	uvscale = texture.add_elem(b"ModelUVScaling")
+	uvscale.add_float64(1.0)
+	uvscale.add_float64(1.0)
+	add_single(texture, b"Texture_Alpha_Source", "string", "None")
+	cropping = texture.add_elem(b"Cropping")
+	for i in range(4):
+		cropping.add_int32(0)
+
+
+def bpy_extras_path_reference(tex, base_src, base_dst, copy_set):
+	import bpy_extras.io_utils
+	return bpy_extras.io_utils.path_reference(tex.filepath, base_src, base_dst, 'AUTO', "", copy_set, tex.library)
+
+
+##############################################
+# Animation
+
+def get_export_actions(ob_arms, use_anim_action_all, use_default_take):
+	'''	same action selection as the ascii takes
+		- returns the actions to export (None for the default take) and the current take
+	'''
+	tmp_actions = []
+	blenActionDefault = None
+	action_lastcompat = None
+	tagged_actions = []
+
+	for my_arm in ob_arms:
+		blenActionDefault = my_arm.blenAction
+		if blenActionDefault:
+			break
+
+	if use_anim_action_all:
+		tmp_actions = bpy.data.actions[:]
+	elif not use_default_take:
+		if blenActionDefault:
+			tmp_actions.append(blenActionDefault)
+
+	if tmp_actions:
+		for my_arm in ob_arms:
+			arm_bone_names = set([my_bone.blenName for my_bone in my_arm.fbxBones])
+			for action in tmp_actions:
+				if arm_bone_names.intersection(action_bone_names(my_arm.blenObject, action)):
+					my_arm.blenActionList.append(action)
+					tagged_actions.append(action.name)
+					action_lastcompat = action
+
+		if tagged_actions and not blenActionDefault:
+			blenActionDefault = action_lastcompat
+
+	tmp_actions = [action for action in tmp_actions if action.name in tagged_actions]
+	if use_default_take:
+		tmp_actions.insert(0, None)
+
+	return tmp_actions, blenActionDefault
+
+
+def write_anim_curve(objects, connections, node_id, axis, keys, fps, precision_float, profiler=profiler_off):
+	'''	keys: list of (value, frame) with frames already shifted to start at 0 '''
+	if precision_float is not None:
+		profiler.begin("key_reduction")
+		reduce_anim_keys(keys, precision_float)
+		profiler.end("key_reduction")
+		if len(keys) == 2 and keys[0][0] == keys[1][0]:
+			del keys[1]
+
+	curve_id = add_fbx_index(exporter_data.index_fbxAnimCurves, node_id * 10 + axis, 2000000)
+	curve = add_object(objects, curve_id, b"AnimationCurve", "", b"AnimCurve", "")
+	add_single(curve, b"Default", "float64", keys[0][0])
+	add_single(curve, b"KeyVer", "int32", 4009)
+	add_single(curve, b"KeyTime", "int64_array", [fbx_time(frame, fps) for val, frame in keys])
+	add_single(curve, b"KeyValueFloat", "float32_array", [val for val, frame in keys])
+	add_single(curve, b"KeyAttrFlags", "int32_array", (fbx_key_attr_flags,))
+	add_single(curve, b"KeyAttrDataFloat", "float32_array", fbx_key_attr_data)
+	add_single(curve, b"KeyAttrRefCount", "int32_array", (len(keys),))
+
+	connect(connections, "OP", curve_id, node_id, "d|" + "XYZ"[axis])
+
+
+def write_anim_take(objects, connections, takes, scene, take_name, act_start, act_end, fps,
+		anim_objects, precision_float, profiler=profiler_off):
+	stack_id = add_fbx_index(exporter_data.index_fbxAnimStacks, take_name, 800000)
+	layer_id = add_fbx_index(exporter_data.index_fbxAnimLayers, take_name, 810000)
+
+	time_start = fbx_time(act_start - 1, fps)
+	time_end = fbx_time(act_end - 1, fps)
+
+	stack = add_object(objects, stack_id, b"AnimationStack", take_name, b"AnimStack", "")
+	props = stack.add_elem(b"Properties70")
+	add_p(props, b"LocalStart", "KTime", time_start)
+	add_p(props, b"LocalStop", "KTime", time_end)
+	add_p(props, b"ReferenceStart", "KTime", time_start)
+	add_p(props, b"ReferenceStop", "KTime", time_end)
+	add_object(objects, layer_id, b"AnimationLayer", "BaseLayer", b"AnimLayer", "")
+	connect(connections, "OO", layer_id, stack_id)
+
+	profiler.begin("anim_sampling")
+	frame = act_start
+	while frame <= act_end:
+		scene.frame_set(frame)
+		for my_ob, model_id in anim_objects:
+			my_ob.setPoseFrame(frame)
+		frame += 1
+	profiler.end("anim_sampling")
+
+	for my_ob, model_id in anim_objects:
+		profiler.begin("anim_sampling")
+		anim_mats = [(my_ob.getAnimParRelMatrix(frame), my_ob.getAnimParRelMatrixRot(frame)) for frame in range(act_start, act_end + 1)]
+		profiler.end("anim_sampling")
+
+		for TX_CHAN, prop in (('T', b"Lcl Translation"), ('R', b"Lcl Rotation"), ('S', b"Lcl Scaling")):
+			if TX_CHAN == 'T':
+				anim_vecs = [mtx[0].to_translation() for mtx in anim_mats]
+			elif TX_CHAN == 'S':
+				anim_vecs = [mtx[0].to_scale() for mtx in anim_mats]
+			else:
+				# use the previous euler for compatible conversion
+				anim_vecs = []
+				prev_eul = None
+				for mtx in anim_mats:
+					if prev_eul:
+						prev_eul = mtx[1].to_euler('XYZ', prev_eul)
+					else:
+						prev_eul = mtx[1].to_euler()
+					anim_vecs.append(tuple_rad_to_deg(prev_eul))
+
+			node_id = add_fbx_index(exporter_data.index_fbxAnimCurveNodes, (take_name, model_id, TX_CHAN), 1000000)
+			node = add_object(objects, node_id, b"AnimationCurveNode", TX_CHAN, b"AnimCurveNode", "")
+			props = node.add_elem(b"Properties70")
+			for i in range(3):
+				add_p(props, b"d|" + b"XYZ"[i:i + 1], "Number", anim_vecs[0][i], True)
+
+			connect(connections, "OO", node_id, layer_id)
+			connect(connections, "OP", node_id, model_id, prop)
+
+			for i in range(3):
+				keys = [(vec[i], j + act_start - 1) for j, vec in enumerate(anim_vecs)]
+				write_anim_curve(objects, connections, node_id, i, keys, fps, precision_float, profiler)
+
+	take = takes.add_elem(b"Take")
+	take.add_string(take_name)
+	add_single(take, b"FileName", "string", "%s.tak" % take_name.replace(" ", "_"))
+	localtime = take.add_elem(b"LocalTime")
+	localtime.add_int64(time_start)
+	localtime.add_int64(time_end)
+	reftime = take.add_elem(b"ReferenceTime")
+	reftime.add_int64(time_start)
+	reftime.add_int64(time_end)
+
+
+##############################################
+
+def write_binary(operator, file, scene, filepath, object_tx,
+		ob_meshes, ob_bones, ob_arms, ob_null, materials, textures,
+		global_matrix, world_amb, base_src, base_dst, copy_set,
+		mesh_smooth_type, normals_export_mode, export_tangentspace_base, tangentspace_uvlnum,
+		use_anim, use_anim_optimize, anim_optimize_precision, use_anim_action_all, use_default_take,
+		merge_vertexcollayers=False, vertexcol_merge_mode='ADD', use_layer_dedup=True, use_shape_normals=False,
+		profiler=profiler_off):
+	'''	builds the node tree from the data collected in save_single and writes it to file '''
+	exporter_data.clear_fbxData()
+
+	# fill the id index
+	for my_mesh in ob_meshes:
+		exporter_data.index_fbxModels.append(my_mesh.fbxName)
+		exporter_data.fbx_meshes.append(my_mesh)
+		if my_mesh.fbxArm:
+			exporter_data.index_fbxSkins.append(my_mesh.fbxName)
+	for my_bone in ob_bones:
+		exporter_data.index_fbxBones.append(my_bone.fbxName)
+		exporter_data.fbx_bones.append(my_bone)
+		for fbxMeshObName in my_bone.blenMeshes:
+			exporter_data.index_fbxClusters.append("%s %s" % (fbxMeshObName, my_bone.fbxName))
+	for my_null in ob_null:
+		exporter_data.index_fbxNulls.append(my_null.fbxName)
+		exporter_data.fbx_nulls.append(my_null)
+	for matname, mat_tex_pair in materials:
+		exporter_data.index_fbxMaterials.append(matname)
+	for texname, tex in textures:
+		exporter_data.index_fbxTextures.append(texname)
+
+	render = scene.render
+	fps = float(render.fps)
+	start = scene.frame_start
+	end = scene.frame_end
+	if end < start:
+		start, end = end, start
+
+	root = fbx_elem(b"")
+	write_header(root, filepath, scene, world_amb, fps, start, end)
+
+	objects = fbx_elem(b"Objects")
+	connections = fbx_elem(b"Connections")
+	pose_items = exporter_data.fbx_poses
+
+	# models that are written, used for parenting
+	model_ids = {}
+	for my_mesh in ob_meshes:
+		model_ids[my_mesh] = get_fbx_MeshID(my_mesh.fbxName)
+	for my_null in ob_null:
+		model_ids[my_null] = get_fbx_NullModelID(my_null.fbxName)
+
+	def parent_id(my_ob):
+		# deformed meshes are not parented or they get transformed twice
+		if my_ob.fbxParent and not my_ob.fbxArm:
+			return model_ids.get(my_ob.fbxParent, fbx_id_root)
+		return fbx_id_root
+
+	# Nulls
+	for my_null in ob_null:
+		model_id = model_ids[my_null]
+		attr_id = get_fbx_NullAttributeID(my_null.fbxName)
+		loc, rot, scale, matrix, matrix_rot = object_tx(my_null.blenObject, None, my_null.parRelMatrix())
+		add_model(objects, model_id, my_null.fbxName, "Null", loc, rot, scale)
+		attr = add_object(objects, attr_id, b"NodeAttribute", my_null.fbxName, b"NodeAttribute", "Null")
+		add_single(attr, b"TypeFlags", "string", "Null")
+		pose_items.append((model_id, matrix))
+		connect(connections, "OO", attr_id, model_id)
+		connect(connections, "OO", model_id, parent_id(my_null))
+
+	# Meshes
+	material_ids = dict((mat_tex_pair, get_fbx_MaterialID(matname)) for matname, mat_tex_pair in materials)
+	profiler.begin("mesh_write")
+	for my_mesh in ob_meshes:
+		meshobject = my_mesh.blenObject
+		model_id = model_ids[my_mesh]
+		# instances connect their Model to the Geometry written for the first one
+		geom_id = get_fbx_GeomID(my_mesh.fbxGeometry.fbxName)
+
+		# use global matrix here to apply scale + axis settings to the mesh
+		loc, rot, scale, matrix, matrix_rot = object_tx(meshobject, None, my_mesh.blenMatrix * global_matrix)
+		add_model(objects, model_id, my_mesh.fbxName, "Mesh", loc, rot, scale)
+		record = profiler.object_begin(my_mesh.fbxName, 'MESH')
+		if my_mesh.fbxGeometry is my_mesh:
+			write_mesh_geometry(objects, operator, my_mesh, geom_id, mesh_smooth_type, merge_vertexcollayers,
+								normals_export_mode, export_tangentspace_base, tangentspace_uvlnum,
+								use_layer_dedup, vertexcol_merge_mode, profiler)
+		pose_items.append((model_id, my_mesh.matrixWorld * mtx4_z90))
+
+		connect(connections, "OO", geom_id, model_id)
+		connect(connections, "OO", model_id, parent_id(my_mesh))
+		for mat_tex_pair in my_mesh.blenMaterials:
+			connect(connections, "OO", material_ids[mat_tex_pair], model_id)
+
+		if (my_mesh.fbxGeometry is my_mesh and meshobject.type == 'MESH' and meshobject.data.shape_keys and
+				len(meshobject.data.vertices) == len(my_mesh.blenData.vertices)):
+			write_mesh_shapes(objects, connections, my_mesh, geom_id, use_shape_normals)
+
+		if my_mesh.fbxArm:
+			write_mesh_skin(objects, connections, my_mesh, geom_id, ob_bones, profiler)
+
+		me = my_mesh.blenData
+		profiler.object_end(record,
+			vertices=len(me.vertices), faces=len(me.tessfaces if my_mesh.blenTessfaces else me.polygons),
+			edges=len(me.edges), uv_layers=len(me.uv_textures), color_layers=len(me.vertex_colors),
+			materials=len(my_mesh.blenMaterials), instance=my_mesh.fbxGeometry is not my_mesh,
+		)
+	profiler.end("mesh_write")
+
+	# Bones
+	for my_bone in ob_bones:
+		model_id = get_fbx_BoneID(my_bone.fbxName)
+		attr_id = get_fbx_BoneAttributeID(my_bone.fbxName)
+		loc, rot, scale, matrix, matrix_rot = object_tx(my_bone.blenBone, None, None)
+		add_model(objects, model_id, my_bone.fbxName, "LimbNode", loc, rot, scale)
+
+		attr = add_object(objects, attr_id, b"NodeAttribute", my_bone.fbxName, b"NodeAttribute", "LimbNode")
+		props = attr.add_elem(b"Properties70")
+		add_p(props, b"Size", "double", 1.0)
+		add_p(props, b"LimbLength", "double", (my_bone.blenBone.head_local - my_bone.blenBone.tail_local).length)
+		add_single(attr, b"TypeFlags", "string", "Skeleton")
+
+		pose_items.append((model_id, (my_bone.fbxArm.matrixWorld * my_bone.restMatrix) * mtx4_z90))
+
+		connect(connections, "OO", attr_id, model_id)
+		if my_bone.parent:
+			connect(connections, "OO", model_id, get_fbx_BoneID(my_bone.parent.fbxName))
+		else:
+			connect(connections, "OO", model_id, fbx_id_root)
+
+	# Materials + Textures
+	for matname, (mat, tex) in materials:
+		write_material(objects, get_fbx_MaterialID(matname), matname, mat, world_amb)
+
+	texture_ids = {}
+	for texname, tex in textures:
+		tex_id = get_fbx_TextureID(texname)
+		video_id = get_fbx_VideoID(texname)
+		write_texture(objects, tex_id, video_id, texname, tex, base_src, base_dst, copy_set)
+		texture_ids[tex] = tex_id
+		connect(connections, "OO", video_id, tex_id)
+
+	for matname, (mat, tex) in materials:
+		if tex in texture_ids:
+			connect(connections, "OP", texture_ids[tex], get_fbx_MaterialID(matname), "DiffuseColor")
+
+	# Bind pose
+	pose = add_object(objects, fbx_id_pose, b"Pose", "BIND_POSES", b"Pose", "BindPose")
+	add_single(pose, b"Type", "string", "BindPose")
+	add_single(pose, b"Version", "int32", 100)
+	add_single(pose, b"NbPoseNodes", "int32", len(pose_items))
+	for model_id, matrix in pose_items:
+		posenode = pose.add_elem(b"PoseNode")
+		add_single(posenode, b"Node", "int64", model_id)
+		add_single(posenode, b"Matrix", "float64_array", matrix_to_array(matrix if matrix else Matrix()))
+
+	# Animation
+	takes = fbx_elem(b"Takes")
+	current_take = ""
+
+	# deformed meshes are not animated, same as the ascii takes
+	anim_objects = [(my_bone, get_fbx_BoneID(my_bone.fbxName)) for my_bone in ob_bones]
+	anim_objects += [(my_mesh, model_ids[my_mesh]) for my_mesh in ob_meshes if not my_mesh.fbxArm]
+	anim_objects += [(my_null, model_ids[my_null]) for my_null in ob_null]
+	exporter_data.ob_anim_lists.extend(anim_objects)
+
+	if use_anim and anim_objects:
+		profiler.begin("takes")
+		frame_orig = scene.frame_current
+		precision_float = (0.1 ** anim_optimize_precision) if use_anim_optimize else None
+
+		tmp_actions, blenActionDefault = get_export_actions(ob_arms, use_anim_action_all, use_default_take)
+		exporter_data.fbx_actions.extend(tmp_actions)
+		exporter_data.fbx_taggedactions.extend(action.name for action in tmp_actions if action)
+
+		if blenActionDefault and not use_default_take:
+			current_take = sane_takename(blenActionDefault)
+		else:
+			current_take = "Default Take"
+
+		for blenAction in tmp_actions:
+			if blenAction is None:
+				take_name = "Default Take"
+				act_start = start
+				act_end = end
+			else:
+				print('\taction: "%s" exporting...' % blenAction.name)
+				take_name = sane_name_mapping_take.get(blenAction.name)
+				if take_name is None:
+					take_name = sane_takename(blenAction)
+
+				act_start, act_end = blenAction.frame_range
+				act_start = int(act_start)
+				act_end = int(act_end)
+
+				for my_arm in ob_arms:
+					if my_arm.blenObject.animation_data and blenAction in my_arm.blenActionList:
+						my_arm.blenObject.animation_data.action = blenAction
+
+			take_record = profiler.object_begin(take_name, 'TAKE')
+			write_anim_take(objects, connections, takes, scene, take_name, act_start, act_end, fps,
+							anim_objects, precision_float, profiler)
+			profiler.object_end(take_record, frames=1 + act_end - act_start, models=len(anim_objects))
+
+			for my_arm in ob_arms:
+				if my_arm.blenObject.animation_data:
+					my_arm.blenObject.animation_data.action = my_arm.blenAction
+
+		scene.frame_set(frame_orig)
+		profiler.end("takes")
+
+	takes.elems.insert(0, fbx_elem(b"Current"))
+	takes.elems[0].add_string(current_take)
+
+	write_definitions(root, objects)
+	root.elems.append(objects)
+	root.elems.append(connections)
+	root.elems.append(takes)
+
+	profiler.begin("file_io")
+	write_file(file, root)
+	profiler.end("file_io")
+
+	exporter_data.clear_fbxData()
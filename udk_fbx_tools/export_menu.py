@@ -65,6 +65,25 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
 			description="Apply modifiers to mesh objects",
 			default=False,
 			)
+	use_instancing = BoolProperty(
+			name="Share Instance Geometry",
+			description=("Write the mesh of dupli instances and objects sharing mesh data once, "
+						"each object gets a Model connected to it (binary only)"),
+			default=True,
+			)
+	use_eval_cache = BoolProperty(
+			name="Cache Evaluated Meshes",
+			description=("Keep meshes with modifiers applied between exports, objects "
+						"whose data, modifiers and frame didn't change aren't evaluated again"),
+			default=False,
+			)
+	eval_cache_size = IntProperty(
+			name="Cached Meshes",
+			description="Number of evaluated meshes kept, least recently used ones are removed",
+			min=1, max=4096,
+			soft_min=1, soft_max=512,
+			default=32,
+			)
 	axis_forward = EnumProperty(
 			name="Forward",
 			items=(('-Z', "* -Z", ""),
@@ -127,6 +146,32 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
 			description="Combine vertex color layers r, g, b into rgb",
 			default=False,
 			)
+	vertexcol_merge_mode = EnumProperty(
+			name="Merge Mode",
+			items=(('ADD', "Add", "Sum the colors of all layers"),
+					('AVERAGE', "Average", "Average the colors of all layers"),
+					('CHANNELS', "RGBA Channels", "Pack the grey values of the first four layers into r, g, b and alpha"),
+					),
+			default='ADD',
+			description="How vertex color layers are merged"
+			)
+	use_layer_dedup = BoolProperty(
+			name="Deduplicate Layers",
+			description="Write each distinct UV and color once and index it per face corner "
+						"(normals and tangents too in binary files)",
+			default=True,
+			)
+	use_tessfaces = BoolProperty(
+			name="Tessellate Faces",
+			description="Export tessellated tris/quads instead of polygons, n-gons are split "
+						"(always used for Lengyel tangents)",
+			default=False,
+			)
+	use_shape_normals = BoolProperty(
+			name="Shape Key Normals",
+			description="Write how each shape key changes the vertex normals instead of zeros",
+			default=False,
+			)
 	use_armature_deform_only = BoolProperty(
 			name="Only Deform Bones",
 			description="Only write deforming bones",
@@ -163,6 +208,55 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
 			soft_min=1, soft_max=16,
 			default=6.0,
 			)
+	write_buffer_size = IntProperty(
+			name="Write Buffer (KB)",
+			description=("Size of the output buffer, text is written "
+						"to the file each time this much is collected"),
+			min=1, max=262144,
+			soft_min=64, soft_max=65536,
+			default=1024,
+			)
+	fbx_format = EnumProperty(
+			name="Format",
+			items=(('ASCII61', "ASCII 6.1", "Text FBX 6.1, same as the default exporter"),
+					('BIN74', "Binary 7.4", "Binary FBX 7.4, smaller and faster to write and import"),
+					),
+			default='ASCII61',
+			)
+	mesh_workers = IntProperty(
+			name="Mesh Workers",
+			description=("Number of processes formatting mesh data for ASCII files, "
+						"1 formats everything in Blender's process. Workers are forked "
+						"from Blender, on Windows meshes are always formatted serially"),
+			min=1, max=64,
+			soft_min=1, soft_max=16,
+			default=1,
+			)
+	use_export_cache = BoolProperty(
+			name="Cache Meshes",
+			description=("Reuse the mesh data written by earlier exports for "
+						"meshes that didn't change (ASCII only)"),
+			default=False,
+			)
+	export_cache_dir = StringProperty(
+			name="Cache Folder",
+			description="Folder for cached mesh data, empty uses the system's temp folder",
+			subtype='DIR_PATH',
+			default="",
+			)
+	export_cache_size = IntProperty(
+			name="Cache Size (MB)",
+			description="Least recently used mesh data is removed when the cache grows past this",
+			min=1, max=65536,
+			soft_min=16, soft_max=8192,
+			default=512,
+			)
+	use_profile = BoolProperty(
+			name="Write Profile",
+			description=("Time each export phase and object, the report is written "
+						"as JSON next to the exported file (name_profile.json)"),
+			default=False,
+			)
 	
 	#hidden options
 	batch_mode = EnumProperty(
@@ -207,8 +301,18 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
 			box = layout.box()
 			box.label("Mesh:")
 			box.row().prop(self, 'use_mesh_modifiers')
+			if self.use_mesh_modifiers:
+				box.row().prop(self, 'use_eval_cache')
+				if self.use_eval_cache:
+					box.row().prop(self, 'eval_cache_size')
 			box.row().prop(self, 'use_armature_deform_only')
+			box.row().prop(self, 'use_instancing')
 			box.row().prop(self, 'merge_vertexcollayers')
+			if self.merge_vertexcollayers:
+				box.row().prop(self, 'vertexcol_merge_mode')
+			box.row().prop(self, 'use_layer_dedup')
+			box.row().prop(self, 'use_tessfaces')
+			box.row().prop(self, 'use_shape_normals')
 			
 			box = layout.box()
 			box.label("Shading:")
@@ -234,6 +338,17 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
 			if self.use_anim_optimize:
 				box.row().prop(self, 'anim_optimize_precision')
 		
+		box = layout.box()
+		box.label("Output:")
+		box.row().prop(self, 'fbx_format')
+		box.row().prop(self, 'write_buffer_size')
+		box.row().prop(self, 'mesh_workers')
+		box.row().prop(self, 'use_export_cache')
+		if self.use_export_cache:
+			box.row().prop(self, 'export_cache_dir')
+			box.row().prop(self, 'export_cache_size')
+		box.row().prop(self, 'use_profile')
+		
 	
 	def execute(self, context):
 		from mathutils import Matrix
@@ -250,6 +365,10 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
 		keywords = self.as_keywords(ignore=("check_existing","filter_glob","axis_forward","axis_up"))
 		keywords["global_matrix"] = global_matrix
 		
+		# realtime normal edits that were not saved yet
+		from . import editorfunctions
+		editorfunctions.commit_pending(True)
+		
 		from . import export_fbx
 		return export_fbx.save(self, context, **keywords)
 
@@ -0,0 +1,71 @@
+############################################################
+# Parallel ASCII Geometry/Model block formatting
+#
+# - save_single extracts each mesh into a dict of plain values and
+#   numpy arrays on the main thread (everything that touches bpy)
+# - mesh_format_pool formats a batch of meshes with
+#   export_mesh_format.format_mesh in parallel and returns the blocks in
+#   the original order, the file is the same as a serial run
+# - workers are forked from Blender's process (POSIX only): a spawned
+#   worker would start sys.executable, which is the Blender binary, and
+#   importing this package needs bpy. Where fork isn't available meshes
+#   are formatted serially
+#
+
+import os
+
+from .export_mesh_format import format_mesh_timed
+
+
+def _fork_executor(workers):
+	'''	process pool forked from this process, None where fork can't be used '''
+	if os.name != 'posix':
+		return None
+	import multiprocessing
+	from concurrent.futures import ProcessPoolExecutor
+	try:
+		return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+	except TypeError:
+		# python < 3.7 has no mp_context, the default start method is used
+		if multiprocessing.get_start_method() != 'fork':
+			return None
+		return ProcessPoolExecutor(max_workers=workers)
+
+
+class mesh_format_pool(object):
+	'''	formats batches of meshes with format_mesh
+		- workers > 1 uses a forked process pool, results keep the input order
+		- falls back to formatting on the calling thread if the pool
+		  can't be started (no fork on this platform) or fails
+	'''
+	__slots__ = ("workers", "times", "_executor")
+
+	def __init__(self, workers):
+		self.workers = workers
+		self.times = []  # formatting time of each mesh in the last batch
+		self._executor = None
+		if workers > 1:
+			try:
+				self._executor = _fork_executor(workers)
+			except Exception as e:
+				print("mesh workers unavailable, formatting serially (%s)" % e)
+			if self._executor is None:
+				print("mesh workers need fork (Linux/macOS), formatting serially")
+
+	def format(self, meshes):
+		results = None
+		if self._executor is not None and len(meshes) > 1:
+			try:
+				results = list(self._executor.map(format_mesh_timed, meshes))
+			except Exception as e:
+				print("mesh workers failed, formatting serially (%s)" % e)
+				self.close()
+		if results is None:
+			results = [format_mesh_timed(mesh) for mesh in meshes]
+		self.times = [seconds for text, seconds in results]
+		return [text for text, seconds in results]
+
+	def close(self):
+		if self._executor is not None:
+			self._executor.shutdown()
+			self._executor = None
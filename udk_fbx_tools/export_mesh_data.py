@@ -0,0 +1,295 @@
+############################################################
+# Mesh data extraction
+#
+# - reads what the writers need from a mesh into flat numpy arrays with
+#   foreach_get, one RNA call per attribute instead of one per
+#   vertex/face/corner
+# - faces come from polygons + loops by default, their corners already
+#   follow the ByPolygonVertex layout of the file
+# - tessfaces are only read when asked for (Lengyel tangents are built
+#   from tris/quads), triangles have 3 corners and quads 4
+# - shared by the ascii and binary writers and the normals/tangents
+#   gathering in export_fbx.get_mesh_shading
+# - shape key deltas are read the same way, one array per key block
+# - merge_color_layers combines all color layers in one pass
+# - face_materials numbers the (material, image) pairs of the faces once
+#   while the scene is collected, the writers reuse its index arrays
+#
+
+import numpy as np
+
+from .export_arrays import tessface_corner_mask
+
+
+def _read(collection, attr, count, dtype):
+	values = np.empty(count, dtype=dtype)
+	collection.foreach_get(attr, values)
+	return values
+
+
+def needs_tessfaces(me, export_tangentspace_base, tangentspace_uvlnum):
+	'''	True if the mesh's faces have to be tessellated for export
+		- only the Lengyel tangents work on tessfaces (tris/quads with uv1-uv4)
+	'''
+	return export_tangentspace_base == 'LENGYEL' and len(me.uv_textures) > tangentspace_uvlnum
+
+
+class mesh_arrays(object):
+	'''	everything per vertex/face/corner/edge of an (evaluated) mesh
+		- use_tessfaces: faces are tessfaces instead of polygons
+		- vertcos: (V, 3) float32
+		- face_sizes: (F,) int32, corners of each face
+		- polyverts: (C,) int32, vertex index of each face corner
+		- face_smooth, face_materials: (F,) bool / int32
+		- edges: (E, 2) int32, edges_loose / edges_sharp: (E,) bool
+		- uv_layers: [(name, (C, 2) float32)]
+		- color_layers: [(name, (C, 3) float32)]
+	'''
+	__slots__ = (
+		"me", "use_tessfaces", "vertcos", "face_sizes", "polyverts",
+		"face_smooth", "face_materials", "edges", "edges_loose", "edges_sharp",
+		"uv_layers", "color_layers",
+	)
+
+	def __init__(self, me, use_edges=True, use_tessfaces=False):
+		self.me = me
+		self.use_tessfaces = use_tessfaces
+
+		self.vertcos = _read(me.vertices, "co", len(me.vertices) * 3, np.float32).reshape(-1, 3)
+
+		if use_tessfaces:
+			self._read_tessfaces(me)
+		else:
+			self._read_polygons(me)
+
+		if use_edges:
+			nedges = len(me.edges)
+			self.edges = _read(me.edges, "vertices", nedges * 2, np.int32).reshape(-1, 2)
+			self.edges_loose = _read(me.edges, "is_loose", nedges, bool)
+			self.edges_sharp = _read(me.edges, "use_edge_sharp", nedges, bool)
+		else:
+			self.edges = np.zeros((0, 2), dtype=np.int32)
+			self.edges_loose = np.zeros(0, dtype=bool)
+			self.edges_sharp = np.zeros(0, dtype=bool)
+
+	def _read_polygons(self, me):
+		npolys = len(me.polygons)
+		nloops = len(me.loops)
+
+		self.face_sizes = _read(me.polygons, "loop_total", npolys, np.int32)
+		self.polyverts = _read(me.loops, "vertex_index", nloops, np.int32)
+		self.face_smooth = _read(me.polygons, "use_smooth", npolys, bool)
+		self.face_materials = _read(me.polygons, "material_index", npolys, np.int32)
+
+		self.uv_layers = [(uvlayer.name, _read(uvlayer.data, "uv", nloops * 2, np.float32).reshape(-1, 2))
+						  for uvlayer in me.uv_layers]
+		self.color_layers = [(collayer.name, _read(collayer.data, "color", nloops * 3, np.float32).reshape(-1, 3))
+							 for collayer in me.vertex_colors]
+
+	def _read_tessfaces(self, me):
+		nfaces = len(me.tessfaces)
+
+		face_corners = tessface_corner_mask(me.tessfaces)
+		faceverts = _read(me.tessfaces, "vertices_raw", nfaces * 4, np.int32).reshape(-1, 4)
+		self.face_sizes = face_corners.sum(axis=1).astype(np.int32)
+		self.polyverts = faceverts[face_corners]
+		self.face_smooth = _read(me.tessfaces, "use_smooth", nfaces, bool)
+		self.face_materials = _read(me.tessfaces, "material_index", nfaces, np.int32)
+
+		# all 4 uvs/colors of each face, masked down to the corners the face uses
+		self.uv_layers = []
+		for uvlayer in me.tessface_uv_textures:
+			uvs = _read(uvlayer.data, "uv_raw", nfaces * 8, np.float32)
+			self.uv_layers.append((uvlayer.name, uvs.reshape(-1, 4, 2)[face_corners]))
+
+		self.color_layers = []
+		for collayer in me.tessface_vertex_colors:
+			cols = np.empty((4, nfaces * 3), dtype=np.float32)
+			for j in range(4):
+				collayer.data.foreach_get("color%i" % (j + 1), cols[j])
+			cols = cols.reshape(4, -1, 3).transpose(1, 0, 2)[face_corners]
+			self.color_layers.append((collayer.name, cols))
+
+	def face_starts(self):
+		'''	index of each face's first corner '''
+		return np.cumsum(self.face_sizes) - self.face_sizes
+
+	def face_list(self):
+		'''	vertex indices of each face as lists '''
+		polyverts = self.polyverts.tolist()
+		return [polyverts[start:start + size] for start, size in
+				zip(self.face_starts().tolist(), self.face_sizes.tolist())]
+
+	def corner_values(self, vertex_values):
+		'''	per vertex values (V, k) expanded to the face corners '''
+		return np.asarray(vertex_values)[self.polyverts]
+
+
+def _name(item):
+	return getattr(item, "name", "")
+
+
+class face_materials(object):
+	'''	material and texture of each face of a mesh
+		- materials: sorted (material, image) pairs the faces use, over
+		  all uv layers (every slot with no image if there are no uvs)
+		- textures: sorted images the faces use, empty if that's only None
+		- material_ids: (F,) int32 index into materials, with the images
+		  of the active uv layer
+		- texture_ids: [(F,) int32] per uv layer, index into the textures
+		  that aren't None, -1 for faces without an image
+		- image pointers can't be read with foreach_get, they are read per
+		  face here once instead of by each writer
+	'''
+	__slots__ = ("materials", "textures", "material_ids", "texture_ids")
+
+	def __init__(self, me, mats, use_tessfaces=False):
+		if use_tessfaces:
+			faces, uvtextures = me.tessfaces, me.tessface_uv_textures
+		else:
+			faces, uvtextures = me.polygons, me.uv_textures
+
+		# material of each face as an index into mat_list, slots sharing a
+		# material get the same index and out of range slots have none
+		mat_list = []
+		mat_index = {}
+		slot_ids = []
+		for mat in list(mats) + [None]:
+			j = mat_index.get(mat)
+			if j is None:
+				j = mat_index[mat] = len(mat_list)
+				mat_list.append(mat)
+			slot_ids.append(j)
+		slot_ids = np.array(slot_ids, dtype=np.int64)
+		slots = _read(faces, "material_index", len(faces), np.int32)
+		slots[(slots < 0) | (slots >= len(mats))] = len(mats)
+		slots = slot_ids[slots]
+
+		# image of each face per uv layer, as an index into images
+		images = []
+		image_index = {}
+		layer_images = []
+		active = 0
+		for i, uvlayer in enumerate(uvtextures):
+			ids = []
+			for uf in uvlayer.data:
+				image = uf.image
+				j = image_index.get(image)
+				if j is None:
+					j = image_index[image] = len(images)
+					images.append(image)
+				ids.append(j)
+			layer_images.append(np.array(ids, dtype=np.int64))
+			if uvlayer == uvtextures.active:
+				active = i
+
+		if layer_images:
+			face_images = layer_images[active]
+			pair_keys = [slots * len(images) + ids for ids in layer_images]
+		else:
+			# no uvs: every material slot, faces have no image
+			images = [None]
+			face_images = np.zeros(len(slots), dtype=np.int64)
+			pair_keys = [slot_ids[:len(mats)]]
+
+		keys = np.unique(np.concatenate(pair_keys + [np.zeros(0, dtype=np.int64)]))
+		pairs = [(mat_list[k // len(images)], images[k % len(images)]) for k in keys.tolist()]
+
+		# sort by name so we get predictable output, some items may be None
+		order = sorted(range(len(pairs)), key=lambda j: (_name(pairs[j][0]), _name(pairs[j][1])))
+		self.materials = [pairs[j] for j in order]
+		position = np.empty(len(order), dtype=np.int32)
+		position[order] = np.arange(len(order), dtype=np.int32)
+		if len(keys):
+			face_keys = np.searchsorted(keys, slots * len(images) + face_images)
+			self.material_ids = position[np.minimum(face_keys, len(keys) - 1)]
+		else:
+			self.material_ids = np.zeros(len(slots), dtype=np.int32)
+
+		self.textures = sorted(image_index, key=_name)
+		if self.textures == [None]:
+			self.textures = []
+		texture_index = np.full(len(images), -1, dtype=np.int32)
+		for j, image in enumerate(tex for tex in self.textures if tex):
+			texture_index[image_index[image]] = j
+		self.texture_ids = [texture_index[ids] for ids in layer_images]
+
+
+def merge_color_layers(color_layers, mode='ADD'):
+	'''	color_layers as one "colscombined" layer
+		- ADD: sum of all layers
+		- AVERAGE: mean of all layers
+		- CHANNELS: the grey value (mean of r, g, b) of the first four
+		  layers packed into r, g, b and alpha, returns (C, 4) colors
+	'''
+	if not color_layers:
+		return []
+	layers = np.array([cols for name, cols in color_layers], dtype=np.float32)
+
+	if mode == 'ADD':
+		cols = np.add.reduce(layers, axis=0)
+	elif mode == 'AVERAGE':
+		cols = np.add.reduce(layers, axis=0) / np.float32(len(layers))
+	elif mode == 'CHANNELS':
+		count = min(len(layers), 4)
+		cols = np.zeros((layers.shape[1], 4), dtype=np.float32)
+		cols[:, 3] = 1.0
+		cols[:, :count] = layers[:count].mean(axis=2).T
+	else:
+		raise Exception("invalid vertex color merge mode: %r" % mode)
+	return [("colscombined", cols)]
+
+
+def calc_vertex_normals(vertcos, polyverts, face_sizes):
+	'''	(V, 3) float32 area weighted vertex normals
+		- face normals by Newell's method, summed into each face's vertices
+	'''
+	if not len(face_sizes):
+		return np.zeros((len(vertcos), 3), dtype=np.float32)
+	starts = np.cumsum(face_sizes) - face_sizes
+	corner_next = np.arange(1, len(polyverts) + 1)
+	corner_next[starts + face_sizes - 1] = starts
+
+	co = np.asarray(vertcos, dtype=np.float64)
+	a = co[polyverts]
+	b = a[corner_next]
+	terms = np.empty_like(a)
+	terms[:, 0] = (a[:, 1] - b[:, 1]) * (a[:, 2] + b[:, 2])
+	terms[:, 1] = (a[:, 2] - b[:, 2]) * (a[:, 0] + b[:, 0])
+	terms[:, 2] = (a[:, 0] - b[:, 0]) * (a[:, 1] + b[:, 1])
+	face_normals = np.add.reduceat(terms, starts, axis=0)
+
+	corner_normals = np.repeat(face_normals, face_sizes, axis=0)
+	normals = np.empty((len(co), 3), dtype=np.float64)
+	for j in range(3):
+		normals[:, j] = np.bincount(polyverts, corner_normals[:, j], minlength=len(co))
+	length = np.sqrt((normals ** 2).sum(axis=1))
+	length[length == 0.0] = 1.0
+	return (normals / length[:, None]).astype(np.float32)
+
+
+def shape_key_deltas(me, key_blocks, use_normals=False, threshold=0.000001):
+	'''	offsets of each shape key from the basis (key_blocks[0])
+		- returns [(name, indices, deltas, normals)], only vertices that
+		  move further than threshold are kept
+		- normals are the vertex normal offsets of the kept vertices, from
+		  me's polygons with the shape's coordinates, None if not use_normals
+	'''
+	count = len(key_blocks[0].data)
+	basis = _read(key_blocks[0].data, "co", count * 3, np.float32).reshape(-1, 3)
+
+	if use_normals:
+		polyverts = _read(me.loops, "vertex_index", len(me.loops), np.int32)
+		face_sizes = _read(me.polygons, "loop_total", len(me.polygons), np.int32)
+		basis_normals = calc_vertex_normals(basis, polyverts, face_sizes)
+
+	shapes = []
+	for kb in key_blocks[1:]:
+		coords = _read(kb.data, "co", count * 3, np.float32).reshape(-1, 3)
+		deltas = coords - basis
+		indices = np.flatnonzero(np.sqrt((deltas.astype(np.float64) ** 2).sum(axis=1)) > threshold).astype(np.int32)
+		normals = None
+		if use_normals:
+			normals = (calc_vertex_normals(coords, polyverts, face_sizes) - basis_normals)[indices]
+		shapes.append((kb.name, indices, deltas[indices], normals))
+	return shapes
@@ -0,0 +1,394 @@
+############################################################
+# ASCII Geometry/Model block formatting
+#
+# - format_mesh turns a mesh extracted by save_single (a dict of plain
+#   values and numpy arrays) into the text of the Model block
+# - only numpy and export_arrays are used here, never bpy, so forked
+#   worker processes can run it without touching Blender data
+#
+
+import time
+
+import numpy as np
+
+from .export_arrays import format_array, format_range, unique_rows
+
+
+def _format_shape_array(values, fmt, wrap, sep):
+	# the shape key loops put one more item on the first line
+	if not len(values):
+		return ''
+	if len(values) == 1:
+		return fmt % tuple(np.ravel(values[0]).tolist())
+	return (fmt % tuple(np.ravel(values[0]).tolist())) + ',' + format_array(values[1:], fmt, wrap, sep)
+
+
+def _format_shape_normals(normals, count):
+	# the line count carries on from the vertices and every row starts with a comma
+	if not count:
+		return ''
+	if normals is None:
+		values = np.zeros((count, 3), dtype=np.int32)
+		fmt = '%i,%i,%i'
+	else:
+		values = normals
+		fmt = '%.6f,%.6f,%.6f'
+	first = 4 - ((count - 2) % 4) - 1 if count > 1 else 4
+	sep = '\n\t\t\t'
+	text = ''
+	if first:
+		text = ',' + format_array(values[:first], fmt, 4, sep)
+	if count > first:
+		text += sep + ',' + format_array(values[first:], fmt, 4, sep)
+	return text
+
+
+def format_mesh(mesh):
+	'''	mesh: dict filled by save_single's extract_mesh
+		returns the Model block as a string
+	'''
+	out = []
+	fw = out.append
+
+	fw(mesh["head"])
+
+	############################################
+	# Write the Real Mesh data here
+
+	fw('\n\t\tVertices: ')
+	fw(format_array(mesh["vertcos"], '%.6f,%.6f,%.6f', 4, '\n\t\t'))
+
+	fw('\n\t\tPolygonVertexIndex: ')
+	i = -1
+	for fi in mesh["faces"]:
+		# last index XORd w. -1 indicates end of face
+		face = ','.join(['%i'] * len(fi)) % (tuple(fi[:-1]) + (fi[-1] ^ -1,))
+		if i == -1:
+			fw(face)
+			i = 0
+		else:
+			if i == 13:
+				fw('\n\t\t')
+				i = 0
+			fw(',' + face)
+		i += 1
+
+	# write loose edges as faces.
+	edges = mesh["edges"]
+	if len(edges) > 0:
+		for ed_val, is_loose in zip(edges, mesh["edges_loose"]):
+			if is_loose:
+				ed_val = ed_val[0], ed_val[-1] ^ -1
+				if i == -1:
+					fw('%i,%i' % ed_val)
+					i = 0
+				else:
+					if i == 13:
+						fw('\n\t\t')
+						i = 0
+					fw(',%i,%i' % ed_val)
+			i += 1
+
+		fw('\n\t\tEdges: ')
+		fw(format_array(edges, '%i,%i', 13, '\n\t\t'))
+	fw('\n\t\tGeometryVersion: 124')
+
+
+	########################################
+	#		Normals, Tangents, Binormals:
+
+	fw('''
+		LayerElementNormal: 0 {
+			Version: 101
+			Name: ""
+			MappingInformationType: "ByPolygonVertex"
+			ReferenceInformationType: "Direct"
+			Normals: ''')
+
+	fw(format_array(mesh["normals"], '%.6f,%.6f,%.6f', 4, '\n\t\t\t '))
+	fw('\n\t\t}')
+
+	if mesh["tangents"] is not None:
+
+		fw('''
+		LayerElementBinormal: 0 {
+			Version: 101
+			Name: ""
+			MappingInformationType: "ByPolygonVertex"
+			ReferenceInformationType: "Direct"
+			Binormals: ''')
+
+		fw(format_array(mesh["binormals"], '%.6f,%.6f,%.6f', 4, '\n\t\t\t '))
+		fw('\n\t\t}')
+
+		fw('''
+		LayerElementTangent: 0 {
+			Version: 101
+			Name: ""
+			MappingInformationType: "ByPolygonVertex"
+			ReferenceInformationType: "Direct"
+			Tangents: ''')
+
+		fw(format_array(mesh["tangents"], '%.6f,%.6f,%.6f', 4, '\n\t\t\t '))
+		fw('\n\t\t}')
+
+	###########################################
+	# Write Smoothing Groups
+
+	if mesh["smooth_type"] == 'FACE':
+		fw('''
+		LayerElementSmoothing: 0 {
+			Version: 102
+			Name: ""
+			MappingInformationType: "ByPolygon"
+			ReferenceInformationType: "Direct"
+			Smoothing: ''')
+
+		fw(format_array(mesh["smoothing"], '%i', 54, '\n\t\t\t '))
+		fw('\n\t\t}')
+	# Write Edge Smoothing
+	elif mesh["smooth_type"] == 'EDGE':
+
+		fw('''
+		LayerElementSmoothing: 0 {
+			Version: 101
+			Name: ""
+			MappingInformationType: "ByEdge"
+			ReferenceInformationType: "Direct"
+			Smoothing: ''')
+
+		fw(format_array(mesh["smoothing"], '%i', 54, '\n\t\t\t '))
+		fw('\n\t\t}')
+
+	#####################################################
+
+	# Write VertexColor Layers
+	# note, no programs seem to use this info :/
+	# - with dedup each distinct color/uv is written once, the index lists
+	#   point into those tables instead of counting up
+	dedup = mesh["dedup"]
+	for colindex, (colname, colors) in enumerate(mesh["colors"]):
+		fw('''
+		LayerElementColor: %i {
+			Version: 101
+			Name: "%s"
+			MappingInformationType: "ByPolygonVertex"
+			ReferenceInformationType: "IndexToDirect"
+			Colors: ''' % (colindex, colname))
+
+		if dedup:
+			colors, colindices = unique_rows(colors)
+
+		# alpha is only stored when layers are packed into rgba channels
+		if colors.shape[1] == 4:
+			fw(format_array(colors, '%.4f,%.4f,%.4f,%.4f', 7, '\n\t\t\t\t'))
+		else:
+			fw(format_array(colors, '%.4f,%.4f,%.4f,1', 7, '\n\t\t\t\t'))
+
+		fw('\n\t\t\tColorIndex: ')
+		if dedup:
+			fw(format_array(colindices, '%i', 55, '\n\t\t\t\t'))
+		else:
+			fw(format_range(len(colors), 55, '\n\t\t\t\t'))
+		fw('\n\t\t}')
+
+	# Write UV and texture layers.
+	uvlayers = mesh["uvs"]
+	textures = mesh["textures"]
+	for uvindex, (uvname, uvs, texture_ids) in enumerate(uvlayers):
+		fw('\n\t\tLayerElementUV: %i {' % uvindex)
+		fw('\n\t\t\tVersion: 101')
+		fw('\n\t\t\tName: "%s"' % uvname)
+		fw('''
+			MappingInformationType: "ByPolygonVertex"
+			ReferenceInformationType: "IndexToDirect"
+			UV: ''')
+
+		if dedup:
+			uvs, uvindices = unique_rows(uvs)
+
+		fw(format_array(uvs, '%.6f,%.6f', 7, '\n\t\t\t '))
+
+		fw('\n\t\t\tUVIndex: ')
+		if dedup:
+			fw(format_array(uvindices, '%i', 55, '\n\t\t\t\t'))
+		else:
+			fw(format_range(len(uvs), 55, '\n\t\t\t\t'))
+
+		fw('\n\t\t}')
+
+		if textures:
+			fw('\n\t\tLayerElementTexture: %i {' % uvindex)
+			fw('\n\t\t\tVersion: 101')
+			fw('\n\t\t\tName: "%s"' % uvname)
+
+			if textures == 1:
+				fw('\n\t\t\tMappingInformationType: "AllSame"')
+			else:
+				fw('\n\t\t\tMappingInformationType: "ByPolygon"')
+
+			fw('\n\t\t\tReferenceInformationType: "IndexToDirect"')
+			fw('\n\t\t\tBlendMode: "Translucent"')
+			fw('\n\t\t\tTextureAlpha: 1')
+			fw('\n\t\t\tTextureId: ')
+
+			if textures == 1:
+				fw('0')
+			else:
+				fw(format_array(texture_ids, '%i', 55, '\n\t\t\t '))
+
+		else:
+			fw('''
+		LayerElementTexture: 0 {
+			Version: 101
+			Name: ""
+			MappingInformationType: "NoMappingInformation"
+			ReferenceInformationType: "IndexToDirect"
+			BlendMode: "Translucent"
+			TextureAlpha: 1
+			TextureId: ''')
+		fw('\n\t\t}')
+
+	# Done with UV/textures.
+	materials = mesh["materials"]
+	if materials:
+		fw('\n\t\tLayerElementMaterial: 0 {')
+		fw('\n\t\t\tVersion: 101')
+		fw('\n\t\t\tName: ""')
+
+		if materials == 1:
+			fw('\n\t\t\tMappingInformationType: "AllSame"')
+		else:
+			fw('\n\t\t\tMappingInformationType: "ByPolygon"')
+
+		fw('\n\t\t\tReferenceInformationType: "IndexToDirect"')
+		fw('\n\t\t\tMaterials: ')
+
+		if materials == 1:
+			fw('0')
+		else:
+			fw(format_array(mesh["material_ids"], '%i', 55, '\n\t\t\t\t'))
+
+		fw('\n\t\t}')
+
+	fw('''
+		Layer: 0 {
+			Version: 100
+			LayerElement:  {
+				Type: "LayerElementNormal"
+				TypedIndex: 0
+			}''')
+
+	fw('''
+			LayerElement:  {
+				Type: "LayerElementBinormal"
+				TypedIndex: 0
+			}''')
+
+	fw('''
+			LayerElement:  {
+				Type: "LayerElementTangent"
+				TypedIndex: 0
+			}''')
+
+	if materials:
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementMaterial"
+				TypedIndex: 0
+			}''')
+
+	# Smoothing info
+	if mesh["smooth_layer"]:
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementSmoothing"
+				TypedIndex: 0
+			}''')
+
+	# Always write this
+	if textures:
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementTexture"
+				TypedIndex: 0
+			}''')
+
+	if mesh["colors"]:
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementColor"
+				TypedIndex: 0
+			}''')
+
+	if uvlayers:  # same as me.faceUV
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementUV"
+				TypedIndex: 0
+			}''')
+
+	fw('\n\t\t}')
+
+	for i in range(1, len(uvlayers)):
+
+		fw('\n\t\tLayer: %i {' % i)
+		fw('\n\t\t\tVersion: 100')
+
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementUV"''')
+
+		fw('\n\t\t\t\tTypedIndex: %i' % i)
+		fw('\n\t\t\t}')
+
+		if textures:
+
+			fw('''
+			LayerElement:  {
+				Type: "LayerElementTexture"''')
+
+			fw('\n\t\t\t\tTypedIndex: %i' % i)
+			fw('\n\t\t\t}')
+
+		fw('\n\t\t}')
+
+	# Take into account any UV layers
+	for i in range(1, len(mesh["colors"])):
+		fw('\n\t\tLayer: %i {' % i)
+		fw('\n\t\t\tVersion: 100')
+
+		fw('''
+			LayerElement:  {
+				Type: "LayerElementColor"''')
+
+		fw('\n\t\t\t\tTypedIndex: %i' % i)
+		fw('\n\t\t\t}')
+		fw('\n\t\t}')
+
+	for shapename, indices, delta_verts, delta_normals in mesh["shapes"]:
+
+		fw('\n\t\tShape: "%s" {' % shapename)
+		fw('\n\t\t\tIndexes: ')
+		fw(_format_shape_array(indices, '%d', 7, '\n\t\t\t'))
+
+		fw('\n\t\t\tVertices: ')
+		fw(_format_shape_array(delta_verts, '%.6f,%.6f,%.6f', 4, '\n\t\t\t'))
+
+		# all zero unless shape normals are exported
+		fw('\n\t\t\tNormals: ')
+		fw(_format_shape_normals(delta_normals, len(delta_verts)))
+		fw('\n\t\t}')
+
+	# not completely sure about this, but it's in the converter output:
+	fw('\n\t\tNodeAttributeName: "Geometry::%s_ncl1_1"' % mesh["name"])
+	fw('\n\t}')
+
+	return ''.join(out)
+
+
+def format_mesh_timed(mesh):
+	'''	format_mesh, also returns the seconds it took in the worker '''
+	t = time.perf_counter()
+	text = format_mesh(mesh)
+	return text, time.perf_counter() - t
@@ -0,0 +1,116 @@
+############################################################
+# Export profiler
+#
+# - times named phases of an export with begin/end pairs, phases can be
+#   nested, each one reports its own inclusive time
+# - per object records with timings and element counts
+# - written as JSON next to the exported file
+# - profiler_off has the same interface and does nothing, it's the
+#   default for functions that take a profiler argument
+#
+
+import os
+import json
+import time
+
+
+# phases in report order, others are appended in the order they're first used
+phase_order = (
+	"collect", "armatures", "mesh_write", "normals", "tangents", "skin_weights",
+	"skin_write", "takes", "anim_sampling", "key_reduction", "file_io",
+)
+
+
+class export_profiler(object):
+	__slots__ = ("enabled", "phases", "objects", "counts", "_started", "_start_time", "_total")
+
+	def __init__(self, enabled=True):
+		self.enabled = enabled
+		self.phases = {}  # name: [seconds, calls]
+		self.objects = []
+		self.counts = {}
+		self._started = {}
+		self._start_time = time.perf_counter()
+		self._total = None
+
+	# phases
+	def begin(self, name):
+		if self.enabled:
+			self._started[name] = time.perf_counter()
+
+	def end(self, name):
+		if self.enabled:
+			self.add_time(name, time.perf_counter() - self._started.pop(name))
+
+	def add_time(self, name, seconds, calls=1):
+		if self.enabled:
+			phase = self.phases.setdefault(name, [0.0, 0])
+			phase[0] += seconds
+			phase[1] += calls
+
+	# counters
+	def count(self, name, n=1):
+		if self.enabled:
+			self.counts[name] = self.counts.get(name, 0) + n
+
+	# per object records
+	def object_begin(self, name, type):
+		if not self.enabled:
+			return None
+		record = {"name": name, "type": type, "time": time.perf_counter()}
+		self.objects.append(record)
+		return record
+
+	def object_end(self, record, **counts):
+		if record is not None:
+			record["time"] = time.perf_counter() - record["time"]
+			record.update(counts)
+
+	def object_add(self, record, **values):
+		if record is not None:
+			for key, value in values.items():
+				record[key] = record.get(key, 0) + value
+
+	# report
+	def finish(self):
+		if self._total is None:
+			self._total = time.perf_counter() - self._start_time
+		return self._total
+
+	def report(self, **info):
+		total = self.finish()
+		names = [name for name in phase_order if name in self.phases]
+		names += sorted(name for name in self.phases if name not in phase_order)
+
+		report = dict(info)
+		report["total"] = total
+		report["phases"] = [
+			{"name": name, "time": self.phases[name][0], "calls": self.phases[name][1]}
+			for name in names
+		]
+		report["counts"] = self.counts
+		report["objects"] = sorted(self.objects, key=lambda rec: rec["time"], reverse=True)
+		return report
+
+	def write_json(self, filepath, **info):
+		'''	writes the report to filepath, returns the path or None if profiling is off '''
+		if not self.enabled:
+			return None
+		with open(filepath, "w") as f:
+			json.dump(self.report(**info), f, indent=1, sort_keys=True)
+		return filepath
+
+	def summary(self):
+		total = self.finish()
+		lines = ["export profile: %.4f sec." % total]
+		for phase in self.report()["phases"]:
+			lines.append("  %-16s %9.4f sec. %6i calls" % (phase["name"], phase["time"], phase["calls"]))
+		return '\n'.join(lines)
+
+
+def profile_path(filepath):
+	'''	report file written next to the exported file '''
+	return os.path.splitext(filepath)[0] + "_profile.json"
+
+
+profiler_off = export_profiler(enabled=False)
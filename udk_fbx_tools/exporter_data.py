@@ -122,7 +122,7 @@ def get_fbx_BoneAttributeID(inbone):
 def get_fbx_NullAttributeID(innull):
 	for i in range(len(index_fbxNulls)):
 		if innull == index_fbxNulls[i]:
-			return 310000 + i
+			return 320000 + i
 	return 0
 	
 
@@ -181,6 +181,13 @@ def get_fbx_AnimCurveID(animname):
 	return 0
 
 
+# adds a new entry to an index list and returns its id
+# - avoids the linear search for data that is only referenced once (animation curves)
+def add_fbx_index(index_list, name, base):
+	index_list.append(name)
+	return base + len(index_list) - 1
+
+
 def clear_fbxData():
 	print("Exporter: Deleting temp files....")
 	
@@ -195,6 +202,7 @@ def clear_fbxData():
 	del index_fbxShapes[:]
 	del index_fbxShapeChannels[:]
 	del index_fbxAnimStacks[:]
+	del index_fbxAnimLayers[:]
 	del index_fbxAnimCurveNodes[:]
 	del index_fbxAnimCurves[:]
 	
@@ -204,5 +212,6 @@ def clear_fbxData():
 	del fbx_poses[:]
 	del fbx_actions[:]
 	del fbx_taggedactions[:]
+	del ob_anim_lists[:]
 	
 
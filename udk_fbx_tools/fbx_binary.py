@@ -0,0 +1,233 @@
+############################################################
+# Binary FBX 7.x node writer
+#
+# - each node (element) has typed properties and child elements
+# - arrays are stored as little endian typed arrays, zlib compressed
+#   when they are big enough for it to pay off
+# - offsets are calculated for the whole tree before writing, every
+#   node stores the file offset of its end
+#
+# Format reference: Blender's io_scene_fbx encoder (encode_bin.py)
+#
+
+import zlib
+from struct import pack
+
+import numpy as np
+
+
+fbx_version = 7400
+
+_head_magic = b'Kaydara FBX Binary\x20\x20\x00\x1a\x00'
+_foot_id = b'\xfa\xbc\xab\x09\xd0\xc8\xd4\x66\xb1\x76\xfb\x83\x1c\xf7\x26\x7e'
+_foot_magic = b'\xf8\x5a\x8c\x6a\xde\xf5\xd9\x7e\xec\xe9\x0c\xe3\x75\x8f\x29\x0b'
+
+# 3 uint32: end offset, property count, property list length
+_elem_header_size = 12
+_block_sentinel = b'\x00' * 13
+
+# these always end with a sentinel, even without children
+_always_sentinel = {b"AnimationStack", b"AnimationLayer"}
+
+# arrays smaller than this are stored uncompressed
+array_compress_min = 128
+array_compress_level = 1
+
+
+def _array_bytes(values, dtype):
+	data = bytes(np.ascontiguousarray(values, dtype=dtype).ravel().data)
+	count = len(data) // np.dtype(dtype).itemsize
+	if len(data) >= array_compress_min:
+		data = zlib.compress(data, array_compress_level)
+		encoding = 1
+	else:
+		encoding = 0
+	return pack('<3I', count, encoding, len(data)) + data
+
+
+class fbx_elem(object):
+	__slots__ = ("id", "props", "props_type", "elems", "_props_length", "_end_offset")
+
+	def __init__(self, id):
+		self.id = id.encode() if isinstance(id, str) else id
+		self.props = []
+		self.props_type = bytearray()
+		self.elems = []
+		self._props_length = -1
+		self._end_offset = -1
+
+	def add_elem(self, id):
+		elem = fbx_elem(id)
+		self.elems.append(elem)
+		return elem
+
+	def _add(self, type_code, data):
+		self.props_type.append(ord(type_code))
+		self.props.append(data)
+
+	# single values
+	def add_bool(self, value):
+		self._add('C', pack('?', bool(value)))
+
+	def add_int16(self, value):
+		self._add('Y', pack('<h', value))
+
+	def add_int32(self, value):
+		self._add('I', pack('<i', value))
+
+	def add_int64(self, value):
+		self._add('L', pack('<q', value))
+
+	def add_float32(self, value):
+		self._add('F', pack('<f', value))
+
+	def add_float64(self, value):
+		self._add('D', pack('<d', value))
+
+	def add_bytes(self, value):
+		self._add('R', pack('<I', len(value)) + value)
+
+	def add_string(self, value):
+		if isinstance(value, str):
+			value = value.encode("utf8")
+		self._add('S', pack('<I', len(value)) + value)
+
+	# arrays - any sequence or numpy array
+	def add_int32_array(self, values):
+		self._add('i', _array_bytes(values, '<i4'))
+
+	def add_int64_array(self, values):
+		self._add('l', _array_bytes(values, '<i8'))
+
+	def add_float32_array(self, values):
+		self._add('f', _array_bytes(values, '<f4'))
+
+	def add_float64_array(self, values):
+		self._add('d', _array_bytes(values, '<f8'))
+
+	def add_bool_array(self, values):
+		self._add('b', _array_bytes(values, '?'))
+
+	# offsets
+	def _calc_offsets(self, offset, is_last):
+		offset += _elem_header_size + 1 + len(self.id)
+		self._props_length = sum(1 + len(data) for data in self.props)
+		offset += self._props_length
+		offset = self._calc_offsets_children(offset, is_last)
+		self._end_offset = offset
+		return offset
+
+	def _calc_offsets_children(self, offset, is_last):
+		if self.elems:
+			elem_last = self.elems[-1]
+			for elem in self.elems:
+				offset = elem._calc_offsets(offset, elem is elem_last)
+			offset += len(_block_sentinel)
+		elif (not self.props and not is_last) or self.id in _always_sentinel:
+			offset += len(_block_sentinel)
+		return offset
+
+	# writing
+	def _write(self, write, tell, is_last):
+		write(pack('<3I', self._end_offset, len(self.props), self._props_length))
+		write(bytes((len(self.id),)))
+		write(self.id)
+		for type_code, data in zip(self.props_type, self.props):
+			write(bytes((type_code,)))
+			write(data)
+		self._write_children(write, tell, is_last)
+		if tell() != self._end_offset:
+			raise IOError("FBX node %r: end offset mismatch (%d)" % (self.id, self._end_offset - tell()))
+
+	def _write_children(self, write, tell, is_last):
+		if self.elems:
+			elem_last = self.elems[-1]
+			for elem in self.elems:
+				elem._write(write, tell, elem is elem_last)
+			write(_block_sentinel)
+		elif (not self.props and not is_last) or self.id in _always_sentinel:
+			write(_block_sentinel)
+
+
+def write_file(file, elem_root, version=fbx_version):
+	'''	file: opened in binary mode, elem_root: unnamed node holding the top level nodes '''
+	write = file.write
+	tell = file.tell
+
+	start = tell()
+	write(_head_magic)
+	write(pack('<I', version))
+
+	elem_root._calc_offsets_children(start + len(_head_magic) + 4, False)
+	elem_root._write_children(write, tell, False)
+
+	# footer
+	write(_foot_id)
+	write(b'\x00' * 4)
+	offset = tell()
+	pad = ((offset + 15) & ~15) - offset
+	if pad == 0:
+		pad = 16
+	write(b'\x00' * pad)
+	write(pack('<I', version))
+	write(b'\x00' * 120)
+	write(_foot_magic)
+
+
+###############################
+# Properties70 helpers
+
+# property type: (type name, label, value type)
+_p_types = {
+	"bool": (b"bool", b"", 'I'),
+	"int": (b"int", b"Integer", 'I'),
+	"enum": (b"enum", b"", 'I'),
+	"double": (b"double", b"Number", 'D'),
+	"Number": (b"Number", b"", 'D'),
+	"KTime": (b"KTime", b"Time", 'L'),
+	"KString": (b"KString", b"", 'S'),
+	"KStringUrl": (b"KString", b"Url", 'S'),
+	"KStringXRefUrl": (b"KString", b"XRefUrl", 'S'),
+	"DateTime": (b"DateTime", b"", 'S'),
+	"ColorRGB": (b"ColorRGB", b"Color", 'D'),
+	"Color": (b"Color", b"", 'D'),
+	"Vector3D": (b"Vector3D", b"Vector", 'D'),
+	"Vector": (b"Vector", b"", 'D'),
+	"Lcl Translation": (b"Lcl Translation", b"", 'D'),
+	"Lcl Rotation": (b"Lcl Rotation", b"", 'D'),
+	"Lcl Scaling": (b"Lcl Scaling", b"", 'D'),
+	"Visibility": (b"Visibility", b"", 'D'),
+	"Compound": (b"Compound", b"", None),
+	"object": (b"object", b"", None),
+}
+
+
+def add_p(props, name, ptype, values=(), animatable=False):
+	'''	adds a P: node to a Properties70 element '''
+	type_name, label, value_type = _p_types[ptype]
+	p = props.add_elem(b"P")
+	p.add_string(name)
+	p.add_string(type_name)
+	p.add_string(label)
+	p.add_string(b"A" if animatable else b"")
+	if value_type is None:
+		return p
+	if not isinstance(values, (tuple, list)):
+		values = (values,)
+	for value in values:
+		if value_type == 'I':
+			p.add_int32(int(value))
+		elif value_type == 'L':
+			p.add_int64(int(value))
+		elif value_type == 'D':
+			p.add_float64(float(value))
+		else:
+			p.add_string(value)
+	return p
+
+
+def fbx_name_class(name, cls):
+	'''	object names are stored as "Name\\x00\\x01Class" in binary files '''
+	if isinstance(name, str):
+		name = name.encode("utf8")
+	return name + b"\x00\x01" + cls
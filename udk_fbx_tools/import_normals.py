@@ -14,6 +14,8 @@ from bpy_extras.io_utils import (ImportHelper,path_reference_mode)
 from bpy.props import (StringProperty,BoolProperty)
 import os.path
 
+from . import normals_data
+
 
 # parse a LayerElementX line into a list of strings
 def get_listfromline(line):
@@ -70,7 +72,7 @@ def copy_importednormals(objname, normals_list):
 	
 	if tempobject != "none":
 		# make sure mesh data exists
-		if 'polyn_meshdata' in tempobject:
+		if normals_data.has_saved(tempobject, True):
 			# go to edit mode, get mesh data
 			lastMode = bpy.context.mode
 			if lastMode != "EDIT_MESH":
@@ -81,7 +83,6 @@ def copy_importednormals(objname, normals_list):
 			me.update()
 			
 			# build lists + counts
-			faces_list = [f for f in bm.faces]
 			faces_count = len(bm.faces)
 			verts_perface = [len(f.verts) for f in bm.faces]
 			verts_count = 0
@@ -89,22 +90,30 @@ def copy_importednormals(objname, normals_list):
 				verts_count += c
 			
 			# make sure selected mesh has the same # of faces/verts
-			if faces_count == len(tempobject.polyn_meshdata):
+			if faces_count == normals_data.saved_count(tempobject, True):
 				if verts_count == len(normals_list):
 					# build the new mesh data
-					vcount = 0
-					for i in range(faces_count):
-						faceverts = [v for v in faces_list[i].verts]
-						for j in range(verts_perface[i]):
-							if vcount < len(normals_list):
-								tempobject.polyn_meshdata[i].vdata[j].vnormal = normals_list[vcount]
-								vcount += 1
+					store = normals_data.normals_store()
+					store.set_loops([n[:] for n in normals_list], verts_perface)
+					
+					# a debounced save of the editor's normals would overwrite the import
+					if normals_data.pending_commit is not None and normals_data.pending_commit[0] == tempobject.name:
+						normals_data.pending_commit = None
+					normals_data.write_object(tempobject, store)
+					
+					# the editor's stores (and their undo steps) held the old normals
+					if normals_data.cust_normals_ppoly.owner == tempobject.name:
+						normals_data.read_object(tempobject, True, normals_data.cust_normals_ppoly)
+						normals_data.cust_normals_ppoly.history.clear()
+					if normals_data.cust_normals_pvertex.owner == tempobject.name:
+						normals_data.cust_normals_pvertex.clear()
+					vcount = len(normals_list)
 					
 					returnstr =  ("imported " + str(vcount) + " normals")
 				else:
 					returnstr = ("Error: Mesh vertices different from file: " + str(len(normals_list)) + " in file / " + str(verts_count) + " in mesh")
 			else:
-				returnstr = ("Error: Mesh faces different from file: " + str(len(tempobject.polyn_meshdata)) + " in file / " + str(faces_count) + " in mesh")
+				returnstr = ("Error: Mesh faces different from file: " + str(normals_data.saved_count(tempobject, True)) + " in file / " + str(faces_count) + " in mesh")
 			
 			bpy.ops.object.mode_set(mode='OBJECT')
 		else:
@@ -1,11 +1,614 @@
 ############################################################
 # variables for faster access to normals data in the editor
 #
+# - the normals being edited are kept in normals_store objects: one
+#   float32 array for all of them instead of lists of Vectors
+# - poly mode: a row per loop, polygon i's rows are offsets[i]:offsets[i + 1]
+# - vertex mode: a row per vertex
+# - stores are saved on the object as one id property group holding the
+#   packed float32 normals in chunks of chunk_rows rows (+ int32 polygon
+#   offsets) as bytes, read in one go
+# - stores track which rows changed since they were last saved, commit_object
+#   only rewrites the chunks holding them
+# - edits made between begin_edit and end_edit are kept as undo steps in
+#   the store's normals_history: only the changed rows and their old / new
+#   values, oldest steps dropped past history_bytes
+# - read_object reads the saved normals into a store for the editor and the
+#   exporter, objects saved with the old per loop property groups
+#   (polyn_meshdata / vertexn_meshdata) are read too and migrated by
+#   migrate_object
+#
+
+import hashlib
+from collections import deque
+
+import numpy as np
+
+
 lastdisplaymesh = ''
 
-cust_normals_ppoly = []
-cust_normals_pvertex = []
+# (object name, poly mode) with edits waiting to be saved, and when they were made
+pending_commit = None
+pending_time = 0.0
+
+# memory the undo history of each store may use
+history_bytes = 64 * 1024 * 1024
+
+# mesh name: topology_key of the mesh when it was last validated
+validated_meshes = {}
+
+# source object name: (state key, kdtree, world space normals) for normal transfer
+transfer_sources = {}
+
+
+class normals_history(object):
+	'''	undo / redo steps of a normals_store
+		- a step is (rows, old, new): changed row indices and their normals
+		  before and after the edit
+		- the oldest steps are dropped when they use more than max_bytes
+	'''
+	__slots__ = ("undo_steps", "redo_steps", "max_bytes", "used")
+
+	def __init__(self, max_bytes=None):
+		self.max_bytes = history_bytes if max_bytes is None else max_bytes
+		self.clear()
+
+	def clear(self):
+		self.undo_steps = deque()
+		self.redo_steps = []
+		self.used = 0
+
+	@staticmethod
+	def step_bytes(step):
+		return step[0].nbytes + step[1].nbytes + step[2].nbytes
+
+	def trim(self):
+		while self.redo_steps and self.used > self.max_bytes:
+			self.used -= self.step_bytes(self.redo_steps.pop(0))
+		while self.undo_steps and self.used > self.max_bytes:
+			self.used -= self.step_bytes(self.undo_steps.popleft())
+
+	def push(self, step, merge=False):
+		'''	adds an edit, redo steps are dropped
+			- merge: replace the last step if it changed the same rows (a
+			  value being dragged), keeping its old values
+		'''
+		for redo in self.redo_steps:
+			self.used -= self.step_bytes(redo)
+		self.redo_steps = []
+		if merge and self.undo_steps and np.array_equal(self.undo_steps[-1][0], step[0]):
+			last = self.undo_steps.pop()
+			self.used -= self.step_bytes(last)
+			step = (step[0], last[1], step[2])
+		self.undo_steps.append(step)
+		self.used += self.step_bytes(step)
+		self.trim()
+
+	def undo(self):
+		if not self.undo_steps:
+			return None
+		step = self.undo_steps.pop()
+		self.redo_steps.append(step)
+		return step
+
+	def redo(self):
+		if not self.redo_steps:
+			return None
+		step = self.redo_steps.pop()
+		self.undo_steps.append(step)
+		return step
+
+
+class normals_store(object):
+	'''	custom normals of one mesh
+		- normals: (N, 3) float32, per loop when offsets is set, per vertex otherwise
+		- offsets: (P + 1,) int32, first row of each polygon, None in vertex mode
+		- store[i] is a view of polygon i's rows (poly mode) or vertex i's normal,
+		  so store[i][j] = v and store[i] = v write into the array
+		- dirty: [(start, end)] rows changed since the last save, store[i] = v
+		  marks them, edits through views have to call mark_dirty
+		- owner: name of the object the normals were last read from / saved to,
+		  None if the layout changed since
+		- history: undo steps of the edits made between begin_edit and end_edit,
+		  store[i] = v records the old values, edits through views or of the
+		  whole array have to call record first
+		- replacing the normals with a different layout clears the history
+		  and so does another object taking the store over (set_owner)
+	'''
+	__slots__ = ("normals", "offsets", "dirty", "owner", "history", "recording")
+
+	def __init__(self):
+		self.history = normals_history()
+		self.clear()
+
+	def clear(self):
+		self.normals = np.zeros((0, 3), dtype=np.float32)
+		self.offsets = None
+		self.dirty = []
+		self.owner = None
+		self.history.clear()
+		self.recording = None
+
+	def __len__(self):
+		if self.offsets is not None:
+			return len(self.offsets) - 1
+		return len(self.normals)
+
+	def __getitem__(self, i):
+		if self.offsets is not None:
+			return self.normals[self.offsets[i]:self.offsets[i + 1]]
+		return self.normals[i]
+
+	def __setitem__(self, i, value):
+		self.record(i)
+		if self.offsets is not None:
+			self.normals[self.offsets[i]:self.offsets[i + 1]] = value
+		else:
+			self.normals[i] = value
+		self.mark_dirty(i)
+
+	def set_loops(self, normals, face_sizes):
+		'''	poly mode, normals in loop order '''
+		normals = np.array(normals, dtype=np.float32).reshape(-1, 3)
+		offsets = np.zeros(len(face_sizes) + 1, dtype=np.int32)
+		np.cumsum(face_sizes, out=offsets[1:])
+		if self._replace(normals, offsets):
+			self.offsets = offsets
+
+	def set_vertices(self, normals):
+		'''	vertex mode '''
+		normals = np.array(normals, dtype=np.float32).reshape(-1, 3)
+		if self._replace(normals, None):
+			self.offsets = None
+
+	def _replace(self, normals, offsets):
+		'''	writes normals in place while recording an edit with the same
+			layout, returns True if the layout has to be set by the caller
+		'''
+		if (self.recording is not None and normals.shape == self.normals.shape and
+				(offsets is None) == (self.offsets is None) and
+				(offsets is None or np.array_equal(offsets, self.offsets))):
+			self.record()
+			self.normals[:] = normals
+			self.mark_dirty()
+			return False
+		self.normals = normals
+		self.owner = None
+		self.history.clear()
+		self.recording = None
+		self.dirty = [(0, len(normals))] if len(normals) else []
+		return True
+
+	def _rows(self, start, end):
+		'''	row range of polygons (poly mode) or vertices start:end, see mark_dirty '''
+		if start is None:
+			start, end = 0, len(self)
+		elif end is None:
+			end = start + 1
+		if self.offsets is not None:
+			start, end = self.offsets[start], self.offsets[end]
+		return int(start), int(end)
+
+	def mark_dirty(self, start=None, end=None):
+		'''	polygons (poly mode) or vertices start:end changed, start only: that
+			one changed, no arguments: everything changed
+		'''
+		start, end = self._rows(start, end)
+		if end > start:
+			self.dirty.append((start, end))
+
+	def _mark_rows(self, rows):
+		'''	marks sorted unique row indices dirty, one range per run '''
+		if not len(rows):
+			return
+		breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+		starts = rows[np.concatenate(([0], breaks))]
+		ends = rows[np.concatenate((breaks - 1, [len(rows) - 1]))] + 1
+		self.dirty.extend(zip(starts.tolist(), ends.tolist()))
+
+	def set_owner(self, name):
+		'''	the history belongs to the owner, it's cleared when another object
+			takes the store over
+		'''
+		if self.owner is not None and name != self.owner:
+			self.history.clear()
+		self.owner = name
+
+	def begin_edit(self):
+		'''	starts recording an undo step '''
+		self.recording = []
+
+	def record(self, start=None, end=None):
+		'''	keeps the values of polygons / vertices start:end (as in
+			mark_dirty) before they are changed, does nothing outside of
+			begin_edit / end_edit
+		'''
+		if self.recording is None:
+			return
+		start, end = self._rows(start, end)
+		if end > start:
+			self.recording.append((start, end, self.normals[start:end].copy()))
+
+	def end_edit(self, merge=False):
+		'''	stores the recorded rows that changed as an undo step
+			- merge: see normals_history.push
+		'''
+		recording = self.recording
+		self.recording = None
+		if not recording:
+			return
+		rows = np.concatenate([np.arange(start, end, dtype=np.int32) for start, end, old in recording])
+		old = np.concatenate([old for start, end, old in recording])
+		rows, first = np.unique(rows, return_index=True)
+		old = old[first]
+		new = self.normals[rows]
+		changed = (old != new).any(axis=1)
+		if changed.any():
+			self.history.push((rows[changed], old[changed], new[changed]), merge)
+
+	def undo(self):
+		'''	reverts the last edit, returns False if there is none '''
+		return self._apply(self.history.undo(), 1)
+
+	def redo(self):
+		return self._apply(self.history.redo(), 2)
+
+	def _apply(self, step, column):
+		if step is None:
+			return False
+		rows = step[0]
+		if len(rows) and rows[-1] >= len(self.normals):
+			self.history.clear()
+			return False
+		self.normals[rows] = step[column]
+		self._mark_rows(rows)
+		return True
+
+	def take_dirty(self):
+		'''	merged dirty row ranges, the store is clean afterwards '''
+		ranges = []
+		for start, end in sorted(self.dirty):
+			if ranges and start <= ranges[-1][1]:
+				ranges[-1][1] = max(ranges[-1][1], end)
+			else:
+				ranges.append([start, end])
+		self.dirty = []
+		return ranges
+
+	def face_sizes(self):
+		return np.diff(self.offsets)
+
+	def loop_normals(self, loop_verts):
+		'''	(L, 3) normal of each loop
+			- loop_verts: vertex index of each loop, only used in vertex mode
+		'''
+		if self.offsets is not None:
+			return self.normals
+		return self.normals[loop_verts]
+
+	def vertex_normals(self, loop_verts, out, weights=None):
+		'''	merges the loop normals of each vertex into out (V, 3)
+			- weights: (L,) weight of each loop, summed and normalized per
+			  vertex, None to take the first loop's normal
+			- vertices without loops keep their row in out, vertices whose
+			  weighted normals cancel out get their first loop's normal
+		'''
+		if self.offsets is None:
+			out[:] = self.normals
+			return out
+		verts, first = np.unique(loop_verts, return_index=True)
+		out[verts] = self.normals[first]
+		if weights is None or not len(verts):
+			return out
+		
+		summed = np.empty((len(out), 3), dtype=np.float64)
+		for c in range(3):
+			summed[:, c] = np.bincount(loop_verts, weights=self.normals[:, c] * weights, minlength=len(out))
+		length = np.sqrt((summed[verts] ** 2).sum(axis=1))
+		valid = length > 1e-12
+		out[verts[valid]] = summed[verts[valid]] / length[valid][:, None]
+		return out
+
+
+# the editor's current normals, one store per mode
+cust_normals_ppoly = normals_store()
+cust_normals_pvertex = normals_store()
+
 
 def clear_normalsdata():
-	del cust_normals_ppoly[:]
-	del cust_normals_pvertex[:]
+	cust_normals_ppoly.clear()
+	cust_normals_pvertex.clear()
+	validated_meshes.clear()
+	transfer_sources.clear()
+
+
+def mesh_loops(me):
+	'''	(vertex index of each loop, loop count of each polygon) '''
+	loop_verts = np.empty(len(me.loops), dtype=np.int32)
+	me.loops.foreach_get("vertex_index", loop_verts)
+	face_sizes = np.empty(len(me.polygons), dtype=np.int32)
+	me.polygons.foreach_get("loop_total", face_sizes)
+	return loop_verts, face_sizes
+
+
+def read_vectors(collection, attr):
+	'''	(N, 3) float32 array of a vector property of every item '''
+	values = np.empty(len(collection) * 3, dtype=np.float32)
+	collection.foreach_get(attr, values)
+	return values.reshape(-1, 3)
+
+
+def topology_key(me):
+	'''	element counts and a digest of the polygons' vertices '''
+	loop_verts, face_sizes = mesh_loops(me)
+	h = hashlib.sha1(loop_verts.data)
+	h.update(face_sizes.data)
+	return (len(me.vertices), len(me.edges), len(me.loops), len(me.polygons), h.hexdigest())
+
+
+def read_flags(collection, attr):
+	'''	(N,) bool array of a boolean property of every item '''
+	values = np.empty(len(collection), dtype=bool)
+	collection.foreach_get(attr, values)
+	return values
+
+
+def normalized_rows(vectors):
+	'''	vectors scaled to unit length, zero length rows stay zero '''
+	length = np.sqrt((vectors ** 2).sum(axis=1))
+	length[length == 0.0] = 1.0
+	return vectors / length[:, None]
+
+
+def loop_neighbours(face_sizes):
+	'''	(previous, next) loop of each loop in its polygon '''
+	offsets = np.zeros(len(face_sizes) + 1, dtype=np.int32)
+	np.cumsum(face_sizes, out=offsets[1:])
+	starts = np.repeat(offsets[:-1], face_sizes)
+	sizes = np.repeat(face_sizes, face_sizes)
+	local = np.arange(offsets[-1], dtype=np.int32) - starts
+	return starts + (local - 1) % sizes, starts + (local + 1) % sizes
+
+
+def read_loop_edges(me):
+	'''	(edge index of each loop, use_edge_sharp of each edge) '''
+	loop_edges = np.empty(len(me.loops), dtype=np.int32)
+	me.loops.foreach_get("edge_index", loop_edges)
+	return loop_edges, read_flags(me.edges, "use_edge_sharp")
+
+
+def smooth_fans(loop_verts, face_sizes, loop_edges, edge_sharp, vert_count):
+	'''	(L,) smooth fan of each loop: loops of a vertex share a fan if their
+		polygons are connected around the vertex by edges not marked sharp
+		- fans are numbered by the lowest loop index in them
+	'''
+	loop_count = len(loop_verts)
+	prev_loop = loop_neighbours(face_sizes)[0]
+	
+	# a loop touches its outgoing and incoming edge at its vertex, loops
+	# touching the same smooth edge at the same vertex are in one fan
+	loops = np.arange(loop_count, dtype=np.int64)
+	corner_loops = np.concatenate((loops, loops))
+	corner_edges = np.concatenate((loop_edges, loop_edges[prev_loop])).astype(np.int64)
+	corner_verts = np.concatenate((loop_verts, loop_verts)).astype(np.int64)
+	smooth = ~edge_sharp[corner_edges]
+	corner_loops = corner_loops[smooth]
+	keys = corner_edges[smooth] * (vert_count + 1) + corner_verts[smooth]
+	
+	order = np.argsort(keys, kind='mergesort')
+	corner_loops = corner_loops[order]
+	keys = keys[order]
+	
+	# neighbouring corners with the same key link their loops, each loop is
+	# hooked to the lowest fan it's linked to and pointers jump to their
+	# root, so the passes grow with the log of the fan size
+	linked = keys[1:] == keys[:-1]
+	link_a = corner_loops[:-1][linked]
+	link_b = corner_loops[1:][linked]
+	fans = loops.copy()
+	while True:
+		fan_a = fans[link_a]
+		fan_b = fans[link_b]
+		apart = fan_a != fan_b
+		if not apart.any():
+			return fans
+		np.minimum.at(fans, np.maximum(fan_a, fan_b)[apart], np.minimum(fan_a, fan_b)[apart])
+		while True:
+			jumped = fans[fans]
+			if np.array_equal(jumped, fans):
+				break
+			fans = jumped
+
+
+def read_areas(me):
+	areas = np.empty(len(me.polygons), dtype=np.float32)
+	me.polygons.foreach_get("area", areas)
+	return areas
+
+
+def loop_weights(me, mode, loop_verts, face_sizes):
+	'''	(L,) weight of each loop's normal when merging them per vertex, see
+		corner_weights
+	'''
+	co = areas = None
+	if mode == 'AREA':
+		areas = read_areas(me)
+	elif mode == 'ANGLE':
+		co = read_vectors(me.vertices, "co")
+	return corner_weights(mode, loop_verts, face_sizes, co, areas)
+
+
+def corner_weights(mode, loop_verts, face_sizes, co=None, areas=None):
+	'''	(L,) weight of each loop's normal when merging them per vertex
+		- mode: 'FIRST' (None, first loop wins), 'AVERAGE', 'ANGLE' (corner
+		  angle, needs co) or 'AREA' (polygon area, needs areas)
+	'''
+	if mode == 'AVERAGE':
+		return np.ones(len(loop_verts), dtype=np.float64)
+	if mode == 'AREA':
+		return np.repeat(np.asarray(areas, dtype=np.float64), face_sizes)
+	if mode == 'ANGLE':
+		co = np.asarray(co, dtype=np.float64)
+		prev_loop, next_loop = loop_neighbours(face_sizes)
+		here = co[loop_verts]
+		a = co[loop_verts[prev_loop]] - here
+		b = co[loop_verts[next_loop]] - here
+		return np.arctan2(np.sqrt((np.cross(a, b) ** 2).sum(axis=1)), (a * b).sum(axis=1))
+	return None
+
+
+# saved normals: ob[saved_key] = {"version", "mode", "rows", "chunk_rows", "chunks", "offsets"}
+# - chunks: {"<index>": bytes} of chunk_rows normals each
+# - version 1 files have all normals in one "normals" bytes instead
+saved_key = "udk_fbx_normals"
+saved_version = 2
+chunk_rows = 4096
+
+
+def _legacy_mode(ob):
+	if 'polyn_meshdata' in ob:
+		return 'POLY'
+	if 'vertexn_meshdata' in ob:
+		return 'VERTEX'
+	return None
+
+
+def saved_mode(ob):
+	'''	'POLY', 'VERTEX' or None if ob has no saved normals '''
+	if saved_key in ob:
+		return ob[saved_key]["mode"]
+	return _legacy_mode(ob)
+
+
+def has_saved(ob, split):
+	return saved_mode(ob) == ('POLY' if split else 'VERTEX')
+
+
+def saved_count(ob, split):
+	'''	polygons (split) or vertices in the saved normals, 0 if none are saved for the mode '''
+	if not has_saved(ob, split):
+		return 0
+	if saved_key in ob:
+		saved = ob[saved_key]
+		if split:
+			return max(0, len(saved["offsets"]) // 4 - 1)
+		if "rows" in saved:
+			return saved["rows"]
+		return len(saved["normals"]) // 12
+	return len(ob.polyn_meshdata) if split else len(ob.vertexn_meshdata)
+
+
+def _read_legacy(ob, split, store):
+	if split:
+		polys = ob.polyn_meshdata
+		face_sizes = np.array([len(p.vdata) for p in polys], dtype=np.int32)
+		store.set_loops(np.empty((int(face_sizes.sum()), 3), dtype=np.float32), face_sizes)
+		for i, p in enumerate(polys):
+			if face_sizes[i]:
+				rows = store[i]
+				p.vdata.foreach_get("vnormal", rows.reshape(-1))
+	else:
+		store.set_vertices(read_vectors(ob.vertexn_meshdata, "vnormal"))
+
+
+def _read_packed(saved):
+	if saved["version"] > saved_version:
+		raise ValueError("normals saved by a newer version (%i)" % saved["version"])
+	if saved["version"] < 2:
+		return np.frombuffer(saved["normals"], dtype=np.float32)
+	chunks = saved["chunks"]
+	data = b"".join(chunks["%i" % c] for c in range(len(chunks)))
+	return np.frombuffer(data, dtype=np.float32)
+
+
+def read_object(ob, split, store=None):
+	'''	fills store (or a new one) from the normals saved on ob
+		- split: read per loop (poly mode) instead of per vertex normals
+		- returns None if ob has no normals saved for the mode
+	'''
+	if not has_saved(ob, split):
+		return None
+	if store is None:
+		store = normals_store()
+	if saved_key in ob:
+		saved = ob[saved_key]
+		normals = _read_packed(saved)
+		if split:
+			offsets = np.frombuffer(saved["offsets"], dtype=np.int32)
+			store.set_loops(normals, np.diff(offsets))
+		else:
+			store.set_vertices(normals)
+		# in sync with the object until edited
+		store.dirty = []
+		store.set_owner(ob.name if saved["version"] == saved_version else None)
+	else:
+		_read_legacy(ob, split, store)
+	return store
+
+
+def clear_object(ob):
+	'''	removes the saved normals, old and packed '''
+	for key in (saved_key, 'polyn_meshdata', 'vertexn_meshdata'):
+		if key in ob:
+			del ob[key]
+
+
+def _chunk_bytes(store, c):
+	return bytes(store.normals[c * chunk_rows:(c + 1) * chunk_rows].ravel().data)
+
+
+def write_object(ob, store):
+	'''	saves store on ob, replaces whatever was saved before '''
+	split = store.offsets is not None
+	rows = len(store.normals)
+	store.normals = np.ascontiguousarray(store.normals, dtype=np.float32)
+	saved = {
+		"version": saved_version,
+		"mode": 'POLY' if split else 'VERTEX',
+		"rows": rows,
+		"chunk_rows": chunk_rows,
+		"chunks": dict(("%i" % c, _chunk_bytes(store, c)) for c in range((rows + chunk_rows - 1) // chunk_rows)),
+	}
+	if split:
+		saved["offsets"] = bytes(np.ascontiguousarray(store.offsets, dtype=np.int32).data)
+	clear_object(ob)
+	ob[saved_key] = saved
+	store.dirty = []
+	store.set_owner(ob.name)
+
+
+def commit_object(ob, store):
+	'''	saves the rows of store that changed since it was read from / saved to ob
+		- falls back to write_object when ob holds other data or the layout changed
+		- returns the number of rows written
+	'''
+	saved = ob.get(saved_key)
+	if (store.owner != ob.name or saved is None or saved["rows"] != len(store.normals) or
+			saved["mode"] != ('POLY' if store.offsets is not None else 'VERTEX')):
+		write_object(ob, store)
+		return len(store.normals)
+	ranges = store.take_dirty()
+	chunks = saved["chunks"]
+	written = set()
+	for start, end in ranges:
+		for c in range(start // chunk_rows, (end - 1) // chunk_rows + 1):
+			if c not in written:
+				chunks["%i" % c] = _chunk_bytes(store, c)
+				written.add(c)
+	return min(len(store.normals), len(written) * chunk_rows)
+
+
+def migrate_object(ob):
+	'''	repacks normals saved in the old property groups or an older packed
+		version, returns True if ob had any
+	'''
+	if saved_key in ob:
+		if ob[saved_key]["version"] == saved_version:
+			return False
+		mode = ob[saved_key]["mode"]
+	else:
+		mode = _legacy_mode(ob)
+		if mode is None:
+			return False
+	write_object(ob, read_object(ob, mode == 'POLY'))
+	return True
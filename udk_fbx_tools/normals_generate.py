@@ -0,0 +1,160 @@
+############################################################
+# Auto generation of custom normals from mesh arrays
+#
+# - generate_rows computes the UPVECT, BENT, G_FOLIAGE, CUSTOM, AREA and
+#   ANGLE modes from a job: a dict of numpy arrays read from the mesh
+#   (editorfunctions.generation_job) and the generator's settings
+# - jobs don't reference Blender data, so the numeric work can run on a
+#   generate_pool worker while the main thread reads the next meshes
+#
+
+import time
+
+import numpy as np
+
+from . import normals_data
+
+
+def generate_rows(job):
+	'''	writes the generated normals into job["rows"] and returns it
+		- rows: (N, 3) current normals, per loop if job["split"] else per vertex
+		- only the rows picked by the mode's selection / hidden mask change
+	'''
+	genmode = job["mode"]
+	rows = job["rows"]
+	co = job["co"]
+	vert_select = job["vert_select"]
+	loop_verts = job["loop_verts"]
+	face_sizes = job["face_sizes"]
+	selection_only = job["selection_only"]
+
+	loop_faces = np.repeat(np.arange(len(face_sizes), dtype=np.int32), face_sizes)
+	if job["split"]:
+		row_verts = loop_verts
+		row_faces = loop_faces
+	else:
+		row_verts = np.arange(len(co), dtype=np.int32)
+		row_faces = None
+	mask = np.ones(len(rows), dtype=bool)
+
+	# UPVECT: custom direction
+	if (genmode == 'UPVECT'):
+		if selection_only:
+			mask = vert_select[row_verts]
+		rows[mask] = job["dirvector"]
+
+	# BENT: Bent from point (3D cursor)
+	elif (genmode == 'BENT'):
+		bent = normals_data.normalized_rows(co[row_verts] - job["cursor"])
+		if row_faces is not None:
+			if selection_only:
+				mask = (job["face_select"] & ~job["face_hide"])[row_faces]
+		else:
+			if selection_only:
+				mask = vert_select
+			ratio = job["bend_ratio"]
+			bent = rows * (1.0 - ratio) + bent * ratio
+		rows[mask] = bent[mask]
+
+	# G_FOLIAGE: combination of bent and up-vector for ground foliage
+	# - selected vertices point up, the rest away from the center offset
+	elif (genmode == 'G_FOLIAGE'):
+		if job["ignore_hidden"]:
+			if row_faces is not None:
+				mask = ~job["face_hide"][row_faces]
+			else:
+				mask = ~job["vert_hide"]
+		foliage = normals_data.normalized_rows(co[row_verts] - job["center"])
+		foliage[vert_select[row_verts]] = (0.0, 0.0, 1.0)
+		rows[mask] = foliage[mask]
+
+	# CUSTOM: generate for selected faces independently from mesh (or for the whole mesh)
+	# - average of the normals of the (selected) faces around each vertex
+	elif (genmode == 'CUSTOM'):
+		face_normals = job["face_normals"]
+		if selection_only:
+			face_weights = job["face_select"].astype(np.float64)[loop_faces]
+		else:
+			face_weights = np.ones(len(loop_verts), dtype=np.float64)
+
+		counts = np.bincount(loop_verts, weights=face_weights, minlength=len(co))
+		summed = np.empty((len(co), 3), dtype=np.float64)
+		for c in range(3):
+			summed[:, c] = np.bincount(loop_verts, weights=face_normals[loop_faces, c] * face_weights, minlength=len(co))
+		custom = normals_data.normalized_rows(summed)[row_verts]
+
+		mask = counts[row_verts] > 0
+		if selection_only:
+			mask &= vert_select[row_verts]
+			if row_faces is not None:
+				mask &= job["face_select"][row_faces]
+		rows[mask] = custom[mask]
+
+	# AREA / ANGLE: face normals weighted by face area or corner angle
+	# - summed per vertex, or per smooth fan in poly mode when splitting at sharp edges
+	elif genmode in ('AREA', 'ANGLE'):
+		face_normals = job["face_normals"]
+		weights = normals_data.corner_weights(genmode, loop_verts, face_sizes, co, job.get("face_areas"))
+		if row_faces is not None and job["split_sharp"]:
+			groups = normals_data.smooth_fans(loop_verts, face_sizes, job["loop_edges"], job["edge_sharp"], len(co))
+			row_groups = groups
+		else:
+			groups = loop_verts
+			row_groups = row_verts
+
+		group_count = max(len(co), len(loop_verts))
+		summed = np.empty((group_count, 3), dtype=np.float64)
+		for c in range(3):
+			summed[:, c] = np.bincount(groups, weights=face_normals[loop_faces, c] * weights, minlength=group_count)
+		weighted = normals_data.normalized_rows(summed)[row_groups]
+
+		mask = (summed[row_groups] ** 2).sum(axis=1) > 0.0
+		if selection_only:
+			mask &= vert_select[row_verts]
+		rows[mask] = weighted[mask]
+
+	return rows
+
+
+def generate_rows_timed(job):
+	t = time.perf_counter()
+	rows = generate_rows(job)
+	return rows, time.perf_counter() - t
+
+
+class generate_pool(object):
+	'''	runs generate_rows on batches of jobs
+		- workers > 1 uses a thread pool (the work is numpy, which releases
+		  the GIL, and never touches Blender data), results keep the input order
+		- falls back to the calling thread if the pool can't be started
+	'''
+	__slots__ = ("workers", "times", "_executor")
+
+	def __init__(self, workers):
+		self.workers = workers
+		self.times = []  # generation time of each job in the last batch
+		self._executor = None
+		if workers > 1:
+			try:
+				from concurrent.futures import ThreadPoolExecutor
+				self._executor = ThreadPoolExecutor(max_workers=workers)
+			except Exception as e:
+				print("normals workers unavailable, generating serially (%s)" % e)
+
+	def generate(self, jobs):
+		results = None
+		if self._executor is not None and len(jobs) > 1:
+			try:
+				results = list(self._executor.map(generate_rows_timed, jobs))
+			except Exception as e:
+				print("normals workers failed, generating serially (%s)" % e)
+				self.close()
+		if results is None:
+			results = [generate_rows_timed(job) for job in jobs]
+		self.times = [seconds for rows, seconds in results]
+		return [rows for rows, seconds in results]
+
+	def close(self):
+		if self._executor is not None:
+			self._executor.shutdown()
+			self._executor = None